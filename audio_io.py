@@ -0,0 +1,25 @@
+"""
+Audio IO
+Decoding audio files into in-memory NumPy arrays.
+"""
+
+import subprocess
+import numpy as np
+from moviepy.config import get_setting
+
+# Sample rate used for all synthesized narration and mixed audio
+AUDIO_FPS = 44100
+
+def decode_audio_file(path, fps=AUDIO_FPS):
+    """
+    Decode an audio file into a float32 stereo array.
+    
+    Uses one short-lived ffmpeg process that exits as soon as the file is read,
+    instead of keeping an AudioFileClip reader alive for the whole render.
+    """
+    cmd = [
+        get_setting("FFMPEG_BINARY"), '-loglevel', 'error', '-i', str(path),
+        '-f', 'f32le', '-ac', '2', '-ar', str(fps), '-'
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, 2)
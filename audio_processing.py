@@ -0,0 +1,214 @@
+"""
+Audio Processing
+Silence trimming and loudness normalization of synthesized speech segments.
+
+TTS engines return segments with leading and trailing silence and with levels that
+differ from segment to segment (and engine to engine). Both are fixed on the decoded
+arrays before the segments are placed on the timeline, so slides follow each other
+without dead air and the narration needs no separate loudnorm encode pass.
+
+Loudness is integrated, gated loudness as in ITU-R BS.1770, measured for all
+segments in one batch: every segment is cut into 100 ms sub-blocks, the sub-blocks of
+all segments are K-weighted together in the frequency domain, and the gated 400 ms
+blocks are reduced per segment with bincount.
+"""
+
+import numpy as np
+from audio_io import AUDIO_FPS
+
+# Target integrated loudness of every segment (LUFS)
+TARGET_LUFS = -16.0
+
+# Quiet segments are not boosted by more than this (it would only raise noise)
+MAX_GAIN_DB = 20.0
+
+# Sample peak ceiling after the gain is applied (dBFS)
+PEAK_CEILING_DB = -1.0
+
+# 10 ms windows this far below a segment's loudest window, or below the floor, are silence
+SILENCE_RANGE_DB = 40.0
+SILENCE_FLOOR_DB = -60.0
+SILENCE_WINDOW = 0.01
+
+# Silence kept before and after the speech of a trimmed segment (seconds)
+LEAD_IN = 0.05
+TAIL = 0.1
+
+# BS.1770 measurement: 400 ms gating blocks with 75% overlap are built from 100 ms sub-blocks
+SUB_BLOCK_SECONDS = 0.1
+SUB_BLOCKS_PER_BLOCK = 4
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+# Sub-blocks transformed per FFT call, bounding the memory of the batch
+FFT_BATCH = 2048
+
+def trim_silence(audio, fps=AUDIO_FPS, lead_in=LEAD_IN, tail=TAIL):
+    """
+    View of a (samples, channels) array without its leading and trailing silence,
+    keeping lead_in / tail seconds around the speech. Silent input is returned as is.
+    """
+    window = max(1, int(SILENCE_WINDOW * fps))
+    n_windows = len(audio) // window
+    if n_windows == 0:
+        return audio
+    power = np.square(audio[:n_windows * window]).reshape(n_windows, -1).mean(axis=1)
+    with np.errstate(divide='ignore'):
+        level = 10 * np.log10(power)
+    threshold = max(level.max() - SILENCE_RANGE_DB, SILENCE_FLOOR_DB)
+    voiced = np.flatnonzero(level > threshold)
+    if len(voiced) == 0:
+        return audio
+    start = max(0, voiced[0] * window - int(lead_in * fps))
+    end = min(len(audio), (voiced[-1] + 1) * window + int(tail * fps))
+    return audio[start:end]
+
+def _biquad_response(b, a, z):
+    return (b[0] + b[1] * z + b[2] * z * z) / (1.0 + a[1] * z + a[2] * z * z)
+
+def k_weighting_power(n_samples, fps=AUDIO_FPS):
+    """
+    Squared magnitude of the BS.1770 K-weighting filter (high shelf + RLB high-pass)
+    at the rfft bins of an n_samples block, for any sample rate
+    """
+    z = np.exp(-2j * np.pi * np.arange(n_samples // 2 + 1) / n_samples)
+
+    # Stage 1: high shelf modelling the acoustic effect of the head
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = np.tan(np.pi * f0 / fps)
+    vh = 10.0 ** (gain_db / 20.0)
+    vb = vh ** 0.4996667741545416
+    a0 = 1.0 + k / q + k * k
+    shelf_b = ((vh + vb * k / q + k * k) / a0, 2.0 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0)
+    shelf_a = (1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0)
+
+    # Stage 2: RLB high-pass
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * f0 / fps)
+    a0 = 1.0 + k / q + k * k
+    highpass_b = (1.0, -2.0, 1.0)
+    highpass_a = (1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0)
+
+    response = _biquad_response(shelf_b, shelf_a, z) * _biquad_response(highpass_b, highpass_a, z)
+    return np.abs(response) ** 2
+
+def _sub_blocks(audio, block):
+    """
+    (n, channels, block) sub-blocks of a segment (the last one zero-padded) and the
+    fraction of each sub-block filled with audio
+    """
+    n_full = len(audio) // block
+    blocks = audio[:n_full * block].reshape(n_full, block, audio.shape[1]).transpose(0, 2, 1)
+    fill = np.ones(n_full)
+    rest = len(audio) - n_full * block
+    if rest or n_full == 0:
+        last = np.zeros((1, audio.shape[1], block), dtype=np.float32)
+        last[0, :, :rest] = audio[n_full * block:].T
+        blocks = np.concatenate([blocks, last])
+        fill = np.append(fill, max(rest, 1) / block)
+    return blocks, fill
+
+def measure_loudness(arrays, fps=AUDIO_FPS):
+    """
+    Integrated loudness (LUFS) of every (samples, channels) array, measured in one
+    batch; -inf for silent arrays
+    """
+    n_segments = len(arrays)
+    if n_segments == 0:
+        return np.zeros(0)
+    block = int(round(SUB_BLOCK_SECONDS * fps))
+
+    # Parseval: mean square of a block from its rfft bins (interior bins count twice),
+    # with the K-weighting applied as a power response
+    bin_weights = np.full(block // 2 + 1, 2.0)
+    bin_weights[0] = 1.0
+    if block % 2 == 0:
+        bin_weights[-1] = 1.0
+    weights = k_weighting_power(block, fps) * bin_weights / block ** 2
+
+    # Mean square of every K-weighted sub-block of every segment, summed over channels
+    counts = np.empty(n_segments, dtype=np.int64)
+    fills = []
+    powers = []
+    pending, pending_rows = [], 0
+
+    def flush():
+        # Contiguous (rows, channels, samples), so the FFT runs along memory
+        stacked = np.concatenate(pending)
+        spectrum = np.fft.rfft(stacked, axis=-1)
+        powers.append(np.einsum('rcb,b->r', spectrum.real ** 2 + spectrum.imag ** 2, weights))
+        pending.clear()
+
+    for i, audio in enumerate(arrays):
+        blocks, fill = _sub_blocks(audio, block)
+        counts[i] = len(blocks)
+        fills.append(fill)
+        # Segments with a different channel count start a new batch
+        if pending and blocks.shape[1] != pending[0].shape[1]:
+            flush()
+            pending_rows = 0
+        for start in range(0, len(blocks), FFT_BATCH):
+            part = blocks[start:start + FFT_BATCH]
+            pending.append(part)
+            pending_rows += len(part)
+            if pending_rows >= FFT_BATCH:
+                flush()
+                pending_rows = 0
+    if pending:
+        flush()
+    # A zero-padded sub-block holds less audio than its length
+    sub_power = np.concatenate(powers) / np.concatenate(fills)
+
+    # 400 ms gating blocks: the mean of up to 4 consecutive sub-blocks of one segment
+    # (a segment shorter than one block is measured as a single shorter block)
+    ids = np.repeat(np.arange(n_segments), counts)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    span = np.minimum(SUB_BLOCKS_PER_BLOCK, counts)[ids]
+    index = np.arange(len(sub_power))
+    valid = (index + span <= ends[ids]) & ((counts[ids] >= SUB_BLOCKS_PER_BLOCK) | (index == starts[ids]))
+    cumulative = np.concatenate([[0.0], np.cumsum(sub_power)])
+    block_ids = ids[valid]
+    block_power = (cumulative[index[valid] + span[valid]] - cumulative[index[valid]]) / span[valid]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        block_loudness = -0.691 + 10 * np.log10(block_power)
+
+        def gated_mean(mask):
+            total = np.bincount(block_ids, weights=block_power * mask, minlength=n_segments)
+            count = np.bincount(block_ids, weights=mask.astype(np.float64), minlength=n_segments)
+            return total / count
+
+        absolute = block_loudness > ABSOLUTE_GATE_LUFS
+        relative_gate = -0.691 + 10 * np.log10(gated_mean(absolute)) + RELATIVE_GATE_LU
+        gated = absolute & (block_loudness > relative_gate[block_ids])
+        loudness = -0.691 + 10 * np.log10(gated_mean(gated))
+    return np.where(np.isfinite(loudness), loudness, -np.inf)
+
+def normalize_segments(arrays, fps=AUDIO_FPS, target_lufs=TARGET_LUFS, trim=True):
+    """
+    Silence-trimmed, loudness-normalized copies of TTS segment arrays
+
+    Inputs are never modified (they may be read-only, memory-mapped or shared by
+    repeated segments); None entries (failed synthesis) are passed through.
+
+    Args:
+    arrays: float32 (samples, channels) arrays or None
+    fps: Sample rate
+    target_lufs: Integrated loudness every segment is brought to
+    trim: Trim leading and trailing silence first
+    """
+    present = [i for i, audio in enumerate(arrays) if audio is not None]
+    segments = [trim_silence(arrays[i], fps) if trim else arrays[i] for i in present]
+
+    loudness = measure_loudness(segments, fps)
+    gain_db = np.where(np.isfinite(loudness), np.minimum(target_lufs - loudness, MAX_GAIN_DB), 0.0)
+    peaks = np.array([np.abs(audio).max() if len(audio) else 0.0 for audio in segments])
+    ceiling = 10.0 ** (PEAK_CEILING_DB / 20.0)
+    with np.errstate(divide='ignore'):
+        gains = np.minimum(10.0 ** (gain_db / 20.0), np.where(peaks > 0, ceiling / peaks, np.inf))
+
+    processed = list(arrays)
+    for i, audio, gain in zip(present, segments, gains):
+        processed[i] = audio * np.float32(gain)
+    return processed
@@ -0,0 +1,225 @@
+"""
+BGM Beds
+Seamless, precomputed background-music loop beds.
+
+A track is decoded once and turned into a loop unit: the loop end is snapped to a
+zero crossing and the last `crossfade` seconds are blended (equal power) into the
+track's opening, so repeating the unit has no click at the seam. Loop units are
+cached in memory and on disk per track, and a bed of any length is read from its
+loop unit sample by sample as the encoder asks for audio, so getting BGM for a
+render costs neither a decode nor a full-length buffer.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from audio_io import AUDIO_FPS, decode_audio_file
+
+# Location of the persistent loop-unit cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "videoscript", "bgm_beds")
+
+# Loop units kept on disk; the least recently used are removed first
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+# Loop units not used for this long are removed from disk (seconds)
+MAX_UNIT_AGE = 90 * 24 * 3600
+
+def find_zero_crossing(mono, target, search):
+    """
+    Index of the rising zero crossing closest to target within +/- search samples
+    """
+    lo = max(1, target - search)
+    hi = min(len(mono), target + search)
+    if hi <= lo:
+        return target
+    window = mono[lo - 1:hi]
+    crossings = np.nonzero((window[:-1] <= 0) & (window[1:] > 0))[0] + lo
+    if len(crossings) == 0:
+        return target
+    return int(crossings[np.argmin(np.abs(crossings - target))])
+
+def build_loop_unit(track, fps=AUDIO_FPS, crossfade=0.5):
+    """
+    Build a seamlessly repeatable loop unit from a decoded track
+
+    Returns:
+    (intro, unit): the bed is intro followed by unit repeated; intro is the
+    track's opening that the crossfaded unit loops back into. A track too short
+    to crossfade is repeated as it is.
+
+    Raises:
+    ValueError: If the track has no samples (e.g. it could not be decoded)
+    """
+    if len(track) == 0:
+        raise ValueError("BGM track has no audio samples")
+    mono = track.mean(axis=1)
+    n_fade = int(crossfade * fps)
+    n_fade = max(1, min(n_fade, len(track) // 4))
+    search = max(1, fps // 50)
+
+    # Loop end and the point the loop re-enters, both on rising zero crossings
+    end = find_zero_crossing(mono, len(track) - search - 1, search)
+    entry = find_zero_crossing(mono, n_fade, search)
+    n_fade = min(entry, end - entry)
+    if n_fade <= 0:
+        return track[:0], track.copy()
+
+    t = np.linspace(0.0, 1.0, n_fade, dtype=np.float32)[:, None]
+    fade_out = np.cos(t * np.pi / 2)
+    fade_in = np.sin(t * np.pi / 2)
+
+    unit = track[entry:end].copy()
+    unit[-n_fade:] = track[end - n_fade:end] * fade_out + track[entry - n_fade:entry] * fade_in
+    return track[:entry].copy(), unit
+
+def bed_samples(intro, unit, indices):
+    """
+    Samples at the given indices of the endless bed intro + unit repeated
+    """
+    if len(unit) == 0:
+        raise ValueError("BGM loop unit is empty")
+    indices = np.asarray(indices)
+    looped = np.maximum(indices - len(intro), 0) % len(unit)
+    samples = unit[looped]
+    in_intro = indices < len(intro)
+    if in_intro.any():
+        samples[in_intro] = intro[indices[in_intro]]
+    return samples
+
+def render_bed(intro, unit, n_samples):
+    """
+    Lay out intro + repeated unit into a buffer of exactly n_samples
+    """
+    return bed_samples(intro, unit, np.arange(n_samples))
+
+class BGMBedCache:
+    """
+    Loop units per track, in memory and on disk
+
+    Args:
+    cache_dir: Directory for persisted loop units (defaults to $VIDEOSCRIPT_BGM_CACHE)
+    crossfade: Crossfade length at the loop seam, in seconds
+    fps: Sample rate of the beds
+    max_units: Number of loop units kept in memory
+    max_bytes: Size of the loop units kept on disk
+    """
+
+    def __init__(self, cache_dir=None, crossfade=0.5, fps=AUDIO_FPS, max_units=4,
+                 max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir or os.environ.get("VIDEOSCRIPT_BGM_CACHE", DEFAULT_CACHE_DIR)
+        self.crossfade = crossfade
+        self.fps = fps
+        self.max_units = max_units
+        self.max_bytes = max_bytes
+        self._units = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _track_key(self, track_path):
+        stat = os.stat(track_path)
+        identity = f"{os.path.abspath(track_path)}|{stat.st_size}|{stat.st_mtime_ns}|{self.fps}|{self.crossfade}"
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def loop_unit(self, track_path):
+        """
+        (intro, unit) for a track, decoding it only on the first request
+        """
+        key = self._track_key(track_path)
+        with self._lock:
+            cached = self._units.get(key)
+            if cached is not None:
+                self._units.move_to_end(key)
+        if cached is not None:
+            return cached
+
+        unit_path = os.path.join(self.cache_dir, f"{key}.npz")
+        try:
+            with np.load(unit_path) as data:
+                cached = (data["intro"], data["unit"])
+            # Used units stay on disk the longest
+            os.utime(unit_path)
+        except (OSError, KeyError, ValueError):
+            track = decode_audio_file(track_path, self.fps)
+            cached = build_loop_unit(track, self.fps, self.crossfade)
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                temp_path = f"{unit_path}.{os.getpid()}.tmp.npz"
+                np.savez(temp_path, intro=cached[0], unit=cached[1])
+                os.replace(temp_path, unit_path)
+                self._evict_disk()
+            except OSError as e:
+                print(f"Could not write BGM cache: {e}")
+
+        with self._lock:
+            self._units[key] = cached
+            while len(self._units) > self.max_units:
+                self._units.popitem(last=False)
+        return cached
+
+    def _evict_disk(self):
+        """
+        Remove loop units unused for MAX_UNIT_AGE, then the least recently used
+        ones until the rest fit in max_bytes
+        """
+        now = time.time()
+        units = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz") or ".tmp" in name:
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            units.append((stat.st_mtime, stat.st_size, path))
+        units.sort(reverse=True)
+        total = 0
+        for mtime, size, path in units:
+            total += size
+            if now - mtime > MAX_UNIT_AGE or total > self.max_bytes:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def bed(self, track_path, duration):
+        """
+        BGM bed of exactly `duration` seconds as a float32 (samples, 2) array
+        """
+        intro, unit = self.loop_unit(track_path)
+        return render_bed(intro, unit, int(round(duration * self.fps)))
+
+    def bed_clip(self, track_path, duration):
+        """
+        BGM bed as a moviepy AudioClip that reads its samples from the loop unit
+        on demand (same sample mapping as an AudioArrayClip of the full bed)
+        """
+        from moviepy.audio.AudioClip import AudioClip
+        intro, unit = self.loop_unit(track_path)
+        n_samples = int(round(duration * self.fps))
+        fps = self.fps
+
+        def make_frame(t):
+            indices = (fps * np.asarray(t)).astype(int)
+            if indices.ndim == 0:
+                if 0 <= indices < n_samples:
+                    return bed_samples(intro, unit, indices[None])[0]
+                return np.zeros(unit.shape[1])
+            in_bed = (indices >= 0) & (indices < n_samples)
+            frame = np.zeros((len(indices), unit.shape[1]))
+            frame[in_bed] = bed_samples(intro, unit, indices[in_bed])
+            return frame
+
+        # Setting the duration also sets `end`, which CompositeAudioClip needs
+        return AudioClip(make_frame, duration=n_samples / fps, fps=fps)
+
+# Process-wide bed cache
+default_bgm_beds = BGMBedCache()
+
+def bgm_bed_clip(track_path, duration):
+    """
+    Seamlessly looped (or trimmed) BGM clip of the given duration
+    """
+    return default_bgm_beds.bed_clip(str(track_path), duration)
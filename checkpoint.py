@@ -0,0 +1,306 @@
+"""
+Checkpoint
+Resumable long renders: the finished work of a failed render is kept and reused.
+
+A checkpointed render keeps a persistent job workspace in a directory of its
+choice. Synthesized TTS audio, alignment results, the encoded audio track and
+the video, encoded in independent fixed-length chunks, are stored there as
+soon as each is finished, and a manifest records the job's parameters and
+completed chunks. Chunks and the audio track are keyed on a digest of the
+timeline (every segment's text, frame count and audio, and the input files'
+content), so a changed timeline is never joined with stale work. If the render
+dies (OOM, killed worker, disk full), resuming runs the job again from its
+manifest and only redoes the missing work; the chunks are joined and the audio
+is muxed with stream copies at the end.
+
+    python videoscript.py text script.txt bg.jpg -o lesson.mp4 --checkpoint lesson.ckpt
+    python videoscript.py resume lesson.ckpt
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import subprocess
+import numpy as np
+from moviepy.config import get_setting
+from profiling import profiler
+from workspace import JobWorkspace
+
+# Length of one independently encoded video chunk
+CHUNK_SECONDS = 60
+
+MANIFEST_NAME = "checkpoint.json"
+
+# Subdirectories holding the stored work of a job
+ARTIFACT_DIRS = ("tts", "results", "files", "chunks")
+
+def _write_json(path, data):
+    """
+    Write JSON through a temporary file, so a crash never leaves a partial file
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1, default=float)
+    os.replace(temp_path, path)
+
+def _key(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def file_digest(path, block_size=1 << 20):
+    """
+    SHA-1 of a file's content
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def timeline_digest(segments, files=None, **extra):
+    """
+    Digest of what a render puts on screen and on the audio track
+
+    Args:
+    segments: (text, frame count, audio array or None) of every segment
+    files: {name: path} of input files, hashed by content
+    **extra: Further JSON-serializable settings that change the output
+    """
+    digest = hashlib.sha1()
+    for text, n_frames, audio_array in segments:
+        audio_hash = None
+        if audio_array is not None:
+            audio_hash = hashlib.sha1(np.ascontiguousarray(audio_array)).hexdigest()
+        digest.update(json.dumps([text, n_frames, audio_hash]).encode('utf-8'))
+    for name, path in sorted((files or {}).items()):
+        digest.update(json.dumps([name, file_digest(path) if path else None]).encode('utf-8'))
+    digest.update(json.dumps(extra, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+def read_manifest(directory):
+    """
+    Manifest of the checkpoint in a directory, or None if there is none
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+class RenderCheckpoint:
+    """
+    Persistent job workspace holding the finished parts of one render
+
+    Args:
+    directory: Checkpoint directory (created if needed)
+    kind: Job type ('text_video' or 'advanced_video')
+    params: JSON-serializable arguments of the job, used to resume it. Work stored
+            by a job with different parameters is discarded.
+    """
+
+    def __init__(self, directory, kind, params):
+        self.workspace = JobWorkspace(path=directory)
+        self.path = self.workspace.path
+        fingerprint = _key(json.dumps([kind, params], sort_keys=True))
+
+        manifest = read_manifest(self.path)
+        if manifest is not None and manifest.get("fingerprint") != fingerprint:
+            print(f"⚠️  Checkpoint in {self.path} belongs to a different job, starting over")
+            self._remove_artifacts()
+            manifest = None
+        if manifest is None:
+            manifest = {"kind": kind, "params": params, "fingerprint": fingerprint, "chunks": {}}
+        elif manifest["chunks"]:
+            print(f"🔁 Resuming from {self.path} ({len(manifest['chunks'])} chunks already encoded)")
+        manifest["complete"] = False
+        self.manifest = manifest
+        self.save()
+
+    def save(self):
+        _write_json(self.workspace.file(MANIFEST_NAME), self.manifest)
+
+    def use_timeline(self, digest):
+        """
+        Key the encoded chunks and stored files on a timeline_digest; those of
+        an earlier attempt with a different timeline are discarded
+        """
+        if self.manifest.get("timeline") == digest:
+            return
+        if self.manifest["chunks"] or self.manifest.get("files"):
+            print(f"⚠️  Timeline changed since the checkpoint in {self.path}, re-encoding")
+        for subdir in ("files", "chunks"):
+            shutil.rmtree(self.workspace.file(subdir), ignore_errors=True)
+        self.manifest.update(timeline=digest, chunks={}, files={})
+        self.save()
+
+    def _artifact(self, subdir, name):
+        return os.path.join(self.workspace.subdir(subdir), name)
+
+    def load_audio(self, text):
+        """
+        Stored TTS audio of a text (read-only, memory-mapped), or None
+        """
+        path = self._artifact("tts", f"{_key(text)}.npy")
+        if not os.path.exists(path):
+            return None
+        profiler.count("tts_reused")
+        return np.load(path, mmap_mode='r')
+
+    def save_audio(self, text, audio_array):
+        path = self._artifact("tts", f"{_key(text)}.npy")
+        temp_path = f"{path}.tmp.npy"
+        np.save(temp_path, audio_array)
+        os.replace(temp_path, path)
+
+    def load_result(self, name):
+        """
+        Stored JSON result (e.g. an alignment), or None
+        """
+        try:
+            with open(self._artifact("results", f"{name}.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_result(self, name, data):
+        _write_json(self._artifact("results", f"{name}.json"), data)
+
+    def stored_file(self, name):
+        """
+        Path of a file stored with store_file, or None
+
+        Files are only reused once use_timeline has confirmed they belong to
+        the same timeline.
+        """
+        if self.manifest.get("timeline") is None:
+            return None
+        path = self.manifest.get("files", {}).get(name)
+        if path and os.path.exists(path):
+            return path
+        return None
+
+    def store_file(self, name, path):
+        """
+        Move a finished file (e.g. an encoded audio track) into the checkpoint
+        """
+        stored_path = self._artifact("files", name + os.path.splitext(path)[1])
+        shutil.move(path, stored_path)
+        self.manifest.setdefault("files", {})[name] = stored_path
+        self.save()
+        return stored_path
+
+    def write_video(self, clip, output_path, fps, audio_path=None, label="video",
+                    chunk_seconds=CHUNK_SECONDS, codec='libx264', **kwargs):
+        """
+        Encode a clip in chunks, skipping chunks finished by an earlier attempt,
+        then join the chunks and mux the audio track without re-encoding
+
+        Args:
+        clip: moviepy VideoClip to export (its audio is ignored)
+        output_path: Output video file path
+        fps: Frame rate
+        audio_path: Encoded audio track to mux in (optional)
+        label: Chunk name prefix, distinct for each output of a job
+        chunk_seconds: Length of one chunk
+        **kwargs: Passed through to moviepy's FFMPEG_VideoWriter
+        """
+        total_frames = int(np.ceil(clip.duration * fps - 1e-6))
+        chunk_frames = max(1, int(round(chunk_seconds * fps)))
+        chunk_dir = self.workspace.subdir("chunks")
+        chunk_paths = []
+        for index, start in enumerate(range(0, total_frames, chunk_frames)):
+            end = min(start + chunk_frames, total_frames)
+            name = f"{label}_{index:05d}"
+            path = os.path.join(chunk_dir, f"{name}.mp4")
+            chunk_paths.append(path)
+            # Chunks are keyed on the timeline (see use_timeline) and their frame range
+            if (self.manifest.get("timeline") is not None
+                    and self.manifest["chunks"].get(name) == [start, end] and os.path.exists(path)):
+                profiler.count("chunks_reused")
+                continue
+
+            print(f"Encoding {label} chunk {index + 1}/{-(-total_frames // chunk_frames)}")
+            temp_path = os.path.join(chunk_dir, f"{name}.tmp.mp4")
+            encode_frames(clip, temp_path, fps, start, end, codec, **kwargs)
+            os.replace(temp_path, path)
+            self.manifest["chunks"][name] = [start, end]
+            self.save()
+            profiler.count("chunks_encoded")
+
+        concat_chunks(chunk_paths, output_path, audio_path, self.workspace.file(f"{label}_chunks.txt"))
+        return output_path
+
+    def finish(self, outputs):
+        """
+        Mark the job complete and remove its stored work (the manifest is kept)
+        """
+        self._remove_artifacts()
+        self.manifest.update(complete=True, outputs=outputs, chunks={}, files={})
+        self.save()
+
+    def _remove_artifacts(self):
+        for subdir in ARTIFACT_DIRS:
+            shutil.rmtree(self.workspace.file(subdir), ignore_errors=True)
+        for name in os.listdir(self.path):
+            if name.endswith("_chunks.txt"):
+                os.unlink(self.workspace.file(name))
+
+def encode_frames(clip, path, fps, start_frame, end_frame, codec='libx264', **kwargs):
+    """
+    Encode frames [start_frame, end_frame) of a clip into a video file
+
+    Frames are addressed by index, so adjacent chunks never repeat or drop a frame.
+    """
+    from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+    with FFMPEG_VideoWriter(str(path), clip.size, fps, codec=codec, **kwargs) as writer:
+        for frame_index in range(start_frame, end_frame):
+            frame = clip.get_frame(frame_index / fps)
+            if frame.dtype != np.uint8:
+                frame = frame.astype(np.uint8)
+            writer.write_frame(frame)
+
+def concat_chunks(chunk_paths, output_path, audio_path=None, list_path=None):
+    """
+    Join video chunks (and an audio track) into one file with stream copies
+    """
+    list_path = list_path or f"{output_path}.chunks.txt"
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in chunk_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error',
+           '-f', 'concat', '-safe', '0', '-i', list_path]
+    if audio_path:
+        cmd += ['-i', str(audio_path), '-map', '0:v:0', '-map', '1:a:0']
+    cmd += ['-c', 'copy', str(output_path)]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise IOError(f"ffmpeg could not join chunks into {output_path}: "
+                      f"{result.stderr.decode(errors='replace').strip()}")
+    return output_path
+
+def resume_render(directory):
+    """
+    Resume the render checkpointed in a directory, redoing only missing work
+
+    Returns:
+    The result of the job's entry point (the output path(s))
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"No render checkpoint in {directory}")
+    if manifest.get("complete"):
+        print(f"✅ Render already complete: {manifest.get('outputs')}")
+        return manifest.get("outputs")
+
+    params = dict(manifest["params"])
+    kind = manifest["kind"]
+    if kind == 'text_video':
+        from subtitle_video_audio_maker import create_text_video_with_audio
+        return create_text_video_with_audio(**params, checkpoint_dir=directory)
+    if kind == 'advanced_video':
+        from generateWithScripts import AdvancedVideoGenerator
+        generator = AdvancedVideoGenerator(**params.pop("generator"))
+        return generator.create_advanced_video(**params, checkpoint_dir=directory)
+    raise ValueError(f"Unknown checkpoint job type: {kind}")
@@ -1,19 +1,175 @@
 from moviepy.editor import *
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
-import whisper
 import re
+import os
+from profiling import profiler
+from workspace import check_pcm_container, with_workspace, write_audiofile, write_videofile
+from audio_io import AUDIO_FPS
+from checkpoint import RenderCheckpoint, file_digest, timeline_digest
+from bgm_beds import bgm_bed_clip
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# whisper.load_audio 输出的采样率
+WHISPER_SAMPLE_RATE = 16000
+
+# 长音频模式默认的工作进程上限：每个进程各加载一份模型，按核心数开进程会耗尽内存/显存
+MAX_DEFAULT_WORKERS = 2
+
+# 每个工作进程常驻的whisper模型
+_worker_model = None
+
+def _init_whisper_worker(model_name, threads_per_worker):
+    """
+    工作进程初始化：每个进程只加载一次模型
+    """
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+    import whisper
+    _worker_model = whisper.load_model(model_name)
+
+def _transcribe_chunk(job):
+    """
+    在工作进程中转写一个音频块，并把时间戳修正为整段音频的时间
+    """
+    chunk, offset = job
+    result = _worker_model.transcribe(chunk)
+    segments = []
+    for seg in result["segments"]:
+        seg = dict(seg)
+        seg["start"] += offset
+        seg["end"] += offset
+        segments.append(seg)
+    return result.get("language"), result["text"], segments
+
+def find_silence_split_points(audio, sample_rate=WHISPER_SAMPLE_RATE, chunk_seconds=300,
+                              search_seconds=10, window_seconds=0.05):
+    """
+    在每个 chunk_seconds 附近寻找最安静的位置作为切分点
+    
+    Args:
+        audio: 单声道float32音频数组
+        sample_rate: 采样率
+        chunk_seconds: 目标块长度（秒）
+        search_seconds: 在目标位置前后搜索静音的范围（秒）
+        window_seconds: 计算能量的窗口长度（秒）
+    
+    Returns:
+        切分点（采样下标）列表，不包含0和音频末尾
+    """
+    window = max(1, int(window_seconds * sample_rate))
+    chunk = int(chunk_seconds * sample_rate)
+    search = int(search_seconds * sample_rate)
+    
+    split_points = []
+    last = 0
+    while len(audio) - last > chunk + search:
+        target = last + chunk
+        lo = max(last + window, target - search)
+        hi = min(len(audio), target + search)
+        
+        # 按窗口计算RMS能量，取最安静的窗口中心
+        n_windows = (hi - lo) // window
+        region = audio[lo:lo + n_windows * window].reshape(n_windows, window)
+        rms = np.sqrt(np.mean(region.astype(np.float32) ** 2, axis=1))
+        quietest = int(np.argmin(rms))
+        point = lo + quietest * window + window // 2
+        
+        split_points.append(point)
+        last = point
+    
+    return split_points
+
+def transcribe_long_audio(audio_path, model_name="base", chunk_seconds=300, workers=None):
+    """
+    长音频模式：在静音处切块，用进程池并行转写，再按偏移量拼接
+    
+    Args:
+        audio_path: 音频文件路径
+        model_name: whisper模型名称
+        chunk_seconds: 目标块长度（秒）
+        workers: 工作进程数量，默认 min(CPU核心数, MAX_DEFAULT_WORKERS)
+    
+    Returns:
+        与 whisper transcribe 相同结构的结果字典
+    """
+    import whisper
+    audio = whisper.load_audio(audio_path)
+    split_points = find_silence_split_points(audio, WHISPER_SAMPLE_RATE, chunk_seconds)
+    
+    bounds = [0] + split_points + [len(audio)]
+    jobs = [(audio[start:end], start / WHISPER_SAMPLE_RATE)
+            for start, end in zip(bounds[:-1], bounds[1:])]
+    
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, min(workers or min(cpu_count, MAX_DEFAULT_WORKERS), len(jobs)))
+    threads_per_worker = max(1, cpu_count // workers)
+    print(f"长音频模式: {len(jobs)} 个音频块, {workers} 个工作进程")
+    
+    # 用spawn启动工作进程：父进程初始化过CUDA后再fork，子进程里的CUDA不可用
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_whisper_worker,
+                             initargs=(model_name, threads_per_worker)) as pool:
+        results = list(pool.map(_transcribe_chunk, jobs))
+    
+    segments = []
+    for _, _, chunk_segments in results:
+        segments.extend(chunk_segments)
+    for i, seg in enumerate(segments):
+        seg["id"] = i
+    
+    return {
+        "text": "".join(text for _, text, _ in results),
+        "segments": segments,
+        "language": results[0][0] if results else None
+    }
 
 class AdvancedVideoGenerator:
-    def __init__(self):
-        # 加载whisper模型用于字幕对齐
-        self.whisper_model = whisper.load_model("base")
+    def __init__(self, model_name="base", long_audio=False, chunk_seconds=300, workers=None):
+        """
+        Args:
+            model_name: whisper模型名称
+            long_audio: 启用长音频模式（静音切块+进程池并行转写）
+            chunk_seconds: 长音频模式下的目标块长度（秒）
+            workers: 长音频模式下的工作进程数量
+        """
+        self.model_name = model_name
+        self.long_audio = long_audio
+        self.chunk_seconds = chunk_seconds
+        self.workers = workers
+        self._whisper_model = None
+    
+    @property
+    def whisper_model(self):
+        """
+        用于字幕对齐的whisper模型，首次使用时才导入和加载（torch启动开销只在需要时支付）；
+        长音频模式下模型只在工作进程中加载，父进程不会加载
+        """
+        if self._whisper_model is None:
+            import whisper
+            self._whisper_model = whisper.load_model(self.model_name)
+        return self._whisper_model
+    
+    def transcribe(self, audio_path):
+        """
+        转写音频，长音频模式下使用并行切块转写
+        """
+        if self.long_audio:
+            return transcribe_long_audio(audio_path, self.model_name,
+                                         self.chunk_seconds, self.workers)
+        return self.whisper_model.transcribe(audio_path)
     
     def segment_text_by_time(self, audio_path, text):
         """
         使用whisper对文本进行时间分段
         """
-        result = self.whisper_model.transcribe(audio_path)
+        result = self.transcribe(audio_path)
         segments = result["segments"]
         
         # 将文本按句子分割
@@ -73,11 +229,36 @@ class AdvancedVideoGenerator:
         
         return VideoClip(make_frame, duration=duration)
     
+    @profiler.profiled("create_advanced_video")
+    @with_workspace
     def create_advanced_video(self, text_audio_path, background_music_path, 
-                            output_path, full_text):
+                            output_path, full_text, workspace=None, pcm_audio=False,
+                            checkpoint_dir=None):
         """
         创建高级视频with分段字幕
+        
+        Args:
+            workspace: 存放中间文件的JobWorkspace，省略时自动创建临时工作区
+            pcm_audio: 音频保持未压缩PCM，跳过AAC编码（输出须为.mov或.mkv）
+            checkpoint_dir: 断点目录，对齐结果、音轨和已编码的视频块完成后即保存在这里；
+                            渲染失败后用 checkpoint.resume_render(checkpoint_dir) 继续
+        
+        Returns:
+            输出视频路径
         """
+        # mp4不能封装PCM音频，在耗时的转写之前就报错
+        if pcm_audio:
+            check_pcm_container(output_path)
+        
+        checkpoint = None
+        if checkpoint_dir:
+            checkpoint = RenderCheckpoint(checkpoint_dir, 'advanced_video', dict(
+                generator=dict(model_name=self.model_name, long_audio=self.long_audio,
+                               chunk_seconds=self.chunk_seconds, workers=self.workers),
+                text_audio_path=str(text_audio_path),
+                background_music_path=str(background_music_path) if background_music_path else None,
+                output_path=str(output_path), full_text=full_text, pcm_audio=pcm_audio))
+        
         # 1. 加载音频
         speech_audio = AudioFileClip(text_audio_path)
         duration = speech_audio.duration
@@ -86,51 +267,76 @@ class AdvancedVideoGenerator:
         background_clip = self.create_background_with_waveform(text_audio_path)
         
         # 3. 生成分段字幕
-        subtitle_segments = self.segment_text_by_time(text_audio_path, full_text)
+        with profiler.span("alignment"):
+            # 断点续渲时直接复用已保存的对齐结果，不再运行whisper；结果按语音文件内容保存
+            alignment_name = f"alignment_{file_digest(text_audio_path)}" if checkpoint else None
+            subtitle_segments = checkpoint.load_result(alignment_name) if checkpoint else None
+            if subtitle_segments is None:
+                subtitle_segments = self.segment_text_by_time(text_audio_path, full_text)
+                if checkpoint:
+                    checkpoint.save_result(alignment_name, subtitle_segments)
+        profiler.count("segments", len(subtitle_segments))
         
         # 4. 创建字幕clips
         subtitle_clips = []
         for segment in subtitle_segments:
-            txt_clip = TextClip(segment["text"],
-                              fontsize=45,
-                              color='white',
-                              font='Arial-Bold',
-                              stroke_color='black',
-                              stroke_width=2,
-                              method='caption',
-                              size=(1400, None),
-                              align='center')
+            with profiler.span("layout"):
+                txt_clip = TextClip(segment["text"],
+                                  fontsize=45,
+                                  color='white',
+                                  font='Arial-Bold',
+                                  stroke_color='black',
+                                  stroke_width=2,
+                                  method='caption',
+                                  size=(1400, None),
+                                  align='center')
             
             txt_clip = txt_clip.set_position(('center', 'bottom')).set_start(segment["start"]).set_duration(segment["end"] - segment["start"])
             subtitle_clips.append(txt_clip)
         
         # 5. 处理背景音乐
         if background_music_path:
-            bg_music = AudioFileClip(background_music_path)
-            if bg_music.duration < duration:
-                bg_music = bg_music.loop(duration=duration)
-            else:
-                bg_music = bg_music.subclip(0, duration)
-            
-            # 添加淡入淡出效果
-            bg_music = bg_music.volumex(0.25).audio_fadeout(2)
-            final_audio = CompositeAudioClip([speech_audio, bg_music])
+            with profiler.span("audio_mix"):
+                # 预先计算好的无缝循环BGM，按时长循环或截断
+                bg_music = bgm_bed_clip(background_music_path, duration)
+                
+                # 添加淡入淡出效果
+                bg_music = bg_music.volumex(0.25).audio_fadeout(2)
+                final_audio = CompositeAudioClip([speech_audio, bg_music])
         else:
             final_audio = speech_audio
         
         # 6. 组合所有元素
         video = CompositeVideoClip([background_clip] + subtitle_clips)
-        video = video.set_audio(final_audio)
         
         # 7. 输出视频
-        video.write_videofile(output_path, 
-                             fps=24, 
-                             codec='libx264',
-                             audio_codec='aac',
-                             temp_audiofile='temp-audio.m4a',
-                             remove_temp=True)
+        profiler.count("frames", int(round(duration * 24)))
+        with profiler.span("encode"):
+            if checkpoint:
+                # 音轨只编码一次并保存；视频分块编码，已完成的块直接复用。
+                # 字幕时间轴或语音、BGM文件内容变化时丢弃旧的音轨和视频块
+                checkpoint.use_timeline(timeline_digest(
+                    [], files={'speech': text_audio_path, 'bgm': background_music_path},
+                    subtitles=[[segment["text"], segment["start"], segment["end"]]
+                               for segment in subtitle_segments]))
+                audio_path = checkpoint.stored_file("audio")
+                if audio_path is None:
+                    audio_path = checkpoint.store_file("audio", write_audiofile(
+                        final_audio, workspace, pcm_audio=pcm_audio, fps=AUDIO_FPS, codec='aac'))
+                checkpoint.write_video(video, output_path, 24, audio_path=audio_path)
+            else:
+                video = video.set_audio(final_audio)
+                write_videofile(video, output_path, workspace,
+                                pcm_audio=pcm_audio,
+                                fps=24, 
+                                codec='libx264',
+                                audio_codec='aac')
+        profiler.count("bytes_written", os.path.getsize(output_path))
+        if checkpoint:
+            checkpoint.finish(str(output_path))
         
         print(f"高级视频已生成: {output_path}")
+        return output_path
 
 # 使用示例
 if __name__ == "__main__":
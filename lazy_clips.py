@@ -0,0 +1,449 @@
+"""
+Lazy Clips
+Text clips that render their frame on first access, backed by a small shared LRU.
+
+An ImageClip keeps its decoded RGB frame for the whole render, so a long script holds
+every frame in memory before encoding starts. A LazyTextClip only stores its text and
+style; frames are rendered when the encoder reaches the clip and at most `maxsize`
+rendered frames are kept, so peak memory does not grow with script length.
+
+Within a job, frames whose (text, style) occurs more than once can be pinned with
+pin_repeated_frames() so each distinct repeated frame is rendered only once (up to
+`max_pinned` of them are kept at a time, so memory stays bounded here too), and a
+FramePrefetcher renders the frames of upcoming clips on a pool of worker processes
+(or threads) while the encoder works through the current one.
+"""
+
+import os
+import weakref
+import itertools
+import threading
+import numpy as np
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from moviepy.editor import VideoClip
+from profiling import profiler
+
+class FrameLRU:
+    """
+    Bounded, thread-safe LRU of rendered frames, plus pinned frames of repeated
+    segments that are kept outside the LRU
+
+    Args:
+    maxsize: Rendered frames kept in the LRU
+    max_pinned: Pinned frames kept at a time; beyond it the least recently used
+                pinned frame is dropped (and rendered again if it recurs)
+    """
+
+    def __init__(self, maxsize=4, max_pinned=16):
+        self.maxsize = maxsize
+        self.max_pinned = max_pinned
+        self._frames = OrderedDict()
+        self._pinned_keys = set()
+        self._pinned = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pin(self, keys):
+        """
+        Keep frames for these keys outside the LRU once rendered
+        """
+        with self._lock:
+            self._pinned_keys.update(keys)
+
+    def unpin(self, keys):
+        """
+        Release pinned frames (e.g. when the job that pinned them ends)
+        """
+        with self._lock:
+            for key in keys:
+                self._pinned_keys.discard(key)
+                self._pinned.pop(key, None)
+
+    def get(self, key, render):
+        """
+        Return the cached frame for key, calling render() on a miss
+        """
+        with self._lock:
+            frame = self._pinned.get(key)
+            if frame is not None:
+                self._pinned.move_to_end(key)
+            else:
+                frame = self._frames.get(key)
+                if frame is not None:
+                    self._frames.move_to_end(key)
+            if frame is not None:
+                profiler.count("frame_cache_hits")
+                return frame
+
+        frame = render()
+        profiler.count("frames_rendered")
+
+        with self._lock:
+            if key in self._pinned_keys:
+                self._pinned[key] = frame
+                self._pinned.move_to_end(key)
+                while len(self._pinned) > self.max_pinned:
+                    self._pinned.popitem(last=False)
+                return frame
+            self._frames[key] = frame
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.maxsize:
+                self._frames.popitem(last=False)
+        return frame
+
+    def contains(self, key):
+        """
+        Whether a frame for key is cached (without touching the LRU order)
+        """
+        with self._lock:
+            return key in self._pinned or key in self._frames
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._pinned.clear()
+            self._pinned_keys.clear()
+
+# Frame cache shared by all lazy clips unless one is passed explicitly
+default_frame_cache = FrameLRU()
+
+# id(array) -> (weak reference, token) of every background seen by a frame key
+_array_tokens = {}
+_array_tokens_lock = threading.Lock()
+_next_token = itertools.count()
+
+def array_token(array):
+    """
+    Token identifying a background array for as long as it is alive
+
+    Unlike id(), a token is never reused by a later array, so frames cached for a
+    freed background are never served for a new one that lands at the same address.
+    """
+    key = id(array)
+    with _array_tokens_lock:
+        entry = _array_tokens.get(key)
+        if entry is not None and entry[0]() is array:
+            return entry[1]
+        token = next(_next_token)
+
+        def forget(ref, key=key):
+            with _array_tokens_lock:
+                if _array_tokens.get(key, (None,))[0] is ref:
+                    del _array_tokens[key]
+
+        _array_tokens[key] = (weakref.ref(array, forget), token)
+        return token
+
+class LazyTextClip(VideoClip):
+    """
+    Static text-on-background clip that renders its frame on first access
+
+    Args:
+    text: Text to display
+    background_array: RGB background the text is drawn on
+    width, height: Frame size
+    render: Function render(text, background_array, width, height) -> RGB array
+    duration: Clip duration in seconds
+    cache: FrameLRU to keep rendered frames in (defaults to the shared cache)
+    """
+
+    def __init__(self, text, background_array, width, height, render, duration=1, cache=None):
+        # Skip VideoClip's make_frame argument, which would render frame 0 right away
+        VideoClip.__init__(self, duration=duration)
+        self.text = text
+        self.background_array = background_array
+        self.render = render
+        self.cache = cache if cache is not None else default_frame_cache
+        self.size = (width, height)
+        self.prefetcher = None
+        self.position = None
+        # Whether this clip's first frame came from the cache (None until it is shown)
+        self.reused = None
+        self.make_frame = self._make_frame
+
+    def cache_key(self):
+        """
+        Identity of the rendered frame: text plus everything that styles it
+        """
+        return (self.text, self.size, array_token(self.background_array), self.render)
+
+    def _make_frame(self, t):
+        if self.reused is None:
+            self.reused = self.cache.contains(self.cache_key())
+        if self.prefetcher is not None:
+            return self.prefetcher.frame(self)
+        return self.cache.get(self.cache_key(), self.render_frame)
+
+    def render_frame(self):
+        """
+        Render this clip's frame without touching the cache
+        """
+        width, height = self.size
+        return self.render(self.text, self.background_array, width, height)
+
+def pin_repeated_frames(clips, cache):
+    """
+    Pin frames whose (text, style) occurs in more than one clip, so every
+    occurrence shares a single rendered frame array
+    """
+    counts = Counter(clip.cache_key() for clip in clips)
+    cache.pin(key for key, count in counts.items() if count > 1)
+
+def unpin_frames(clips, cache):
+    """
+    Release the frames pinned for clips by pin_repeated_frames
+    """
+    cache.unpin({clip.cache_key() for clip in clips})
+
+def report_frame_dedup(clips):
+    """
+    Report frame renders saved by sharing frames between identical segments: the
+    clips whose frame was served from the cache instead of being rendered
+    """
+    saved = sum(1 for clip in clips if clip.reused)
+    if saved:
+        print(f"Reused frames for {saved} repeated segments")
+        profiler.count("frames_deduplicated", saved)
+
+# Backends a FramePrefetcher renders on
+RENDER_BACKENDS = ("process", "thread")
+
+# Shared-memory blocks attached by a render worker process, by name
+_worker_blocks = {}
+
+def _attach(name, shape, dtype):
+    block = _worker_blocks.get(name)
+    if block is None:
+        block = _worker_blocks[name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+def _render_to_slot(render, text, background, size, slot):
+    """
+    Render worker process: draw one frame into a shared-memory output slot
+
+    Args:
+    background: (name, shape, dtype) of the shared background array
+    slot: (name, size) of the output block
+
+    Returns:
+    (shape, dtype) of the frame in the slot, or the frame itself if it does not fit
+    """
+    width, height = size
+    frame = render(text, _attach(*background), width, height)
+    slot_name, slot_size = slot
+    if frame.nbytes > slot_size:
+        return frame
+    _attach(slot_name, frame.shape, frame.dtype.str)[...] = frame
+    return frame.shape, frame.dtype.str
+
+# Rendered frames waiting for the encoder by default, whatever the core count
+MAX_LOOKAHEAD = 8
+
+# Shared-memory output slots of one prefetcher, in bytes (at least one slot is kept)
+MAX_SLOT_BYTES = 256 * 1024 * 1024
+
+def _allocate_shared(size):
+    """
+    Shared-memory block of `size` bytes, reserved up front
+
+    POSIX shared memory is allocated lazily, so a full /dev/shm would only show
+    up as a SIGBUS when a frame is written; reserving it turns that into an OSError.
+    """
+    block = shared_memory.SharedMemory(create=True, size=size)
+    fd = getattr(block, '_fd', -1)
+    if hasattr(os, 'posix_fallocate') and fd >= 0:
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            block.close()
+            block.unlink()
+            raise
+    return block
+
+class FramePrefetcher:
+    """
+    Renders the frames of upcoming clips on a worker pool, ahead of the encoder
+
+    With the "process" backend, worker processes draw frames in parallel on all
+    cores regardless of the GIL: backgrounds are shared with the workers once and
+    each frame is written into a shared-memory output slot, so no frame is pickled.
+    The "thread" backend avoids starting processes, but only scales as far as
+    Pillow releases the GIL while drawing. Clips are scheduled in playback order
+    and at most `lookahead` rendered frames wait for the encoder, so memory stays
+    bounded as with on-demand rendering. Output slots take at most MAX_SLOT_BYTES
+    of shared memory, so fewer frames are rendered ahead for large frames; if
+    shared memory cannot be allocated, the prefetcher falls back to threads. Use
+    it as a context manager (or call close()) so the pool and its buffers are
+    released even if encoding fails.
+
+    Args:
+    clips: LazyTextClips in playback order (they render through the prefetcher);
+           with the process backend their render functions must be picklable
+    workers: Render workers (defaults to the number of CPUs)
+    lookahead: Clips rendered ahead of the one being encoded (defaults to
+               2 * workers, at most MAX_LOOKAHEAD)
+    backend: "process" or "thread"
+    """
+
+    def __init__(self, clips, workers=None, lookahead=None, backend="process"):
+        if backend not in RENDER_BACKENDS:
+            raise ValueError(f"Unknown render backend: {backend}")
+        self.clips = list(clips)
+        self.workers = workers or os.cpu_count() or 1
+        self.lookahead = lookahead or min(2 * self.workers, MAX_LOOKAHEAD)
+        self.backend = backend
+        self._executor = None
+        # cache key -> (future, output slot or None, clip position)
+        self._futures = {}
+        self._next = 0
+        self._blocks = []
+        self._backgrounds = {}
+        self._free_slots = []
+        self._lock = threading.Lock()
+        for position, clip in enumerate(self.clips):
+            clip.prefetcher = self
+            clip.position = position
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _start(self):
+        if self.backend == "process":
+            try:
+                self._allocate()
+            except OSError as e:
+                print(f"⚠️  Could not allocate shared memory for frame rendering ({e}), "
+                      f"rendering on threads")
+                self._release()
+                self.backend = "thread"
+        if self.backend == "thread":
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="frame_render")
+            return
+        self._executor = ProcessPoolExecutor(self.workers)
+
+    def _allocate(self):
+        """
+        Share every background with the workers and allocate the output slots
+        """
+        for clip in self.clips:
+            self._share(clip.background_array)
+        # Frames are drawn on a copy of their background, so they have its size
+        slot_size = max([clip.background_array.nbytes for clip in self.clips] + [1])
+        for _ in range(max(1, min(self.lookahead, MAX_SLOT_BYTES // slot_size))):
+            slot = _allocate_shared(slot_size)
+            self._blocks.append(slot)
+            self._free_slots.append(slot)
+
+    def _share(self, array):
+        """
+        (name, shape, dtype) of a shared-memory copy of a background array
+        """
+        token = array_token(array)
+        shared = self._backgrounds.get(token)
+        if shared is None:
+            block = _allocate_shared(max(array.nbytes, 1))
+            self._blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            shared = self._backgrounds[token] = (block.name, array.shape, array.dtype.str)
+        return shared
+
+    def _release(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+        self._backgrounds = {}
+        self._free_slots = []
+
+    def _submit(self, clip):
+        if self.backend == "thread":
+            return self._executor.submit(profiler.bind(clip.render_frame)), None
+        slot = self._free_slots.pop()
+        future = self._executor.submit(_render_to_slot, clip.render, clip.text,
+                                       self._share(clip.background_array), clip.size,
+                                       (slot.name, slot.size))
+        return future, slot
+
+    def _schedule(self, position):
+        """
+        Submit renders for the clips from position up to `lookahead` clips ahead of it
+        """
+        with self._lock:
+            if self._executor is None:
+                self._start()
+            # Encoding may start past the first clip (e.g. resuming a checkpoint)
+            self._next = max(self._next, position)
+            end = min(position + 1 + self.lookahead, len(self.clips))
+            while self._next < end:
+                clip = self.clips[self._next]
+                key = clip.cache_key()
+                # Repeated frames are rendered once
+                if key not in self._futures and not clip.cache.contains(key):
+                    if self.backend == "process" and not self._free_slots:
+                        break
+                    future, slot = self._submit(clip)
+                    self._futures[key] = (future, slot, self._next)
+                self._next += 1
+
+    def _reclaim(self, position):
+        """
+        Drop renders of clips the encoder went past without asking for them
+        """
+        with self._lock:
+            stale = [key for key, (_, _, scheduled) in self._futures.items() if scheduled < position]
+            pending = [self._futures.pop(key) for key in stale]
+        for future, slot, _ in pending:
+            if not future.cancel():
+                # A worker may still be writing into the slot
+                future.exception()
+            if slot is not None:
+                with self._lock:
+                    self._free_slots.append(slot)
+
+    def _take(self, clip, key):
+        with self._lock:
+            pending = self._futures.pop(key, None)
+        if pending is None:
+            # Not scheduled (e.g. the encoder seeked backwards): render in place
+            return clip.render_frame()
+        future, slot, _ = pending
+        try:
+            result = future.result()
+            if slot is None or isinstance(result, np.ndarray):
+                return result
+            shape, dtype = result
+            # Copied out, so the slot can take the next frame
+            return np.ndarray(shape, dtype=dtype, buffer=slot.buf).copy()
+        finally:
+            if slot is not None:
+                with self._lock:
+                    self._free_slots.append(slot)
+
+    def frame(self, clip):
+        """
+        Frame of a clip, keeping the next `lookahead` clips rendering in the background
+        """
+        self._reclaim(clip.position)
+        self._schedule(clip.position)
+        key = clip.cache_key()
+        return clip.cache.get(key, lambda: self._take(clip, key))
+
+    def close(self):
+        """
+        Stop the render workers and release unused frames and shared buffers
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            futures, self._futures = self._futures, {}
+        for future, _, _ in futures.values():
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self._release()
+        for clip in self.clips:
+            clip.prefetcher = None
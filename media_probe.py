@@ -0,0 +1,313 @@
+"""
+Media Probe
+Cheap media metadata (duration, streams, codecs, sample rate) with a persistent cache.
+
+One ffprobe call per file answers what opening a VideoFileClip/AudioFileClip would,
+without starting a decoder. Results are cached by (path, size, mtime), so repeated
+discovery scans and planning steps cost a dictionary lookup.
+
+The cache file is shared by every process (e.g. watch-daemon workers): new results
+are merged into it under a file lock, and old entries are evicted by age and count.
+Probing many files inside `with cache.batch():` writes the file once at the end.
+"""
+
+import os
+import re
+import json
+import time
+import atexit
+import shutil
+import threading
+import subprocess
+from contextlib import contextmanager
+from workspace import file_lock
+
+# Location of the persistent probe cache
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "videoscript", "probe_cache.json")
+
+# Probe results kept in the cache file; the least recently probed are evicted first
+MAX_PROBE_ENTRIES = 5000
+
+# Entries probed longer ago than this are evicted (seconds)
+MAX_PROBE_AGE = 90 * 24 * 3600
+
+class MediaInfo:
+    """
+    Probe result for one media file
+    """
+
+    def __init__(self, path, duration, streams, format_name=None):
+        self.path = path
+        self.duration = duration
+        self.streams = streams
+        self.format_name = format_name
+
+    @property
+    def video_streams(self):
+        return [s for s in self.streams if s.get("type") == "video"]
+
+    @property
+    def audio_streams(self):
+        return [s for s in self.streams if s.get("type") == "audio"]
+
+    @property
+    def has_video(self):
+        return bool(self.video_streams)
+
+    @property
+    def has_audio(self):
+        return bool(self.audio_streams)
+
+    @property
+    def sample_rate(self):
+        audio = self.audio_streams
+        return audio[0].get("sample_rate") if audio else None
+
+    @property
+    def size(self):
+        video = self.video_streams
+        return (video[0].get("width"), video[0].get("height")) if video else None
+
+    @property
+    def fps(self):
+        video = self.video_streams
+        return video[0].get("fps") if video else None
+
+    def to_dict(self):
+        return {"duration": self.duration, "streams": self.streams, "format_name": self.format_name}
+
+    @classmethod
+    def from_dict(cls, path, data):
+        return cls(path, data["duration"], data["streams"], data.get("format_name"))
+
+    def __repr__(self):
+        codecs = ", ".join(f"{s['type']}:{s.get('codec')}" for s in self.streams)
+        duration = f"{self.duration:.2f}s" if self.duration is not None else "unknown duration"
+        return f"MediaInfo({os.path.basename(self.path)!r}, {duration}, {codecs})"
+
+def _ffmpeg_binary():
+    try:
+        from moviepy.config import get_setting
+        return get_setting("FFMPEG_BINARY")
+    except ImportError:
+        return "ffmpeg"
+
+def _ffprobe_binary():
+    """
+    ffprobe from $FFPROBE_BINARY, next to the ffmpeg binary, or on PATH
+    """
+    configured = os.environ.get("FFPROBE_BINARY")
+    if configured:
+        return configured
+    ffmpeg = _ffmpeg_binary()
+    sibling = os.path.join(os.path.dirname(ffmpeg), "ffprobe")
+    if os.path.dirname(ffmpeg) and os.path.isfile(sibling):
+        return sibling
+    return shutil.which("ffprobe")
+
+def _parse_rate(rate):
+    try:
+        num, _, den = rate.partition("/")
+        value = float(num) / float(den or 1)
+        return value if value > 0 else None
+    except (ValueError, ZeroDivisionError):
+        return None
+
+def _probe_with_ffprobe(ffprobe, path):
+    cmd = [ffprobe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    data = json.loads(result.stdout)
+
+    streams = []
+    for stream in data.get("streams", []):
+        codec_type = stream.get("codec_type")
+        if codec_type not in ("video", "audio"):
+            continue
+        info = {"type": codec_type, "codec": stream.get("codec_name")}
+        if codec_type == "video":
+            info["width"] = stream.get("width")
+            info["height"] = stream.get("height")
+            info["fps"] = _parse_rate(stream.get("avg_frame_rate", "0/0")) or _parse_rate(stream.get("r_frame_rate", "0/0"))
+        else:
+            info["sample_rate"] = int(stream["sample_rate"]) if stream.get("sample_rate") else None
+            info["channels"] = stream.get("channels")
+        streams.append(info)
+
+    fmt = data.get("format", {})
+    duration = float(fmt["duration"]) if fmt.get("duration") else None
+    return MediaInfo(path, duration, streams, fmt.get("format_name"))
+
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_STREAM_RE = re.compile(r"Stream #\d+:\d+.*?: (Video|Audio): (\w+)(.*)")
+_SIZE_RE = re.compile(r", (\d{2,5})x(\d{2,5})")
+_FPS_RE = re.compile(r", (\d+(?:\.\d+)?) (?:fps|tbr)")
+_RATE_RE = re.compile(r", (\d+) Hz")
+_CHANNELS = {"mono": 1, "stereo": 2, "5.1": 6, "7.1": 8}
+
+def _probe_with_ffmpeg(path):
+    """
+    Fallback when ffprobe is not installed: parse `ffmpeg -i` output (still one call)
+    """
+    cmd = [_ffmpeg_binary(), "-hide_banner", "-i", path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output = result.stderr.decode("utf-8", errors="replace")
+
+    match = _DURATION_RE.search(output)
+    if not match:
+        raise IOError(f"Could not read media information from {path}")
+    hours, minutes, seconds = match.groups()
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    streams = []
+    for line in output.splitlines():
+        match = _STREAM_RE.search(line)
+        if not match:
+            continue
+        kind, codec, rest = match.groups()
+        if kind == "Video":
+            size = _SIZE_RE.search(rest)
+            fps = _FPS_RE.search(rest)
+            streams.append({
+                "type": "video", "codec": codec,
+                "width": int(size.group(1)) if size else None,
+                "height": int(size.group(2)) if size else None,
+                "fps": float(fps.group(1)) if fps else None,
+            })
+        else:
+            rate = _RATE_RE.search(rest)
+            layout = next((n for name, n in _CHANNELS.items() if f", {name}," in rest + ","), None)
+            streams.append({
+                "type": "audio", "codec": codec,
+                "sample_rate": int(rate.group(1)) if rate else None,
+                "channels": layout,
+            })
+    return MediaInfo(path, duration, streams)
+
+def _evict(entries, now):
+    """
+    Entries without those probed over MAX_PROBE_AGE ago, and at most MAX_PROBE_ENTRIES
+    """
+    fresh = [(entry.get("probed", 0), key) for key, entry in entries.items()
+             if now - entry.get("probed", 0) <= MAX_PROBE_AGE]
+    fresh.sort(reverse=True)
+    return {key: entries[key] for _, key in fresh[:MAX_PROBE_ENTRIES]}
+
+class ProbeCache:
+    """
+    Probe results keyed by (absolute path, size, mtime), persisted as JSON
+    """
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path or os.environ.get("VIDEOSCRIPT_PROBE_CACHE", DEFAULT_CACHE_PATH)
+        self._entries = None
+        # New entries not yet written to the cache file
+        self._pending = {}
+        self._batches = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _read(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def flush(self):
+        """
+        Merge new entries into the cache file, keeping other processes' entries
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with file_lock(self.cache_path):
+                entries = self._read()
+                for key, entry in pending.items():
+                    _drop_path(entries, key)
+                    entries[key] = entry
+                entries = _evict(entries, time.time())
+                temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(entries, f)
+                os.replace(temp_path, self.cache_path)
+            with self._lock:
+                # Entries probed while the file was being written stay in memory too
+                entries.update(self._pending)
+                self._entries = entries
+        except OSError as e:
+            print(f"Could not write probe cache: {e}")
+
+    @contextmanager
+    def batch(self):
+        """
+        Write new entries once when the block ends instead of after every probe
+        """
+        with self._lock:
+            self._batches += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batches -= 1
+                done = self._batches == 0
+            if done:
+                self.flush()
+
+    @staticmethod
+    def key(path):
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def probe(self, path):
+        """
+        Return MediaInfo for path, probing only when the file is new or changed
+        """
+        path = str(path)
+        key = self.key(path)
+        with self._lock:
+            entry = self._load().get(key)
+        if entry is not None:
+            self.hits += 1
+            return MediaInfo.from_dict(path, entry)
+
+        self.misses += 1
+        ffprobe = _ffprobe_binary()
+        info = _probe_with_ffprobe(ffprobe, path) if ffprobe else _probe_with_ffmpeg(path)
+
+        entry = dict(info.to_dict(), probed=time.time())
+        with self._lock:
+            entries = self._load()
+            _drop_path(entries, key)
+            entries[key] = entry
+            self._pending[key] = entry
+            batched = self._batches > 0
+        if not batched:
+            self.flush()
+        return info
+
+def _drop_path(entries, key):
+    """
+    Drop stale entries for the same path as key (older size or mtime)
+    """
+    prefix = key.rsplit("|", 2)[0] + "|"
+    for old_key in [k for k in entries if k.startswith(prefix) and k != key]:
+        del entries[old_key]
+
+# Process-wide cache used by probe_media()
+default_probe_cache = ProbeCache()
+atexit.register(default_probe_cache.flush)
+
+def probe_media(path):
+    """
+    Probe a media file through the shared metadata cache
+    """
+    return default_probe_cache.probe(path)
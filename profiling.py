@@ -0,0 +1,324 @@
+"""
+Profiling
+Per-stage timing spans, counters and report emitters for the video entry points.
+
+Profiling is off by default and then every hook is a no-op. Enable it in code:
+
+    from profiling import profiler
+    profiler.configure(json_path="render_stats.jsonl", prometheus_path="videoscript.prom")
+
+or through environment variables:
+
+    VIDEOSCRIPT_PROFILE=1            print a summary after each job
+    VIDEOSCRIPT_PROFILE_JSON=path    append one JSON line per job
+    VIDEOSCRIPT_PROFILE_PROM=path    add each job to counters in a Prometheus textfile-collector file
+    VIDEOSCRIPT_CPROFILE=path        capture a cProfile dump of each job (path.<job>.<id>.prof)
+
+Each thread runs its own job, so concurrent jobs in one process do not mix their
+statistics. Helper threads started by a job join it through profiler.bind(func),
+which runs func in a copy of the job's context; spans and counters recorded
+outside any job are dropped. Spans on helper threads run concurrently with the
+job's own, so a span recorded on several threads adds up their time (CPU time
+across threads, which may exceed wall time) and is reported with "threads": true.
+"""
+
+import os
+import re
+import json
+import time
+import itertools
+import threading
+import cProfile
+import functools
+import contextvars
+from contextlib import contextmanager, nullcontext
+from workspace import file_lock
+
+# Shared no-op context returned by span() while profiling is disabled
+_NULL_SPAN = nullcontext()
+
+# Sequence numbers of the jobs started in this process
+_job_ids = itertools.count(1)
+
+class _Span:
+    """
+    Context manager that adds its elapsed time to a named stage
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler._record(self.name, time.perf_counter() - self.start)
+        return False
+
+class _JobStats:
+    """
+    Spans and counters of one job
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.id = f"{os.getpid()}-{next(_job_ids)}"
+        self.thread = threading.get_ident()
+        # name -> [seconds, calls, recorded on helper threads]
+        self.spans = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+# Job of the current thread (or of the job that bound a helper thread's function)
+_current_job = contextvars.ContextVar("videoscript_profile_job", default=None)
+
+class Profiler:
+    """
+    Collects stage timings and counters, separately for each running job
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.json_path = None
+        self.prometheus_path = None
+        self.cprofile_path = None
+        self.print_summary = False
+        # Last job finished on each thread, for report() after the job
+        self._local = threading.local()
+
+    def configure(self, enabled=True, json_path=None, prometheus_path=None,
+                  cprofile_path=None, print_summary=False):
+        """
+        Turn profiling on or off and choose where reports are written
+
+        Args:
+            enabled: Collect spans and counters
+            json_path: Append one JSON line per job to this file
+            prometheus_path: Write Prometheus textfile metrics to this file
+            cprofile_path: Dump cProfile stats of each job next to this path, with the
+                           job name and id in the file name
+            print_summary: Print a summary table after each job
+        """
+        self.enabled = enabled
+        self.json_path = json_path
+        self.prometheus_path = prometheus_path
+        self.cprofile_path = cprofile_path
+        self.print_summary = print_summary
+
+    def configure_from_env(self):
+        """
+        Configure from VIDEOSCRIPT_PROFILE* environment variables
+        """
+        json_path = os.environ.get("VIDEOSCRIPT_PROFILE_JSON")
+        prometheus_path = os.environ.get("VIDEOSCRIPT_PROFILE_PROM")
+        cprofile_path = os.environ.get("VIDEOSCRIPT_CPROFILE")
+        print_summary = os.environ.get("VIDEOSCRIPT_PROFILE", "") not in ("", "0")
+        if json_path or prometheus_path or cprofile_path or print_summary:
+            self.configure(True, json_path, prometheus_path, cprofile_path, print_summary)
+
+    def _stats(self):
+        return _current_job.get() or getattr(self._local, "last", None) or _JobStats(None)
+
+    def _record(self, name, seconds):
+        stats = _current_job.get()
+        if stats is None:
+            return
+        with stats.lock:
+            span = stats.spans.setdefault(name, [0.0, 0, False])
+            span[0] += seconds
+            span[1] += 1
+            if threading.get_ident() != stats.thread:
+                span[2] = True
+
+    def span(self, name):
+        """
+        Time a named stage: `with profiler.span("tts"): ...`
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def count(self, name, value=1):
+        """
+        Add value to a named counter
+        """
+        if not self.enabled:
+            return
+        stats = _current_job.get()
+        if stats is None:
+            return
+        with stats.lock:
+            stats.counters[name] = stats.counters.get(name, 0) + value
+
+    def bind(self, func):
+        """
+        Wrap func so that, run on another thread, it records into the current job
+        (e.g. `executor.submit(profiler.bind(render))`)
+        """
+        if not self.enabled or _current_job.get() is None:
+            return func
+        context = contextvars.copy_context()
+        return functools.partial(context.run, func)
+
+    @contextmanager
+    def job(self, name):
+        """
+        Wrap an entry point; reports are emitted when the outermost job ends
+        """
+        if not self.enabled:
+            yield
+            return
+
+        # Nested entry points record into the job that is already running
+        if _current_job.get() is not None:
+            yield
+            return
+
+        stats = _JobStats(name)
+        token = _current_job.set(stats)
+        profile = None
+        if self.cprofile_path:
+            profile = cProfile.Profile()
+            profile.enable()
+        start = time.perf_counter()
+        status = "error"
+        try:
+            yield
+            status = "ok"
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(cprofile_job_path(self.cprofile_path, stats))
+            try:
+                self.emit(time.perf_counter() - start, status)
+            finally:
+                _current_job.reset(token)
+                self._local.last = stats
+
+    def profiled(self, name):
+        """
+        Decorator that runs an entry point inside job(name)
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.job(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def report(self, wall_seconds=None, status="ok"):
+        """
+        Statistics of the current job (or of the last one finished on this thread) as a dict
+        """
+        stats = self._stats()
+        with stats.lock:
+            return {
+                "job": stats.name,
+                "job_id": stats.id,
+                "status": status,
+                "timestamp": time.time(),
+                "wall_seconds": wall_seconds,
+                "spans": {name: {"seconds": total, "calls": calls, "threads": threads}
+                          for name, (total, calls, threads) in stats.spans.items()},
+                "counters": dict(stats.counters),
+            }
+
+    def emit(self, wall_seconds, status="ok"):
+        """
+        Write the current job's report to every configured destination
+        """
+        report = self.report(wall_seconds, status)
+        if self.print_summary:
+            print_report(report)
+        if self.json_path:
+            with open(self.json_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(report) + "\n")
+        if self.prometheus_path:
+            write_prometheus_textfile(report, self.prometheus_path)
+        return report
+
+def print_report(report):
+    """
+    Print a human readable summary of a job report
+    """
+    print(f"\n=== Profile: {report['job']} ({report['status']}) ===")
+    if report["wall_seconds"] is not None:
+        print(f"Wall time: {report['wall_seconds']:.3f}s")
+    for name, span in sorted(report["spans"].items(), key=lambda kv: -kv[1]["seconds"]):
+        summed = ", summed over threads" if span.get("threads") else ""
+        print(f"  {name:<12} {span['seconds']:9.3f}s  ({span['calls']} calls{summed})")
+    for name, value in sorted(report["counters"].items()):
+        print(f"  {name:<12} {value}")
+
+def cprofile_job_path(path, stats):
+    """
+    cProfile dump path of one job: render.prof -> render.<job>.<job id>.prof
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{stats.name}.{stats.id}{ext or '.prof'}"
+
+# Sample line of a Prometheus textfile: name{labels} value
+_PROM_SAMPLE = re.compile(r'^(\w+)(\{.*\})? (\S+)$')
+
+def _read_prometheus_samples(path):
+    """
+    {(metric, labels): value} of a textfile written by write_prometheus_textfile
+    """
+    samples = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                match = _PROM_SAMPLE.match(line.strip())
+                if match:
+                    samples[match.group(1), match.group(2) or ""] = float(match.group(3))
+    except (OSError, ValueError):
+        pass
+    return samples
+
+def write_prometheus_textfile(report, path):
+    """
+    Add a job report to the counters of a Prometheus textfile-collector file
+
+    Counters accumulate over all jobs of all processes writing the file: it is
+    read, updated and atomically replaced under a file lock.
+    """
+    job = report["job"]
+    status = report["status"]
+    increments = [
+        ("videoscript_jobs_total", f'{{job="{job}",status="{status}"}}', 1),
+        ("videoscript_job_seconds_total", f'{{job="{job}",status="{status}"}}',
+         report["wall_seconds"] or 0),
+    ]
+    for name, span in report["spans"].items():
+        labels = f'{{job="{job}",stage="{name}"}}'
+        increments.append(("videoscript_stage_seconds_total", labels, span["seconds"]))
+        increments.append(("videoscript_stage_calls_total", labels, span["calls"]))
+    for name, value in report["counters"].items():
+        increments.append((f"videoscript_{name}_total", f'{{job="{job}"}}', value))
+
+    with file_lock(path):
+        samples = _read_prometheus_samples(path)
+        for metric, labels, value in increments:
+            samples[metric, labels] = samples.get((metric, labels), 0) + value
+
+        lines = []
+        for metric in sorted({metric for metric, _ in samples}):
+            lines.append(f"# TYPE {metric} counter")
+            for (name, labels), value in sorted(samples.items()):
+                if name == metric:
+                    value = int(value) if value == int(value) else f"{value:.6f}"
+                    lines.append(f"{metric}{labels} {value}")
+
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
+
+# Process-wide profiler used by all entry points
+profiler = Profiler()
+profiler.configure_from_env()
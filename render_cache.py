@@ -0,0 +1,302 @@
+"""
+Render Cache
+Whole-output cache: a job identical to an earlier one gets that job's output files.
+
+A job's fingerprint covers everything its output depends on: the content hashes of
+its input files, its parameters, the output formats and the versions of the tools
+that render it (this cache format, MoviePy, Pillow, NumPy, ffmpeg). Finished outputs
+are stored under the fingerprint in the cache directory; a matching job clones them
+to its output paths instead of rendering. Clones are reflinks where the filesystem
+supports them (copy-on-write, so no extra space) and copies elsewhere; entries and
+outputs never share an inode, so writing an output in place cannot alter the cache.
+Least recently used entries are evicted once the cache grows past its size limit.
+
+    VIDEOSCRIPT_RENDER_CACHE=dir          cache location ("off" disables the cache)
+    VIDEOSCRIPT_RENDER_CACHE_MAX_GB=10    size limit
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import functools
+import errno
+import threading
+import subprocess
+from profiling import profiler
+
+# Location of the render cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "videoscript", "renders")
+
+# Size limit of the render cache in GB
+DEFAULT_MAX_GB = 10
+
+# Bump when a change to the renderers alters their output for the same inputs
+RENDER_CACHE_VERSION = 1
+
+@functools.lru_cache(maxsize=None)
+def tool_version():
+    """
+    Versions of everything besides the inputs that shapes a rendered output
+    """
+    import numpy
+    import moviepy
+    import PIL
+    from moviepy.config import get_setting
+    try:
+        result = subprocess.run([get_setting("FFMPEG_BINARY"), '-version'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        ffmpeg = result.stdout.decode(errors='replace').split('\n', 1)[0]
+    except OSError:
+        ffmpeg = None
+    return {"cache": RENDER_CACHE_VERSION, "moviepy": moviepy.__version__,
+            "pillow": PIL.__version__, "numpy": numpy.__version__, "ffmpeg": ffmpeg}
+
+# ioctl cloning a whole file on copy-on-write filesystems (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+def _clone(source, target):
+    """
+    Copy source to target as a reflink where the filesystem supports it
+    """
+    try:
+        import fcntl
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return
+    except ImportError:
+        pass
+    except OSError as e:
+        if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.EBADF):
+            raise
+    shutil.copyfile(source, target)
+
+def _materialize(source, target, link=False):
+    """
+    Make target a clone of (or, with link, a hard link to) source, replacing it atomically
+    """
+    target = str(target)
+    try:
+        if os.path.samefile(source, target):
+            # Already a hard link to the cached file (a repeated hit)
+            return
+    except OSError:
+        pass
+    temp_path = f"{target}.{os.getpid()}.tmp"
+    try:
+        if link:
+            try:
+                os.link(source, temp_path)
+            except OSError:
+                # Hard links do not cross filesystems
+                _clone(source, temp_path)
+        else:
+            _clone(source, temp_path)
+        os.replace(temp_path, target)
+    finally:
+        if os.path.lexists(temp_path):
+            os.unlink(temp_path)
+
+def _unshare(path):
+    """
+    Unlink an output that is hard-linked (link=True) to a cache entry before it is
+    rendered over, so writing it in place never alters the cache
+    """
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.unlink(path)
+    except OSError:
+        pass
+
+class RenderCache:
+    """
+    Finished outputs of render jobs, keyed by input fingerprint
+
+    Args:
+    cache_dir: Cache directory (defaults to $VIDEOSCRIPT_RENDER_CACHE; "off" disables it)
+    max_bytes: Size limit (defaults to $VIDEOSCRIPT_RENDER_CACHE_MAX_GB)
+    link: Hard-link outputs to and from the cache instead of cloning them (saves space
+          without reflinks, but an external in-place write to an output then alters
+          the cached entry)
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, link=False):
+        self.cache_dir = cache_dir or os.environ.get("VIDEOSCRIPT_RENDER_CACHE", DEFAULT_CACHE_DIR)
+        self.enabled = self.cache_dir.lower() not in ("0", "off", "false")
+        if max_bytes is None:
+            max_gb = float(os.environ.get("VIDEOSCRIPT_RENDER_CACHE_MAX_GB", DEFAULT_MAX_GB))
+            max_bytes = int(max_gb * 1024 ** 3)
+        self.max_bytes = max_bytes
+        self.link = link
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def file_digest(self, path):
+        """
+        SHA-256 of a file's content (None if it does not exist), hashed once per file version
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        version = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(version)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(block)
+            digest = sha.hexdigest()
+            with self._lock:
+                self._digests[version] = digest
+        return digest
+
+    def fingerprint(self, kind, params, files, outputs):
+        """
+        Cache key of a job, or None while the cache is disabled
+
+        Args:
+        kind: Job type
+        params: JSON-serializable parameters that affect the output
+        files: Input files by role, e.g. {'background': path}; hashed by content
+        outputs: Output paths (only their formats are part of the key)
+        """
+        if not self.enabled:
+            return None
+        with profiler.span("fingerprint"):
+            data = {
+                "kind": kind,
+                "params": params,
+                "files": {role: self.file_digest(path) if path else None for role, path in files.items()},
+                "formats": [os.path.splitext(str(path))[1].lower() for path in outputs],
+                "tools": tool_version(),
+            }
+            return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _entry_files(self, key, outputs):
+        entry = os.path.join(self.cache_dir, key)
+        return entry, [os.path.join(entry, f"output_{i}{os.path.splitext(str(path))[1]}")
+                       for i, path in enumerate(outputs)]
+
+    def fetch(self, key, outputs):
+        """
+        Place the cached outputs of a job at its output paths
+
+        Called before every render, also with key None (cache disabled or bypassed),
+        so outputs still linked to a cache entry are unlinked before they are written.
+
+        Returns:
+        True on a hit; on a miss the job has to render (and then call store)
+        """
+        if key is None:
+            for path in outputs:
+                _unshare(path)
+            return False
+        entry, cached = self._entry_files(key, outputs)
+        try:
+            if not all(os.path.isfile(path) for path in cached):
+                raise FileNotFoundError(entry)
+            for source, target in zip(cached, outputs):
+                _materialize(source, target, self.link)
+            # Mark the entry as recently used
+            os.utime(entry)
+        except OSError:
+            self.misses += 1
+            profiler.count("render_cache_misses")
+            for path in outputs:
+                _unshare(path)
+            return False
+
+        served = sum(os.path.getsize(path) for path in cached)
+        self.hits += 1
+        self.bytes_served += served
+        profiler.count("render_cache_hits")
+        profiler.count("render_cache_bytes_served", served)
+        print(f"♻️  Identical render found in cache ({key[:12]}), reusing its output")
+        return True
+
+    def store(self, key, outputs):
+        """
+        Add the finished outputs of a job, then evict entries over the size limit
+        """
+        if key is None:
+            return
+        entry, cached = self._entry_files(key, outputs)
+        temp_entry = f"{entry}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(temp_entry, exist_ok=True)
+            for source, target in zip(outputs, cached):
+                _materialize(str(source), os.path.join(temp_entry, os.path.basename(target)), self.link)
+            try:
+                os.rename(temp_entry, entry)
+            except OSError:
+                # Another job stored the same entry first
+                pass
+        except OSError as e:
+            print(f"Could not write render cache: {e}")
+        finally:
+            shutil.rmtree(temp_entry, ignore_errors=True)
+        self.evict()
+
+    def _entries(self):
+        """
+        (last use, size, path) of every entry
+        """
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return entries
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".tmp") or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, size, path))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits its size limit
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            profiler.count("render_cache_evictions")
+
+    def clear(self):
+        """
+        Remove every entry
+        """
+        for _, _, path in self._entries():
+            shutil.rmtree(path, ignore_errors=True)
+
+    def stats(self):
+        """
+        Entry count and size of the cache, and this process's hits and misses
+        """
+        entries = self._entries()
+        return {
+            "cache_dir": self.cache_dir,
+            "enabled": self.enabled,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_served": self.bytes_served,
+        }
+
+# Process-wide render cache
+default_render_cache = RenderCache()
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Render Service
+Long-running local render server with warm worker processes and a job queue.
+
+Each script invocation pays for importing MoviePy, loading fonts and backgrounds and,
+for aligned videos, loading the Whisper model. The service keeps worker processes
+that hold those resources and accepts jobs over HTTP (TCP or a Unix socket):
+
+    POST /jobs           {"type": "text_video" | "advanced_video" | "combine", "params": {...}}
+    GET  /jobs           All known jobs
+    GET  /jobs/<id>      Status, result, error and per-stage timings of one job
+    GET  /metrics        Queue depth, running jobs and per-stage latency
+    GET  /health         Liveness check
+
+Everything runs locally; nothing is fetched from the network (use "use_gtts": false
+for offline TTS).
+"""
+
+import os
+import json
+import time
+import uuid
+import signal
+import asyncio
+import argparse
+import traceback
+import multiprocessing
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Job types: create_text_video_with_audio, AdvancedVideoGenerator.create_advanced_video
+# and combine_audio_video; params are passed to them as keyword arguments
+JOB_TYPES = ('text_video', 'advanced_video', 'combine')
+
+# AdvancedVideoGenerator constructor options accepted in advanced_video params
+GENERATOR_OPTIONS = ('model_name', 'long_audio', 'chunk_seconds', 'workers')
+
+# Largest accepted request body
+MAX_BODY_BYTES = 1024 * 1024
+
+# Finished jobs kept for status queries
+MAX_FINISHED_JOBS = 1000
+
+# Per-process state of a warm worker
+_generators = {}
+
+def _init_render_worker(whisper_model=None):
+    """
+    Worker initializer: import the renderers and load shared resources once
+    """
+    # Ctrl+C stops the service, which shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from profiling import profiler
+    if not profiler.enabled:
+        profiler.configure(enabled=True)
+
+    import subtitle_video_audio_maker
+    import video_audio_combiner
+    subtitle_video_audio_maker.load_text_font()
+
+    if whisper_model:
+        try:
+            # The generator loads its model on first use; load it now
+            _advanced_generator({'model_name': whisper_model}).whisper_model
+        except Exception as e:
+            print(f"Cannot preload Whisper model {whisper_model}: {e}")
+
+def _advanced_generator(options):
+    """
+    AdvancedVideoGenerator for these options, kept for the life of the worker
+    """
+    from generateWithScripts import AdvancedVideoGenerator
+    key = tuple(sorted(options.items()))
+    generator = _generators.get(key)
+    if generator is None:
+        generator = AdvancedVideoGenerator(**options)
+        _generators[key] = generator
+    return generator
+
+def _run_render_job(job_type, params):
+    """
+    Worker process entry point: run one job.
+
+    Returns:
+        (result or None, error message or None, {stage: seconds}, {counter: value})
+    """
+    from profiling import profiler
+    started = time.perf_counter()
+    try:
+        with profiler.job(job_type):
+            result = _call_entry_point(job_type, params)
+    except Exception:
+        return None, traceback.format_exc(), {}, {}
+
+    report = profiler.report()
+    stages = {name: span['seconds'] for name, span in report['spans'].items()}
+    stages['run'] = time.perf_counter() - started
+    if isinstance(result, Path):
+        result = str(result)
+    return result, None, stages, report['counters']
+
+def _call_entry_point(job_type, params):
+    if job_type == 'text_video':
+        from subtitle_video_audio_maker import create_text_video_with_audio
+        return create_text_video_with_audio(**params)
+    if job_type == 'advanced_video':
+        options = {k: params.pop(k) for k in GENERATOR_OPTIONS if k in params}
+        return _advanced_generator(options).create_advanced_video(**params)
+    if job_type == 'combine':
+        from video_audio_combiner import combine_audio_video
+        for key in ('video_path', 'audio_path', 'bgm_path', 'output_path'):
+            if params.get(key):
+                params[key] = Path(params[key])
+        return combine_audio_video(raise_errors=True, **params)
+    raise ValueError(f"Unknown job type: {job_type}")
+
+class RenderService:
+    """
+    Job queue in front of a pool of warm render workers
+
+    Args:
+        workers: Number of worker processes (and jobs rendered at once)
+        whisper_model: Whisper model to load in every worker up front (optional)
+    """
+
+    def __init__(self, workers=2, whisper_model=None):
+        self.workers = workers
+        self.whisper_model = whisper_model
+        self.jobs = OrderedDict()
+        self.queue = None
+        self.pool = None
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.started_at = time.time()
+        # stage -> [calls, total seconds, max seconds]
+        self.stage_stats = {}
+        # counter -> total over all jobs (segments, frames, render cache hits, ...)
+        self.counters = {}
+
+    def _start_pool(self):
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_render_worker,
+            initargs=(self.whisper_model,)
+        )
+        # Start every worker now so the first jobs find them warm
+        for future in [self.pool.submit(time.sleep, 0) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, job_type, params):
+        """
+        Queue a job and return its status record
+        """
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {job_type} (expected one of {', '.join(JOB_TYPES)})")
+        if not isinstance(params, dict):
+            raise ValueError("params must be an object")
+
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'id': job_id,
+            'type': job_type,
+            'status': 'queued',
+            'params': params,
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None,
+            'stages': {},
+        }
+        self.jobs[job_id] = job
+        self.queue.put_nowait(job_id)
+        self._forget_finished()
+        return job
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def _record_stage(self, name, seconds):
+        stats = self.stage_stats.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+
+    async def _restart_pool(self, broken_pool):
+        """
+        Replace a pool whose worker died (once, however many jobs noticed)
+        """
+        async with self._pool_lock:
+            if self.pool is broken_pool:
+                print("⚠️  Render worker crashed, restarting workers")
+                broken_pool.shutdown(wait=False)
+                await asyncio.get_running_loop().run_in_executor(None, self._start_pool)
+
+    async def _dispatcher(self):
+        """
+        Feed queued jobs to the pool, one at a time per dispatcher
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id = await self.queue.get()
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+            self.running += 1
+            pool = self.pool
+            try:
+                result, error, stages, counters = await loop.run_in_executor(
+                    pool, _run_render_job, job['type'], dict(job['params']))
+            except BrokenProcessPool:
+                result, error, stages, counters = None, "Render worker crashed", {}, {}
+                await self._restart_pool(pool)
+            except Exception:
+                result, error, stages, counters = None, traceback.format_exc(), {}, {}
+            finally:
+                self.running -= 1
+
+            job['finished_at'] = time.time()
+            job['result'], job['error'] = result, error
+            job['stages'] = dict(stages, queue_wait=job['started_at'] - job['submitted_at'])
+            for name, seconds in job['stages'].items():
+                self._record_stage(name, seconds)
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            if error is None:
+                job['status'] = 'done'
+                self.completed += 1
+                print(f"✅ {job['type']} {job_id} -> {result}")
+            else:
+                job['status'] = 'failed'
+                self.failed += 1
+                print(f"❌ {job['type']} {job_id} failed")
+
+    def metrics(self):
+        """
+        Queue depth, worker usage, per-stage latency, counter totals and render cache hit rate
+        """
+        hits = self.counters.get("render_cache_hits", 0)
+        misses = self.counters.get("render_cache_misses", 0)
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "running": self.running,
+            "workers": self.workers,
+            "completed": self.completed,
+            "failed": self.failed,
+            "uptime_seconds": time.time() - self.started_at,
+            "stages": {
+                name: {"calls": calls, "avg_seconds": total / calls, "max_seconds": peak}
+                for name, (calls, total, peak) in self.stage_stats.items()
+            },
+            "counters": dict(self.counters),
+            "render_cache": {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else None,
+            },
+        }
+
+    def route(self, method, path, body):
+        """
+        Handle one request: returns (HTTP status, JSON-serializable payload)
+        """
+        parts = [part for part in path.split('?')[0].split('/') if part]
+        if method == 'GET' and parts == ['health']:
+            return 200, {"status": "ok"}
+        if method == 'GET' and parts == ['metrics']:
+            return 200, self.metrics()
+        if method == 'GET' and parts == ['jobs']:
+            return 200, {"jobs": list(self.jobs.values())}
+        if method == 'GET' and len(parts) == 2 and parts[0] == 'jobs':
+            job = self.jobs.get(parts[1])
+            if job is None:
+                return 404, {"error": f"No such job: {parts[1]}"}
+            return 200, job
+        if method == 'POST' and parts == ['jobs']:
+            try:
+                request = json.loads(body or b'{}')
+                job = self.submit(request.get('type'), request.get('params', {}))
+            except (ValueError, AttributeError) as e:
+                return 400, {"error": str(e)}
+            return 202, job
+        return 404, {"error": f"Not found: {method} {path}"}
+
+    async def handle_connection(self, reader, writer):
+        """
+        Minimal HTTP/1.1 handler: one request per connection
+        """
+        try:
+            request_line = await reader.readline()
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_BYTES:
+                status, payload = 413, {"error": "Request body too large"}
+            else:
+                body = await reader.readexactly(length) if length else b''
+                status, payload = self.route(method.upper(), path, body)
+        except (ValueError, asyncio.IncompleteReadError):
+            status, payload = 400, {"error": "Malformed request"}
+
+        data = json.dumps(payload, default=str).encode('utf-8')
+        reason = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+                  413: 'Payload Too Large'}.get(status, 'OK')
+        writer.write(f"HTTP/1.1 {status} {reason}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n"
+                     f"Connection: close\r\n\r\n".encode('latin-1') + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, unix_socket=None):
+        """
+        Start the workers and serve requests until cancelled
+        """
+        print(f"🔥 Starting {self.workers} warm render workers...")
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._start_pool)
+        self.queue = asyncio.Queue()
+        self._pool_lock = asyncio.Lock()
+        dispatchers = [asyncio.create_task(self._dispatcher()) for _ in range(self.workers)]
+
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+            print(f"🎬 Render service listening on unix:{unix_socket}")
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print(f"🎬 Render service listening on http://{host}:{port}")
+
+        # Stop cleanly on Ctrl+C or SIGTERM
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            for task in dispatchers:
+                task.cancel()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            if unix_socket and os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+
+def main():
+    """Run the render service."""
+    parser = argparse.ArgumentParser(description='Local render service with warm workers')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on')
+    parser.add_argument('--unix-socket', type=str, help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, default=2, help='Number of warm worker processes')
+    parser.add_argument('--whisper-model', type=str, help='Whisper model to preload in every worker')
+
+    args = parser.parse_args()
+
+    service = RenderService(workers=args.workers, whisper_model=args.whisper_model)
+    asyncio.run(service.serve(args.host, args.port, args.unix_socket))
+    print("\nRender service stopped")
+
+if __name__ == "__main__":
+    main()
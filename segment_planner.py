@@ -0,0 +1,296 @@
+"""
+Segment Planner
+Turns a script into on-screen segments: one slide, one TTS call and one clip each.
+
+Splitting on every comma or period breaks "3.14", "e.g." or "U.S." apart and turns
+short clauses into slides shorter than a second. The planner only breaks at real
+clause boundaries, merges fragments below a minimum speaking-time budget into their
+neighbour, and splits clauses that would not fit on screen at measured line breaks.
+Segments are produced lazily, so very large scripts (or files) never have to be
+split up front.
+"""
+
+import os
+import re
+import math
+import functools
+from PIL import Image, ImageDraw, ImageFont
+
+# Clause delimiters (English and Chinese)
+_BREAK_RE = re.compile(r'[,，。.!?！？;；]+')
+
+# Words that end in a period without ending the clause (words that are also
+# ordinary sentence-final words, such as "no", are left out)
+ABBREVIATIONS = {
+    'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'vs', 'etc', 'e.g', 'i.e',
+    'inc', 'ltd', 'corp', 'fig', 'approx', 'dept', 'a.m', 'p.m',
+}
+
+# Abbreviations only when a number follows: "No. 5", but "I said no. Then..."
+NUMERAL_ABBREVIATIONS = {'no', 'nos', 'vol', 'pp'}
+
+# Marks that end a sentence; short fragments are not merged back across them
+_SENTENCE_END_RE = re.compile(r'[.。!?！？]["\')\]}”’]*$')
+
+# Characters allowed between a sentence period and the following whitespace
+_CLOSERS = '"\')]}”’'
+
+# CJK ideographs, kana, hangul and full-width forms: each one is a word of its own
+_CJK = r'⺀-鿿가-힯豈-﫿＀-￯'
+_CJK_RE = re.compile(rf'[{_CJK}]')
+_TOKEN_RE = re.compile(rf'[{_CJK}]|[^\s{_CJK}]+')
+
+_NON_SPACE_RE = re.compile(r'\S')
+
+def _is_abbreviation(word, following=''):
+    word = word.lstrip('"\'([{“‘')
+    if word.lower() in ABBREVIATIONS:
+        return True
+    if word.lower() in NUMERAL_ABBREVIATIONS and following.isdigit():
+        return True
+    # Initials and dotted acronyms: "J.", "U.S.", "Ph.D."
+    if re.fullmatch(r'[A-HJ-Z]|(?:[A-Za-z]{1,2}\.)+[A-Za-z]{1,2}', word):
+        return True
+    return False
+
+# Characters that end the word before a period
+_WORD_STOPS = set(',，。!?！？;；')
+
+def _word_before(text, offset):
+    start = offset
+    while start > 0 and not text[start - 1].isspace() and text[start - 1] not in _WORD_STOPS:
+        start -= 1
+    return text[start:offset]
+
+def _is_break(text, match, following=''):
+    """
+    Whether a run of delimiters ends a clause (decimals, thousands and
+    abbreviations do not); following is the next non-space character
+    """
+    start, end = match.span()
+    mark = match.group()
+    before = text[start - 1] if start > 0 else ''
+    after = text[end] if end < len(text) else ''
+
+    if mark in ('.', ',') and before.isdigit() and after.isdigit():
+        return False
+    if mark == '.':
+        # "example.com", the first dot of "U.S."
+        if after and not after.isspace() and after not in _CLOSERS:
+            return False
+        word = _word_before(text, start)
+        if word and _is_abbreviation(word, following):
+            return False
+    return True
+
+def _clean(clause):
+    clause = re.sub(r'\s+', ' ', clause).strip()
+    # Drop delimiter-only clauses
+    return clause if _BREAK_RE.sub('', clause).strip() else ''
+
+def _clause_ends(text, start, final):
+    """
+    End offsets of the clauses whose delimiters lie in text[start:]; closing
+    quotes and brackets after a break stay with their clause. Unless final, stop
+    where the text after a delimiter is needed to decide.
+
+    Returns:
+    (clause end offsets, offset to resume scanning from once more text arrives)
+    """
+    ends = []
+    for match in _BREAK_RE.finditer(text, start):
+        end = match.end()
+        while end < len(text) and text[end] in _CLOSERS:
+            end += 1
+        following = _NON_SPACE_RE.search(text, end)
+        # The next non-space character decides; wait for more text
+        if following is None and not final:
+            return ends, match.start()
+        if _is_break(text, match, following.group() if following else ''):
+            ends.append(end)
+    return ends, len(text)
+
+def iter_clauses(chunks):
+    """
+    Yield clauses (with their trailing punctuation) from a string or an
+    iterable of text chunks, such as an open file
+    """
+    if isinstance(chunks, str):
+        chunks = [chunks]
+
+    # Text before `scan` holds no undecided delimiters, so it is not scanned again
+    buffer = ""
+    scan = 0
+    for chunk in chunks:
+        buffer += chunk
+        ends, scan = _clause_ends(buffer, scan, final=False)
+        consumed = 0
+        for end in ends:
+            clause = _clean(buffer[consumed:end])
+            if clause:
+                yield clause
+            consumed = end
+        buffer = buffer[consumed:]
+        scan -= consumed
+
+    ends, _ = _clause_ends(buffer, scan, final=True)
+    consumed = 0
+    for end in ends:
+        clause = _clean(buffer[consumed:end])
+        if clause:
+            yield clause
+        consumed = end
+    clause = _clean(buffer[consumed:])
+    if clause:
+        yield clause
+
+def _join(left, right):
+    """
+    Join two pieces of text, without a space where either side is CJK
+    """
+    if not left:
+        return right
+    if _CJK_RE.match(left[-1]) or _CJK_RE.match(right[0]):
+        return left + right
+    return left + " " + right
+
+@functools.lru_cache(maxsize=None)
+def load_text_font(font_size=48):
+    """
+    Font used for segment text (loaded once per size)
+    """
+    try:
+        return ImageFont.truetype("arial.ttf", font_size)
+    except:
+        try:
+            return ImageFont.truetype("simhei.ttf", font_size)
+        except:
+            return ImageFont.load_default()
+
+def font_identity(font):
+    """
+    JSON-serializable identity of a PIL font, e.g. for cache keys
+
+    The built-in default font of recent Pillow versions is loaded from memory
+    (its path is a BytesIO), so it is identified by name and size instead.
+    """
+    path = getattr(font, 'path', None)
+    if isinstance(path, (str, os.PathLike)):
+        return [os.fspath(path), getattr(font, 'size', None)]
+    if hasattr(font, 'getname'):
+        return [*font.getname(), getattr(font, 'size', None)]
+    return type(font).__name__
+
+def font_measure(font):
+    """
+    Text width function for a PIL font, as used by the renderer's wrap_text
+    """
+    draw = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+
+    def measure(text):
+        bbox = draw.textbbox((0, 0), text, font=font)
+        return bbox[2] - bbox[0]
+    return measure
+
+class SegmentPlanner:
+    """
+    Plans on-screen segments from script text
+
+    Args:
+    measure: Function text -> rendered width in pixels (defaults to character count)
+    max_width: Width available for a line of text (pixels, or characters without measure)
+    max_lines: Lines that fit on screen; longer clauses are split
+    min_seconds: Segments estimated to be spoken faster than this are merged
+    min_chars: Segments shorter than this many characters are merged
+    words_per_second: Speaking rate used to estimate durations
+    cjk_chars_per_second: Speaking rate for CJK text, in characters
+    """
+
+    def __init__(self, measure=None, max_width=40, max_lines=4, min_seconds=1.2, min_chars=0,
+                 words_per_second=2.5, cjk_chars_per_second=4.0):
+        self.measure = measure or len
+        self.max_width = max_width
+        self.max_lines = max_lines
+        self.min_seconds = min_seconds
+        self.min_chars = min_chars
+        self.words_per_second = words_per_second
+        self.cjk_chars_per_second = cjk_chars_per_second
+
+    def estimate_seconds(self, text):
+        """
+        Rough speaking time of a segment
+        """
+        text = _BREAK_RE.sub(' ', text)
+        cjk = len(_CJK_RE.findall(text))
+        words = len(_TOKEN_RE.findall(text)) - cjk
+        return words / self.words_per_second + cjk / self.cjk_chars_per_second
+
+    def is_short(self, text):
+        return len(text) < self.min_chars or self.estimate_seconds(text) < self.min_seconds
+
+    def wrap(self, text):
+        """
+        Greedy line fit of text, as lists of tokens per line
+        """
+        lines = []
+        line, line_text = [], ""
+        for token in _TOKEN_RE.findall(text):
+            candidate = _join(line_text, token)
+            if line and self.measure(candidate) > self.max_width:
+                lines.append(line)
+                line, line_text = [token], token
+            else:
+                line.append(token)
+                line_text = candidate
+        if line:
+            lines.append(line)
+        return lines
+
+    def fits(self, text):
+        return len(self.wrap(text)) <= self.max_lines
+
+    def split_overlong(self, clause):
+        """
+        Split a clause that needs more than max_lines lines into evenly filled pieces
+        """
+        lines = self.wrap(clause)
+        if len(lines) <= self.max_lines:
+            yield clause
+            return
+        pieces = math.ceil(len(lines) / self.max_lines)
+        per_piece = math.ceil(len(lines) / pieces)
+        for i in range(0, len(lines), per_piece):
+            piece = ""
+            for line in lines[i:i + per_piece]:
+                for token in line:
+                    piece = _join(piece, token)
+            yield piece
+
+    def plan(self, script):
+        """
+        Yield segments for a script (a string or an iterable of text chunks)
+        """
+        pending = None
+        for clause in iter_clauses(script):
+            for piece in self.split_overlong(clause):
+                if pending is None:
+                    pending = piece
+                    continue
+                merged = _join(pending, piece)
+                # Short fragments join the following text, or the preceding text
+                # of the same sentence
+                short = self.is_short(pending) or (
+                    self.is_short(piece) and not _SENTENCE_END_RE.search(pending))
+                if short and self.fits(merged):
+                    pending = merged
+                else:
+                    yield pending
+                    pending = piece
+        if pending is not None:
+            yield pending
+
+def script_planner(video_width):
+    """
+    Segment planner measuring lines with the text font, as wrapped on a frame of this width
+    """
+    return SegmentPlanner(font_measure(load_text_font()), video_width - 100)
@@ -1,97 +1,527 @@
 import os
+import functools
 from moviepy.editor import *
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageOps
 import numpy as np
 import re
-try:
-    import pyttsx3
-except ImportError:
-    print("pyttsx3 not installed. Install with: pip install pyttsx3")
-    pyttsx3 = None
-
-try:
-    from gtts import gTTS
-    import tempfile
-except ImportError:
-    print("gTTS not installed. Install with: pip install gtts")
-    gTTS = None
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import nullcontext
+from moviepy.audio.AudioClip import AudioArrayClip
+from moviepy.config import get_setting
+from audio_io import AUDIO_FPS, decode_audio_file
+from audio_processing import TARGET_LUFS, normalize_segments
+from timeline import Timeline
+from segment_planner import font_identity, load_text_font, script_planner
+from profiling import profiler
+from lazy_clips import (FramePrefetcher, FrameLRU, LazyTextClip, pin_repeated_frames,
+                        report_frame_dedup, unpin_frames)
+from text_overlay import TextOverlayClip, TextSprite, is_video_background, require_image_background
+from checkpoint import RenderCheckpoint, timeline_digest
+from render_cache import default_render_cache
+from workspace import check_pcm_container, with_workspace, workspace_dir, write_audiofile, write_videofile
 
+# TTS backends are imported on first use (pyttsx3 probes the system speech engines,
+# gTTS pulls in requests), so importing this module stays cheap
+_NOT_LOADED = object()
+pyttsx3 = _NOT_LOADED
+gTTS = _NOT_LOADED
+
+def load_tts_backends():
+    """
+    Import pyttsx3 and gTTS once; backends that are not installed become None
+    
+    Returns:
+    (pyttsx3 module or None, gTTS class or None)
+    """
+    global pyttsx3, gTTS
+    if pyttsx3 is _NOT_LOADED:
+        try:
+            import pyttsx3 as pyttsx3_module
+            pyttsx3 = pyttsx3_module
+        except ImportError:
+            print("pyttsx3 not installed. Install with: pip install pyttsx3")
+            pyttsx3 = None
+    if gTTS is _NOT_LOADED:
+        try:
+            from gtts import gTTS as gtts_class
+            gTTS = gtts_class
+        except ImportError:
+            print("gTTS not installed. Install with: pip install gtts")
+            gTTS = None
+    return pyttsx3, gTTS
+
+# Named output sizes for the renditions option
+RENDITIONS = {
+    '1080p': (1920, 1080),
+    '720p': (1280, 720),
+    'vertical': (1080, 1920),
+}
+
+# Short side of the frame the text layout is designed for; other sizes scale it
+LAYOUT_SHORT_SIDE = 720
+
+@profiler.profiled("create_text_video_with_audio")
+@with_workspace
 def create_text_video_with_audio(script_text, background_image_path, output_path="output_video.mp4", 
-                                use_gtts=True, language='en', speech_rate=150):
+                                use_gtts=True, language='en', speech_rate=150,
+                                workspace=None, pcm_audio=False, renditions=None, checkpoint_dir=None,
+                                render_cache=True, normalize_audio=True, render_workers=None,
+                                render_backend="process"):
     """
     Create a video that displays text segments separated by commas with a background image and synchronized audio
     
     Args:
     script_text: Text content to display (string)
-    background_image_path: Path to background image
+    background_image_path: Path to background image, or to a video (.mp4, .mov, ...)
+                           that is looped behind the text
     output_path: Output video file path
     use_gtts: Use Google Text-to-Speech (True) or pyttsx3 (False)
     language: Language code for TTS ('en', 'es', 'fr', etc.)
     speech_rate: Speech rate (words per minute) for pyttsx3
+    workspace: JobWorkspace for intermediate files (a temporary one is created if omitted)
+    pcm_audio: Keep the narration as uncompressed PCM instead of encoding AAC
+               (output_path must be .mov or .mkv)
+    renditions: Output sizes, as names from RENDITIONS and/or (width, height) tuples.
+                TTS, segment planning and the narration encode are shared; each
+                rendition is written to output_path with a "_<name>" suffix and a
+                dict of rendition name -> path is returned.
+    checkpoint_dir: Keep TTS audio, the narration track and encoded video chunks in this
+                    directory as they finish; a failed render is continued with
+                    checkpoint.resume_render(checkpoint_dir)
+    render_cache: Reuse the output of an identical earlier job from the render cache
+                  (see render_cache.py), and store this job's output in it
+    normalize_audio: Trim silence around each TTS segment and bring it to TARGET_LUFS
+                     before the timeline is laid out
+    render_workers: Workers rendering segment frames ahead of the encoder (defaults to
+                    the CPU count)
+    render_backend: "process" (worker processes writing frames to shared memory) or
+                    "thread" (no process start-up; scales as far as Pillow releases the GIL)
     """
     
     # Set video parameters
-    video_width = 1280
-    video_height = 720
+    outputs = resolve_renditions(renditions, output_path)
+    paths = [path for _, path, _, _ in outputs]
+    result = {name: path for name, path, _, _ in outputs} if renditions is not None else output_path
     fps = 24
+    if pcm_audio:
+        for path in paths:
+            check_pcm_container(path)
+    
+    # An identical earlier job is answered from the render cache
+    cache_key = None
+    if render_cache:
+        offline_tts, google_tts = load_tts_backends()
+        cache_key = default_render_cache.fingerprint('text_video', dict(
+            script_text=script_text, sizes=[(width, height) for _, _, width, height in outputs],
+            crop=renditions is not None, tts_engine='gtts' if use_gtts and google_tts else 'pyttsx3',
+            language=language, speech_rate=speech_rate, pcm_audio=pcm_audio,
+            loudness=TARGET_LUFS if normalize_audio else None,
+            font=font_identity(load_text_font())),
+            files={'background': background_image_path}, outputs=paths)
+    if default_render_cache.fetch(cache_key, paths):
+        return result
     
-    # Split text by commas
-    segments = split_by_comma(script_text)
+    checkpoint = None
+    if checkpoint_dir:
+        checkpoint = RenderCheckpoint(checkpoint_dir, 'text_video', dict(
+            script_text=script_text, background_image_path=str(background_image_path),
+            output_path=str(output_path), use_gtts=use_gtts, language=language,
+            speech_rate=speech_rate, pcm_audio=pcm_audio, renditions=renditions,
+            normalize_audio=normalize_audio))
+    
+    # Split text into clauses, merging fragments and splitting overlong ones;
+    # segments are planned for the narrowest layout so they fit every rendition
+    layout_width = min(layout_size(width, height)[0] for _, _, width, height in outputs)
+    segments = list(script_planner(layout_width).plan(script_text))
     
     print(f"Total segments: {len(segments)}")
     for i, segment in enumerate(segments):
         print(f"Segment {i+1}: {segment}")
     
-    # Load background image
-    try:
-        background = Image.open(background_image_path)
-        # Resize background image
-        background = background.resize((video_width, video_height), Image.Resampling.LANCZOS)
-        background_array = np.array(background)
-    except Exception as e:
-        print(f"Cannot load background image: {e}")
-        # If image loading fails, create a solid color background
-        background_array = np.full((video_height, video_width, 3), [50, 50, 50], dtype=np.uint8)
+    # Load background image (cropped to fill each rendition's aspect ratio); video
+    # backgrounds are decoded while encoding, with text sprites blended on top
+    video_background = is_video_background(background_image_path)
+    if not video_background:
+        backgrounds = [load_background_array(background_image_path, width, height, crop=renditions is not None)
+                       for _, _, width, height in outputs]
     
-    # Generate audio for each segment
-    audio_clips = []
-    video_clips = []
+    # Generate audio for all segments (batched for the offline engine)
+    with profiler.span("tts"):
+        synthesized = generate_audio_arrays(segments, use_gtts, language, speech_rate,
+                                            workspace=workspace, checkpoint=checkpoint,
+                                            normalize=normalize_audio)
+    profiler.count("segments", len(segments))
+    timeline = Timeline(fps, AUDIO_FPS)
+    has_audio = False
+    fallbacks = 0
+    digest_segments = []
+    video_clips = [[] for _ in outputs]
+    frame_caches = [FrameLRU() for _ in outputs]
     
-    for i, segment in enumerate(segments):
+    for i, (segment, audio_array) in enumerate(zip(segments, synthesized)):
         print(f"Processing segment {i+1}: {segment[:30]}...")
         
-        # Generate audio for this segment
-        audio_clip = generate_audio_clip(segment, use_gtts, language, speech_rate)
-        
-        if audio_clip is None:
+        if audio_array is None:
             print(f"Failed to generate audio for segment {i+1}, using 2 second duration")
-            segment_duration = 2.0
+            audio_array = silence_array(2.0)
+            # Outputs with missing narration are not cached
+            cache_key = None
+            fallbacks += 1
         else:
-            segment_duration = audio_clip.duration
-            audio_clips.append(audio_clip)
+            has_audio = True
         
-        # Create text clip with duration matching audio
-        text_clip = create_text_clip(segment, background_array, video_width, video_height)
-        text_clip = text_clip.set_duration(segment_duration)
+        # Snap the segment to frame boundaries; the audio is padded to match
+        entry = timeline.add(segment, audio_array)
+        digest_segments.append((segment, entry.n_frames, audio_array))
         
-        video_clips.append(text_clip)
+        # Create text clips with duration matching audio; frames are rendered during export
+        if not video_background:
+            for (_, _, width, height), background_array, clips, frame_cache in zip(
+                    outputs, backgrounds, video_clips, frame_caches):
+                clips.append(LazyTextClip(segment, background_array, width, height,
+                                          render_text_frame, duration=entry.duration, cache=frame_cache))
     
-    # Concatenate all video clips
-    final_video = concatenate_videoclips(video_clips)
+    prefetchers = [None] * len(outputs)
+    if video_background:
+        videos = [TextOverlayClip(timeline, background_image_path, width, height, render_text_sprite,
+                                  crop=renditions is not None)
+                  for _, _, width, height in outputs]
+    else:
+        # Identical segments share one rendered frame
+        for clips, frame_cache in zip(video_clips, frame_caches):
+            pin_repeated_frames(clips, frame_cache)
+        # Upcoming segments' frames render on a worker pool while the encoder runs
+        prefetchers = [FramePrefetcher(clips, render_workers, backend=render_backend)
+                       for clips in video_clips]
+        # Concatenate all video clips
+        videos = [concatenate_videoclips(clips) for clips in video_clips]
+    profiler.count("frames", timeline.total_frames * len(outputs))
     
-    # Concatenate all audio clips if available
-    if audio_clips:
-        final_audio = concatenate_audioclips(audio_clips)
-        final_video = final_video.set_audio(final_audio)
+    # Build the narration track from in-memory arrays if any audio was generated
+    final_audio = None
+    if has_audio:
+        with profiler.span("audio_mix"):
+            final_audio = build_narration_clip(timeline)
+    
+    # Stored chunks and narration are only reused for the same timeline and background
+    if checkpoint is not None:
+        checkpoint.use_timeline(timeline_digest(
+            digest_segments, files={'background': background_image_path},
+            fps=fps, font=font_identity(load_text_font())))
+    
+    # Renditions share one encoded narration track, muxed into each output;
+    # a checkpointed render keeps it for resuming, unless TTS fell back to silence
+    # (a later attempt may synthesize the missing segments)
+    audio = True
+    if final_audio is not None and (len(outputs) > 1 or checkpoint is not None):
+        audio = checkpoint.stored_file("narration") if checkpoint is not None else None
+        if audio is None:
+            with profiler.span("encode"):
+                audio = write_audiofile(final_audio, workspace, pcm_audio=pcm_audio,
+                                        fps=AUDIO_FPS, codec='aac')
+            if checkpoint is not None and not fallbacks:
+                audio = checkpoint.store_file("narration", audio)
     
     # Export video
     print("Starting video export...")
-    final_video.write_videofile(
-        output_path,
-        fps=fps,
-        codec='libx264',
-        audio_codec='aac'
-    )
+    for (name, path, width, height), final_video, prefetcher, clips, frame_cache in zip(
+            outputs, videos, prefetchers, video_clips, frame_caches):
+        # The prefetcher's workers and buffers are released even if encoding fails
+        with prefetcher or nullcontext(), profiler.span("encode"):
+            if checkpoint is not None:
+                # Encoded in chunks; chunks finished by an earlier attempt are reused
+                checkpoint.write_video(final_video, path, fps,
+                                       audio_path=audio if final_audio is not None else None,
+                                       label=name or "video")
+            else:
+                if final_audio is not None:
+                    final_video = final_video.set_audio(final_audio)
+                write_videofile(
+                    final_video,
+                    path,
+                    workspace,
+                    pcm_audio=pcm_audio,
+                    audio=audio,
+                    fps=fps,
+                    codec='libx264',
+                    audio_codec='aac'
+                )
+        final_video.close()
+        unpin_frames(clips, frame_cache)
+        report_frame_dedup(clips)
+        profiler.count("bytes_written", os.path.getsize(path))
+        print(f"Video with audio saved to: {path}")
+    
+    default_render_cache.store(cache_key, paths)
+    if checkpoint is not None:
+        checkpoint.finish(result)
+    return result
+
+def resolve_renditions(renditions, output_path):
+    """
+    (name, path, width, height) of every output of a render
+    
+    Args:
+    renditions: Names from RENDITIONS and/or (width, height) tuples; None for a single 1280x720 video
+    output_path: Output path; renditions get a "_<name>" suffix
+    """
+    if renditions is None:
+        return [(None, output_path, 1280, 720)]
+    if not renditions:
+        raise ValueError("renditions must name at least one output size")
+    
+    base, ext = os.path.splitext(output_path)
+    outputs = []
+    for rendition in renditions:
+        if isinstance(rendition, str):
+            if rendition not in RENDITIONS:
+                raise ValueError(f"Unknown rendition: {rendition}")
+            name = rendition
+            width, height = RENDITIONS[rendition]
+        else:
+            width, height = rendition
+            name = f"{width}x{height}"
+        outputs.append((name, f"{base}_{name}{ext}", width, height))
+    return outputs
+
+@profiler.profiled("create_text_video_with_audio_streaming")
+@with_workspace
+def create_text_video_with_audio_streaming(script_text, background_image_path, output_path="output_video.mp4",
+                                          use_gtts=True, language='en', speech_rate=150,
+                                          audio_fps=AUDIO_FPS, lookahead=4, workspace=None,
+                                          normalize_audio=True):
+    """
+    Streaming variant of create_text_video_with_audio.
+    
+    TTS synthesis, frame rendering and encoding run as concurrent stages connected
+    by queues, feeding raw frames and PCM into one long-running ffmpeg process.
+    Output starts appearing as soon as the first segment is synthesized, and total
+    time approaches the slowest stage instead of the sum of all stages.
+    
+    Args:
+    script_text: Text content to display (string)
+    background_image_path: Path to background image
+    output_path: Output video file path
+    use_gtts: Use Google Text-to-Speech (True) or pyttsx3 (False)
+    language: Language code for TTS ('en', 'es', 'fr', etc.)
+    speech_rate: Speech rate (words per minute) for pyttsx3
+    audio_fps: Sample rate of the narration track
+    lookahead: Number of rendered segment frames allowed to wait for the encoder
+    workspace: JobWorkspace for intermediate files (a temporary one is created if omitted)
+    normalize_audio: Trim silence around each TTS segment and bring it to TARGET_LUFS
+    """
+    
+    # Set video parameters
+    video_width = 1280
+    video_height = 720
+    fps = 24
+    
+    require_image_background(background_image_path, "create_text_video_with_audio_streaming")
+    
+    # Segments are planned once (a file or iterator script can only be read once);
+    # the segment texts are small next to the audio and frames streamed per segment
+    segments = list(script_planner(video_width).plan(script_text))
+    
+    # Load background image
+    background_array = load_background_array(background_image_path, video_width, video_height)
+    
+    # Queues between stages; None marks the end of a stream. Audio is placed on the
+    # timeline and queued as soon as it is synthesized, independently of rendering,
+    # so ffmpeg can never stall waiting for audio while the renderer is blocked on
+    # a full video queue. Only rendered frames (the large items) are bounded.
+    tts_queue = queue.Queue()
+    video_queue = queue.Queue(maxsize=lookahead)
+    audio_queue = queue.Queue()
+    errors = []
+    # Set when any stage fails (or ffmpeg exits), so no stage waits on a dead one
+    stop = threading.Event()
+    encoder = None
+    
+    def fail(e):
+        errors.append(e)
+        stop.set()
+    
+    def put(q, item):
+        # Returns False if the pipeline stopped before the item could be queued
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if stop.is_set() or encoder.poll() is not None:
+                    stop.set()
+                    return False
+    
+    def get(q):
+        # Next item, or None once the stream ends or the pipeline stopped
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+    
+    def drain(q):
+        # Drop queued items so producers are never left blocked on a full queue
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                return
+    
+    timeline = Timeline(fps, audio_fps, keep_audio=False)
+    
+    # Only repeated segments' audio and frames are remembered, so memory stays bounded
+    counts = {}
+    for segment in segments:
+        counts[segment] = counts.get(segment, 0) + 1
+    repeated = {segment for segment, count in counts.items() if count > 1}
+    print(f"Total segments: {len(segments)}")
+    
+    def synthesize():
+        shared_audio = {}
+        try:
+            for i, segment in enumerate(segments):
+                if stop.is_set():
+                    break
+                samples = shared_audio.get(segment)
+                if samples is not None:
+                    profiler.count("tts_deduplicated")
+                else:
+                    print(f"Synthesizing segment {i+1}: {segment[:30]}...")
+                    with profiler.span("tts"):
+                        samples = generate_audio_array(segment, use_gtts, language, speech_rate,
+                                                       audio_fps, workspace)
+                    if samples is None:
+                        print(f"Failed to generate audio for segment {i+1}, using 2 second duration")
+                        samples = silence_array(2.0, audio_fps)
+                    elif normalize_audio:
+                        with profiler.span("audio_process"):
+                            samples = normalize_segments([samples], audio_fps)[0]
+                    if segment in repeated:
+                        shared_audio[segment] = samples
+                
+                # Snap to frame boundaries so the audio and video streams never drift
+                entry = timeline.add(segment, samples)
+                audio_queue.put(timeline.pad_audio(entry, samples).tobytes())
+                tts_queue.put((segment, entry.n_frames))
+        except Exception as e:
+            fail(e)
+        finally:
+            audio_queue.put(None)
+            tts_queue.put(None)
+    
+    def render():
+        shared_frames = {}
+        try:
+            while True:
+                item = get(tts_queue)
+                if item is None:
+                    break
+                segment, n_frames = item
+                
+                frame_bytes = shared_frames.get(segment)
+                if frame_bytes is None:
+                    frame = render_text_frame(segment, background_array, video_width, video_height)
+                    frame_bytes = frame.tobytes()
+                    if segment in repeated:
+                        shared_frames[segment] = frame_bytes
+                else:
+                    profiler.count("frames_deduplicated")
+                if not put(video_queue, (frame_bytes, n_frames)):
+                    break
+                profiler.count("segments")
+                profiler.count("frames", n_frames)
+        except Exception as e:
+            fail(e)
+        finally:
+            put(video_queue, None)
+    
+    def write_video(pipe):
+        try:
+            while True:
+                item = get(video_queue)
+                if item is None:
+                    break
+                frame_bytes, n_frames = item
+                with profiler.span("encode"):
+                    for _ in range(n_frames):
+                        pipe.write(frame_bytes)
+        except Exception as e:
+            fail(e)
+            drain(video_queue)
+        finally:
+            pipe.close()
+    
+    def write_audio(pipe):
+        try:
+            while True:
+                pcm = get(audio_queue)
+                if pcm is None:
+                    break
+                pipe.write(pcm)
+        except Exception as e:
+            fail(e)
+            drain(audio_queue)
+        finally:
+            pipe.close()
+    
+    video_input = [
+        '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{video_width}x{video_height}',
+        '-r', str(fps), '-i', 'pipe:0',
+    ]
+    audio_format = ['-f', 'f32le', '-ar', str(audio_fps), '-ac', '2']
+    video_codec = ['-c:v', 'libx264', '-pix_fmt', 'yuv420p']
+    print("Starting streaming video export...")
+    
+    # Audio is passed to ffmpeg through an extra pipe. Windows cannot hand extra file
+    # descriptors to a child process, so there the PCM is spooled to a file instead
+    # and muxed into the streamed video afterwards.
+    spool_audio = os.name == 'nt'
+    if spool_audio:
+        audio_path = workspace.temp_file(suffix='.f32', prefix='audio_')
+        video_path = workspace.temp_file(suffix='.mp4', prefix='video_')
+        cmd = [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error',
+               *video_input, *video_codec, video_path]
+        encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        audio_pipe = open(audio_path, 'wb')
+    else:
+        audio_read_fd, audio_write_fd = os.pipe()
+        cmd = [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error',
+               *video_input, *audio_format, '-i', f'pipe:{audio_read_fd}',
+               *video_codec, '-c:a', 'aac', output_path]
+        encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE, pass_fds=(audio_read_fd,))
+        os.close(audio_read_fd)
+        audio_pipe = os.fdopen(audio_write_fd, 'wb')
+    
+    threads = [
+        threading.Thread(target=profiler.bind(synthesize), daemon=True),
+        threading.Thread(target=profiler.bind(render), daemon=True),
+        threading.Thread(target=profiler.bind(write_video), args=(encoder.stdin,), daemon=True),
+        threading.Thread(target=profiler.bind(write_audio), args=(audio_pipe,), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    with profiler.span("encode"):
+        return_code = encoder.wait()
+    if errors:
+        raise errors[0]
+    if return_code != 0:
+        raise IOError(f"ffmpeg exited with code {return_code} while writing {output_path}")
+    if spool_audio:
+        with profiler.span("encode"):
+            cmd = [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error', '-i', video_path,
+                   *audio_format, '-i', audio_path, '-c:v', 'copy', '-c:a', 'aac', output_path]
+            if subprocess.run(cmd).returncode != 0:
+                raise IOError(f"ffmpeg could not mux the narration into {output_path}")
+    profiler.count("bytes_written", os.path.getsize(output_path))
     
     print(f"Video with audio saved to: {output_path}")
     return output_path
@@ -99,12 +529,28 @@ def create_text_video_with_audio(script_text, background_image_path, output_path
 def generate_audio_clip(text, use_gtts=True, language='en', speech_rate=150):
     """
     Generate audio clip from text using either Google TTS or pyttsx3
+    
+    The clip is backed by an in-memory array, so no ffmpeg reader stays open.
+    """
+    audio_array = generate_audio_array(text, use_gtts, language, speech_rate)
+    if audio_array is None:
+        return None
+    return AudioArrayClip(audio_array, fps=AUDIO_FPS)
+
+def generate_audio_array(text, use_gtts=True, language='en', speech_rate=150, fps=AUDIO_FPS,
+                         workspace=None):
+    """
+    Generate audio from text using either Google TTS or pyttsx3
+    
+    Returns:
+    float32 array of shape (samples, 2) at the given sample rate, or None on failure
     """
+    offline_tts, google_tts = load_tts_backends()
     try:
-        if use_gtts and gTTS:
-            return generate_gtts_audio(text, language)
-        elif pyttsx3:
-            return generate_pyttsx3_audio(text, speech_rate)
+        if use_gtts and google_tts:
+            return generate_gtts_audio(text, language, fps, workspace)
+        elif offline_tts:
+            return generate_pyttsx3_audio(text, speech_rate, fps, workspace)
         else:
             print("No TTS engine available")
             return None
@@ -112,79 +558,219 @@ def generate_audio_clip(text, use_gtts=True, language='en', speech_rate=150):
         print(f"Error generating audio: {e}")
         return None
 
-def generate_gtts_audio(text, language='en'):
+def generate_audio_arrays(texts, use_gtts=True, language='en', speech_rate=150, fps=AUDIO_FPS,
+                          workspace=None, checkpoint=None, normalize=False):
     """
-    Generate audio using Google Text-to-Speech
+    Generate audio arrays for many texts at once
+    
+    Repeated texts are synthesized once and share the same array, and the offline
+    engine synthesizes the whole batch in a single runAndWait() call.
+    Failed entries are None. With a RenderCheckpoint, audio stored by an earlier
+    attempt is reused and new audio is stored as soon as it is synthesized.
+    With normalize, all segments are silence-trimmed and loudness-normalized
+    together afterwards (the checkpoint keeps the unprocessed audio).
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    saved = len(texts) - len(unique_texts)
+    if saved:
+        print(f"Reusing audio for {saved} repeated segments")
+        profiler.count("tts_deduplicated", saved)
+    
+    by_text = {}
+    if checkpoint is not None:
+        for text in unique_texts:
+            audio_array = checkpoint.load_audio(text)
+            if audio_array is not None:
+                by_text[text] = audio_array
+        if by_text:
+            print(f"Reusing checkpointed audio for {len(by_text)} segments")
+    pending = [text for text in unique_texts if text not in by_text]
+    
+    def store(text, audio_array):
+        by_text[text] = audio_array
+        if checkpoint is not None and audio_array is not None:
+            checkpoint.save_audio(text, audio_array)
+    
+    offline_tts, google_tts = load_tts_backends() if pending else (None, None)
+    if pending and not (use_gtts and google_tts) and offline_tts:
+        try:
+            audio_arrays = get_offline_tts_session(speech_rate).synthesize_batch(pending, fps,
+                                                                                 workspace)
+        except Exception as e:
+            print(f"Error with pyttsx3: {e}")
+            audio_arrays = [None] * len(pending)
+        for text, audio_array in zip(pending, audio_arrays):
+            store(text, audio_array)
+    else:
+        for text in pending:
+            store(text, generate_audio_array(text, use_gtts, language, speech_rate, fps, workspace))
+    
+    if normalize:
+        with profiler.span("audio_process"):
+            processed = normalize_segments([by_text[text] for text in unique_texts], fps)
+        by_text = dict(zip(unique_texts, processed))
+    
+    return [by_text[text] for text in texts]
+
+def generate_gtts_audio(text, language='en', fps=AUDIO_FPS, workspace=None):
     """
+    Generate audio using Google Text-to-Speech and decode it into an array
+    """
+    temp_audio_path = None
     try:
         # Create temporary file for audio
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3',
+                                         dir=workspace_dir(workspace)) as tmp_file:
             temp_audio_path = tmp_file.name
         
         # Generate speech
-        tts = gTTS(text=text, lang=language, slow=False)
+        tts = load_tts_backends()[1](text=text, lang=language, slow=False)
         tts.save(temp_audio_path)
         
-        # Load as AudioFileClip
-        audio_clip = AudioFileClip(temp_audio_path)
-        
-        # Clean up temporary file
-        os.unlink(temp_audio_path)
-        
-        return audio_clip
+        return decode_audio_file(temp_audio_path, fps)
         
     except Exception as e:
         print(f"Error with Google TTS: {e}")
         return None
+    finally:
+        # Clean up temporary file once it has been fully decoded
+        if temp_audio_path and os.path.exists(temp_audio_path):
+            os.unlink(temp_audio_path)
 
-def generate_pyttsx3_audio(text, speech_rate=150):
+def generate_pyttsx3_audio(text, speech_rate=150, fps=AUDIO_FPS, workspace=None):
     """
-    Generate audio using pyttsx3 (offline TTS)
+    Generate audio using pyttsx3 (offline TTS) and decode it into an array
     """
     try:
-        # Create temporary file for audio
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp_file:
-            temp_audio_path = tmp_file.name
-        
-        # Initialize TTS engine
-        engine = pyttsx3.init()
-        
-        # Set speech rate
-        engine.setProperty('rate', speech_rate)
-        
-        # Set voice (optional - you can customize this)
-        voices = engine.getProperty('voices')
-        if voices:
-            engine.setProperty('voice', voices[0].id)  # Use first available voice
-        
-        # Save to file
-        engine.save_to_file(text, temp_audio_path)
-        engine.runAndWait()
-        
-        # Load as AudioFileClip
-        audio_clip = AudioFileClip(temp_audio_path)
-        
-        # Clean up temporary file
-        os.unlink(temp_audio_path)
-        
-        return audio_clip
-        
+        return get_offline_tts_session(speech_rate).synthesize(text, fps, workspace)
     except Exception as e:
         print(f"Error with pyttsx3: {e}")
         return None
 
+class OfflineTTSSession:
+    """
+    Offline TTS session holding one pyttsx3 engine per process.
+    
+    Voice and rate are configured once; segments are queued with save_to_file
+    and drained together by a single runAndWait() call.
+    """
+    
+    # The engine is expensive to start, so it is shared by all sessions in a process
+    _engine = None
+    
+    def __init__(self, speech_rate=150, voice_id=None):
+        """
+        Args:
+        speech_rate: Speech rate (words per minute)
+        voice_id: pyttsx3 voice id, defaults to the first available voice
+        """
+        if OfflineTTSSession._engine is None:
+            OfflineTTSSession._engine = load_tts_backends()[0].init()
+        self.engine = OfflineTTSSession._engine
+        self.speech_rate = None
+        self.voice_id = None
+        self.configure(speech_rate, voice_id)
+    
+    def configure(self, speech_rate=None, voice_id=None):
+        """
+        Set speech rate and voice, only touching the engine when they change
+        """
+        if speech_rate is not None and speech_rate != self.speech_rate:
+            self.engine.setProperty('rate', speech_rate)
+            self.speech_rate = speech_rate
+        
+        if voice_id is None and self.voice_id is None:
+            voices = self.engine.getProperty('voices')
+            if voices:
+                voice_id = voices[0].id  # Use first available voice
+        if voice_id is not None and voice_id != self.voice_id:
+            self.engine.setProperty('voice', voice_id)
+            self.voice_id = voice_id
+    
+    def synthesize_batch(self, texts, fps=AUDIO_FPS, workspace=None):
+        """
+        Synthesize all texts in one engine run and decode them into arrays
+        
+        Returns:
+        List of float32 stereo arrays in input order (None for failed entries)
+        """
+        temp_dir = tempfile.mkdtemp(prefix='tts_', dir=workspace_dir(workspace))
+        try:
+            paths = []
+            for i, text in enumerate(texts):
+                path = os.path.join(temp_dir, f'segment_{i:05d}.wav')
+                self.engine.save_to_file(text, path)
+                paths.append(path)
+            self.engine.runAndWait()
+            
+            audio_arrays = []
+            for path in paths:
+                try:
+                    audio_arrays.append(decode_audio_file(path, fps))
+                except Exception as e:
+                    print(f"Error decoding offline TTS output {os.path.basename(path)}: {e}")
+                    audio_arrays.append(None)
+            return audio_arrays
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def synthesize(self, text, fps=AUDIO_FPS, workspace=None):
+        """
+        Synthesize a single text into an array
+        """
+        return self.synthesize_batch([text], fps, workspace)[0]
+
+# Offline TTS session of the current process
+_offline_tts_session = None
+
+def get_offline_tts_session(speech_rate=150, voice_id=None):
+    """
+    Return the process-wide offline TTS session, configured with the given voice settings
+    """
+    global _offline_tts_session
+    if _offline_tts_session is None:
+        _offline_tts_session = OfflineTTSSession(speech_rate, voice_id)
+    else:
+        _offline_tts_session.configure(speech_rate, voice_id)
+    return _offline_tts_session
+
+def silence_array(duration, fps=AUDIO_FPS):
+    """
+    Create a silent stereo array of the given duration in seconds
+    """
+    return np.zeros((int(round(duration * fps)), 2), dtype=np.float32)
+
+def build_narration_clip(timeline):
+    """
+    Build the narration clip from the timeline's contiguous PCM buffer
+    """
+    return AudioArrayClip(timeline.narration(), fps=timeline.audio_fps)
+
+@profiler.profiled("create_progressive_text_video_with_audio")
+@with_workspace
 def create_progressive_text_video_with_audio(script_text, background_image_path, output_path="progressive_video.mp4",
-                                           use_gtts=True, language='en', speech_rate=150):
+                                           use_gtts=True, language='en', speech_rate=150,
+                                           workspace=None, pcm_audio=False, normalize_audio=True,
+                                           render_workers=None, render_backend="process"):
     """
     Create a video with progressive text display and synchronized audio
+    
+    Intermediate files go to `workspace` (a temporary JobWorkspace if omitted).
+    With normalize_audio, TTS segments are silence-trimmed and loudness-normalized.
+    Segment frames are rendered on `render_workers` workers (default: CPU count) of
+    `render_backend` ("process" or "thread").
+    pcm_audio needs a .mov or .mkv output.
     """
+    if pcm_audio:
+        check_pcm_container(output_path)
+    require_image_background(background_image_path, "create_progressive_text_video_with_audio")
     # Set video parameters
     video_width = 1280
     video_height = 720
     fps = 24
     
-    # Split text by commas
-    segments = split_by_comma(script_text)
+    # Split text into clauses
+    segments = list(script_planner(video_width).plan(script_text))
     
     # Create cumulative display text list
     progressive_texts = []
@@ -200,53 +786,67 @@ def create_progressive_text_video_with_audio(script_text, background_image_path,
     print(f"Progressive display stages: {len(progressive_texts)}")
     
     # Load background image
-    try:
-        background = Image.open(background_image_path)
-        background = background.resize((video_width, video_height), Image.Resampling.LANCZOS)
-        background_array = np.array(background)
-    except Exception as e:
-        print(f"Cannot load background image: {e}")
-        background_array = np.full((video_height, video_width, 3), [50, 50, 50], dtype=np.uint8)
+    background_array = load_background_array(background_image_path, video_width, video_height)
     
     # Generate audio for each new segment (not cumulative)
-    audio_clips = []
+    with profiler.span("tts"):
+        synthesized = generate_audio_arrays(segments, use_gtts, language, speech_rate,
+                                            workspace=workspace, normalize=normalize_audio)
+    profiler.count("segments", len(segments))
+    timeline = Timeline(fps, AUDIO_FPS)
+    has_audio = False
     video_clips = []
+    frame_cache = FrameLRU()
     
-    for i, (segment, display_text) in enumerate(zip(segments, progressive_texts)):
+    for i, (segment, display_text, audio_array) in enumerate(zip(segments, progressive_texts, synthesized)):
         print(f"Processing stage {i+1}: {segment[:30]}...")
         
-        # Generate audio for just this segment
-        audio_clip = generate_audio_clip(segment, use_gtts, language, speech_rate)
-        
-        if audio_clip is None:
+        if audio_array is None:
             print(f"Failed to generate audio for segment {i+1}, using 2 second duration")
-            segment_duration = 2.0
+            audio_array = silence_array(2.0)
         else:
-            segment_duration = audio_clip.duration
-            audio_clips.append(audio_clip)
+            has_audio = True
+        
+        # Snap the segment to frame boundaries; the audio is padded to match
+        entry = timeline.add(segment, audio_array)
         
-        # Create text clip showing cumulative text
-        text_clip = create_text_clip(display_text, background_array, video_width, video_height)
-        text_clip = text_clip.set_duration(segment_duration)
+        # Create text clip showing cumulative text; its frame is rendered during export
+        text_clip = LazyTextClip(display_text, background_array, video_width, video_height,
+                                 render_text_frame, duration=entry.duration, cache=frame_cache)
         
         video_clips.append(text_clip)
     
+    # Identical segments share one rendered frame
+    pin_repeated_frames(video_clips, frame_cache)
+    
+    # Upcoming segments' frames render on a worker pool while the encoder runs
+    prefetcher = FramePrefetcher(video_clips, render_workers, backend=render_backend)
+    
     # Concatenate all video clips
     final_video = concatenate_videoclips(video_clips)
+    profiler.count("frames", timeline.total_frames)
     
-    # Concatenate all audio clips if available
-    if audio_clips:
-        final_audio = concatenate_audioclips(audio_clips)
+    # Build the narration track from in-memory arrays if any audio was generated
+    if has_audio:
+        with profiler.span("audio_mix"):
+            final_audio = build_narration_clip(timeline)
         final_video = final_video.set_audio(final_audio)
     
     # Export video
     print("Starting progressive video export...")
-    final_video.write_videofile(
-        output_path,
-        fps=fps,
-        codec='libx264',
-        audio_codec='aac'
-    )
+    with prefetcher, profiler.span("encode"):
+        write_videofile(
+            final_video,
+            output_path,
+            workspace,
+            pcm_audio=pcm_audio,
+            fps=fps,
+            codec='libx264',
+            audio_codec='aac'
+        )
+    unpin_frames(video_clips, frame_cache)
+    report_frame_dedup(video_clips)
+    profiler.count("bytes_written", os.path.getsize(output_path))
     
     print(f"Progressive video with audio saved to: {output_path}")
     return output_path
@@ -285,29 +885,61 @@ def split_by_comma(text):
     
     return result
 
+def load_background_array(background_image_path, width, height, crop=False):
+    """
+    Load and resize the background image, falling back to a solid color
+    
+    Resized backgrounds are cached (read-only) per file version and size, so
+    repeated renders in one process, e.g. a render service worker, load them once.
+    
+    Args:
+    crop: Scale to cover the frame and center-crop instead of stretching
+    """
+    try:
+        mtime_ns = os.stat(background_image_path).st_mtime_ns
+        return _load_background_cached(str(background_image_path), mtime_ns, width, height, crop)
+    except Exception as e:
+        print(f"Cannot load background image: {e}")
+        # If image loading fails, create a solid color background
+        return np.full((height, width, 3), [50, 50, 50], dtype=np.uint8)
+
+@functools.lru_cache(maxsize=8)
+def _load_background_cached(background_image_path, mtime_ns, width, height, crop):
+    background = Image.open(background_image_path).convert('RGB')
+    # Resize background image
+    if crop:
+        background = ImageOps.fit(background, (width, height), Image.Resampling.LANCZOS)
+    else:
+        background = background.resize((width, height), Image.Resampling.LANCZOS)
+    background_array = np.array(background)
+    background_array.setflags(write=False)
+    return background_array
+
 def create_text_clip(text, background_array, width, height):
     """
     Create a single text clip with background
     """
-    # Copy background
-    frame = background_array.copy()
+    frame_with_text = render_text_frame(text, background_array, width, height)
     
-    # Convert to PIL image for text rendering
-    img = Image.fromarray(frame)
-    draw = ImageDraw.Draw(img)
-    
-    # Set font
-    try:
-        font_size = 48
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        try:
-            font = ImageFont.truetype("simhei.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
+    # Create moviepy ImageClip
+    clip = ImageClip(frame_with_text, duration=1)
     
-    # Text wrapping
-    wrapped_text = wrap_text(text, font, width - 100)
+    return clip
+
+def render_text_frame(text, background_array, width, height):
+    """
+    Render text onto a copy of the background and return the RGB frame array
+    """
+    with profiler.span("layout"):
+        return _render_text_frame(text, background_array, width, height)
+
+def _text_placement(draw, text, width, height):
+    """
+    Wrapped text, font, position, ink bounding box and shadow offset of centered text
+    """
+    # Text wrapping (shared by all frame sizes with the same aspect ratio)
+    wrapped_text, font_size = layout_text(text, width, height)
+    font = load_text_font(font_size)
     
     # Calculate text position (center alignment)
     text_bbox = draw.multiline_textbbox((0, 0), wrapped_text, font=font)
@@ -316,9 +948,23 @@ def create_text_clip(text, background_array, width, height):
     
     x = (width - text_width) // 2
     y = (height - text_height) // 2
+    shadow_offset = max(2, round(2 * layout_scale(width, height)))
+    return wrapped_text, font, x, y, text_bbox, shadow_offset
+
+def _render_text_frame(text, background_array, width, height):
+    """
+    Draw wrapped, centered text with a shadow (untimed body of render_text_frame)
+    """
+    # Copy background
+    frame = background_array.copy()
+    
+    # Convert to PIL image for text rendering
+    img = Image.fromarray(frame)
+    draw = ImageDraw.Draw(img)
+    
+    wrapped_text, font, x, y, _, shadow_offset = _text_placement(draw, text, width, height)
     
     # Add text shadow
-    shadow_offset = 2
     draw.multiline_text((x + shadow_offset, y + shadow_offset), wrapped_text, 
                        font=font, fill=(0, 0, 0, 128), align='center')
     
@@ -326,12 +972,57 @@ def create_text_clip(text, background_array, width, height):
     draw.multiline_text((x, y), wrapped_text, font=font, fill=(255, 255, 255), align='center')
     
     # Convert back to numpy array
-    frame_with_text = np.array(img)
-    
-    # Create moviepy ImageClip
-    clip = ImageClip(frame_with_text, duration=1)
-    
-    return clip
+    return np.array(img)
+
+def render_text_sprite(text, width, height):
+    """
+    Render text and its shadow once as an RGBA sprite cropped to their bounding box
+    (same placement as render_text_frame), for blending over video backgrounds
+    """
+    with profiler.span("layout"):
+        draw = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+        wrapped_text, font, x, y, text_bbox, shadow_offset = _text_placement(draw, text, width, height)
+        
+        # Box covering the text and its shadow, clipped to the frame
+        left = max(0, x + text_bbox[0])
+        top = max(0, y + text_bbox[1])
+        right = min(width, x + text_bbox[2] + shadow_offset)
+        bottom = min(height, y + text_bbox[3] + shadow_offset)
+        
+        sprite = Image.new('RGBA', (max(1, right - left), max(1, bottom - top)), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(sprite)
+        # The shadow is opaque, as when drawn onto an RGB background
+        draw.multiline_text((x - left + shadow_offset, y - top + shadow_offset), wrapped_text,
+                            font=font, fill=(0, 0, 0, 255), align='center')
+        draw.multiline_text((x - left, y - top), wrapped_text, font=font,
+                            fill=(255, 255, 255, 255), align='center')
+        return TextSprite(np.array(sprite), left, top)
+
+def layout_scale(width, height):
+    """
+    Scale of a frame size relative to the reference layout
+    """
+    return min(width, height) / LAYOUT_SHORT_SIDE
+
+def layout_size(width, height):
+    """
+    Reference layout size with the aspect ratio of a frame (1280x720 for 16:9)
+    """
+    scale = layout_scale(width, height)
+    return round(width / scale), round(height / scale)
+
+@functools.lru_cache(maxsize=256)
+def _wrap_layout(text, layout_width):
+    return wrap_text(text, load_text_font(), layout_width - 100)
+
+def layout_text(text, width, height):
+    """
+    Wrapped text and font size for a frame size. Lines are wrapped once at the
+    reference scale and the font is scaled, so 720p and 1080p share a layout.
+    """
+    scale = layout_scale(width, height)
+    wrapped_text = _wrap_layout(text, layout_size(width, height)[0])
+    return wrapped_text, round(48 * scale)
 
 def wrap_text(text, font, max_width):
     """
@@ -1,10 +1,17 @@
 import os
 from moviepy.editor import *
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 import numpy as np
 import re
+from profiling import profiler
+from segment_planner import load_text_font, script_planner
+from text_overlay import require_image_background
+from lazy_clips import (FramePrefetcher, FrameLRU, LazyTextClip, pin_repeated_frames,
+                        report_frame_dedup, unpin_frames)
 
-def create_text_video(script_text, background_image_path, output_path="output_video.mp4"):
+@profiler.profiled("create_text_video")
+def create_text_video(script_text, background_image_path, output_path="output_video.mp4", render_workers=None,
+                      render_backend="process"):
     """
     Create a video that displays text segments separated by commas with a background image
     
@@ -12,7 +19,10 @@ def create_text_video(script_text, background_image_path, output_path="output_vi
     script_text: Text content to display (string)
     background_image_path: Path to background image
     output_path: Output video file path
+    render_workers: Workers rendering segment frames ahead of the encoder (defaults to the CPU count)
+    render_backend: "process" (worker processes, shared-memory frames) or "thread"
     """
+    require_image_background(background_image_path, "create_text_video")
     
     # Set video parameters
     video_width = 1280
@@ -20,8 +30,8 @@ def create_text_video(script_text, background_image_path, output_path="output_vi
     fps = 24
     segment_duration = 2  # Display each segment for 2 seconds
     
-    # Split text by commas
-    segments = split_by_comma(script_text)
+    # Split text into clauses, merging fragments and splitting overlong ones
+    segments = list(script_planner(video_width).plan(script_text))
     
     print(f"Total segments: {len(segments)}")
     for i, segment in enumerate(segments):
@@ -40,29 +50,40 @@ def create_text_video(script_text, background_image_path, output_path="output_vi
     
     # Create video clip list
     clips = []
+    frame_cache = FrameLRU()
     
     for i, segment in enumerate(segments):
         print(f"Processing segment {i+1}: {segment[:30]}...")
         
-        # Create text clip
-        text_clip = create_text_clip(segment, background_array, video_width, video_height)
-        
-        # Set display duration
-        text_clip = text_clip.set_duration(segment_duration)
+        # Create text clip with display duration; its frame is rendered during export
+        text_clip = LazyTextClip(segment, background_array, video_width, video_height,
+                                 render_text_frame, duration=segment_duration, cache=frame_cache)
         
         clips.append(text_clip)
     
+    # Identical segments share one rendered frame
+    pin_repeated_frames(clips, frame_cache)
+    
+    # Upcoming segments' frames render on a worker pool while the encoder runs
+    prefetcher = FramePrefetcher(clips, render_workers, backend=render_backend)
+    
     # Concatenate all clips
     final_video = concatenate_videoclips(clips)
+    profiler.count("segments", len(clips))
+    profiler.count("frames", int(round(final_video.duration * fps)))
     
     # Export video
     print("Starting video export...")
-    final_video.write_videofile(
-        output_path,
-        fps=fps,
-        codec='libx264',
-        audio_codec='aac'
-    )
+    with prefetcher, profiler.span("encode"):
+        final_video.write_videofile(
+            output_path,
+            fps=fps,
+            codec='libx264',
+            audio_codec='aac'
+        )
+    unpin_frames(clips, frame_cache)
+    report_frame_dedup(clips)
+    profiler.count("bytes_written", os.path.getsize(output_path))
     
     print(f"Video saved to: {output_path}")
     return output_path
@@ -105,6 +126,24 @@ def create_text_clip(text, background_array, width, height):
     """
     Create a single text clip with background
     """
+    frame_with_text = render_text_frame(text, background_array, width, height)
+    
+    # Create moviepy ImageClip
+    clip = ImageClip(frame_with_text, duration=1)
+    
+    return clip
+
+def render_text_frame(text, background_array, width, height):
+    """
+    Render text onto a copy of the background and return the RGB frame array
+    """
+    with profiler.span("layout"):
+        return _render_text_frame(text, background_array, width, height)
+
+def _render_text_frame(text, background_array, width, height):
+    """
+    Draw wrapped, centered text with a shadow (untimed body of render_text_frame)
+    """
     # Copy background
     frame = background_array.copy()
     
@@ -113,14 +152,7 @@ def create_text_clip(text, background_array, width, height):
     draw = ImageDraw.Draw(img)
     
     # Set font
-    try:
-        font_size = 48
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        try:
-            font = ImageFont.truetype("simhei.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
+    font = load_text_font()
     
     # Text wrapping
     wrapped_text = wrap_text(text, font, width - 100)
@@ -142,12 +174,7 @@ def create_text_clip(text, background_array, width, height):
     draw.multiline_text((x, y), wrapped_text, font=font, fill=(255, 255, 255), align='center')
     
     # Convert back to numpy array
-    frame_with_text = np.array(img)
-    
-    # Create moviepy ImageClip
-    clip = ImageClip(frame_with_text, duration=1)
-    
-    return clip
+    return np.array(img)
 
 def wrap_text(text, font, max_width):
     """
@@ -179,18 +206,25 @@ def wrap_text(text, font, max_width):
     
     return '\n'.join(lines)
 
-def create_progressive_text_video(script_text, background_image_path, output_path="progressive_video.mp4"):
+@profiler.profiled("create_progressive_text_video")
+def create_progressive_text_video(script_text, background_image_path, output_path="progressive_video.mp4",
+                                  render_workers=None, render_backend="process"):
     """
     Create a video with progressive text display, where each frame shows all content up to the current comma
+    
+    Segment frames are rendered on `render_workers` workers (default: CPU count) of
+    `render_backend` ("process" or "thread").
     """
+    require_image_background(background_image_path, "create_progressive_text_video")
+    
     # Set video parameters
     video_width = 1280
     video_height = 720
     fps = 24
     segment_duration = 2
     
-    # Split text by commas
-    segments = split_by_comma(script_text)
+    # Split text into clauses, merging fragments and splitting overlong ones
+    segments = list(script_planner(video_width).plan(script_text))
     
     # Create cumulative display text list
     progressive_texts = []
@@ -216,27 +250,40 @@ def create_progressive_text_video(script_text, background_image_path, output_pat
     
     # Create video clip list
     clips = []
+    frame_cache = FrameLRU()
     
     for i, text in enumerate(progressive_texts):
         print(f"Processing stage {i+1}: {text[:50]}...")
         
-        # Create text clip
-        text_clip = create_text_clip(text, background_array, video_width, video_height)
-        text_clip = text_clip.set_duration(segment_duration)
+        # Create text clip with display duration; its frame is rendered during export
+        text_clip = LazyTextClip(text, background_array, video_width, video_height,
+                                 render_text_frame, duration=segment_duration, cache=frame_cache)
         
         clips.append(text_clip)
     
+    # Identical segments share one rendered frame
+    pin_repeated_frames(clips, frame_cache)
+    
+    # Upcoming segments' frames render on a worker pool while the encoder runs
+    prefetcher = FramePrefetcher(clips, render_workers, backend=render_backend)
+    
     # Concatenate all clips
     final_video = concatenate_videoclips(clips)
+    profiler.count("segments", len(clips))
+    profiler.count("frames", int(round(final_video.duration * fps)))
     
     # Export video
     print("Starting progressive video export...")
-    final_video.write_videofile(
-        output_path,
-        fps=fps,
-        codec='libx264',
-        audio_codec='aac'
-    )
+    with prefetcher, profiler.span("encode"):
+        final_video.write_videofile(
+            output_path,
+            fps=fps,
+            codec='libx264',
+            audio_codec='aac'
+        )
+    unpin_frames(clips, frame_cache)
+    report_frame_dedup(clips)
+    profiler.count("bytes_written", os.path.getsize(output_path))
     
     print(f"Progressive video saved to: {output_path}")
     return output_path
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from audio_processing import (LEAD_IN, TAIL, TARGET_LUFS, measure_loudness,
+                              normalize_segments, trim_silence)
+
+FPS = 48000
+
+
+def sine(seconds, amplitude=1.0, freq=997.0, channels=2, fps=FPS):
+    t = np.arange(int(seconds * fps)) / fps
+    wave = (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+    return np.repeat(wave[:, None], channels, axis=1)
+
+
+def padded(audio, before, after, fps=FPS):
+    silence = lambda seconds: np.zeros((int(seconds * fps), audio.shape[1]), dtype=np.float32)
+    return np.concatenate([silence(before), audio, silence(after)])
+
+
+def test_trim_silence_keeps_lead_in_and_tail():
+    speech = sine(1.0, 0.5)
+    trimmed = trim_silence(padded(speech, 1.0, 2.0), FPS)
+    assert len(trimmed) == pytest.approx(len(speech) + (LEAD_IN + TAIL) * FPS, abs=0.01 * FPS)
+    # A view: the input is not copied
+    assert trimmed.base is not None
+
+
+def test_trim_silence_passes_silent_and_empty_input():
+    silent = np.zeros((FPS, 2), dtype=np.float32)
+    assert trim_silence(silent, FPS) is silent
+    empty = np.zeros((0, 2), dtype=np.float32)
+    assert trim_silence(empty, FPS) is empty
+
+
+def test_measure_loudness_of_reference_sine():
+    # BS.1770: a full-scale 997 Hz sine in one channel measures -3.01 LUFS,
+    # the same sine in both channels 0 LUFS
+    mono = sine(2.0, channels=1)
+    stereo = sine(2.0, channels=2)
+    loudness = measure_loudness([mono, stereo], FPS)
+    assert loudness[0] == pytest.approx(-3.01, abs=0.05)
+    assert loudness[1] == pytest.approx(0.0, abs=0.05)
+
+
+def test_measure_loudness_of_silent_short_and_empty_segments():
+    loudness = measure_loudness([np.zeros((FPS, 2), dtype=np.float32),
+                                 sine(0.2, 0.1),
+                                 np.zeros((0, 2), dtype=np.float32)], FPS)
+    assert loudness[0] == -np.inf
+    assert np.isfinite(loudness[1])
+    assert loudness[2] == -np.inf
+    assert len(measure_loudness([], FPS)) == 0
+
+
+def test_normalize_segments_reaches_target():
+    segments = [padded(sine(1.5, 0.05), 0.5, 0.5), sine(1.0, 0.3, freq=440.0)]
+    processed = normalize_segments(segments, FPS)
+    assert measure_loudness(processed, FPS) == pytest.approx([TARGET_LUFS] * 2, abs=0.1)
+    # Silence around the first segment was trimmed
+    assert len(processed[0]) < len(segments[0])
+    for audio in processed:
+        assert np.abs(audio).max() < 1.0
+
+
+def test_normalize_segments_passes_none_and_empty():
+    empty = np.zeros((0, 2), dtype=np.float32)
+    processed = normalize_segments([None, empty, sine(1.0, 0.1)], FPS)
+    assert processed[0] is None
+    assert len(processed[1]) == 0
+    assert processed[2] is not None
+
+
+def test_normalize_segments_does_not_modify_read_only_input():
+    audio = sine(1.0, 0.1)
+    audio.setflags(write=False)
+    original = audio.copy()
+    processed = normalize_segments([audio, audio], FPS, trim=False)
+    assert np.array_equal(audio, original)
+    assert processed[0] is not audio
+    assert np.array_equal(processed[0], processed[1])
@@ -0,0 +1,105 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import bgm_beds
+from bgm_beds import BGMBedCache, build_loop_unit, render_bed
+
+FPS = 8000
+
+
+def tone(seconds, freq=220.0):
+    t = np.arange(int(seconds * FPS)) / FPS
+    mono = np.sin(2 * np.pi * freq * t).astype(np.float32)
+    return np.stack([mono, mono], axis=1)
+
+
+def test_loop_seam_is_continuous():
+    intro, unit = build_loop_unit(tone(3.0), FPS, crossfade=0.25)
+    bed = render_bed(intro, unit, len(intro) + 3 * len(unit))
+    steps = np.abs(np.diff(bed[:, 0]))
+    # No step at the seams is larger than the tone's own sample-to-sample change
+    assert steps.max() <= np.abs(np.diff(tone(3.0)[:, 0])).max() * 1.5
+    assert len(bed) == len(intro) + 3 * len(unit)
+
+
+def test_short_track_is_tiled():
+    track = tone(0.001)
+    intro, unit = build_loop_unit(track, FPS, crossfade=0.5)
+    bed = render_bed(intro, unit, 100)
+    assert len(bed) == 100 and len(unit) > 0
+
+
+def test_silent_track_loops():
+    intro, unit = build_loop_unit(np.zeros((FPS, 2), np.float32), FPS)
+    assert not render_bed(intro, unit, 5 * FPS).any()
+
+
+def test_empty_track_is_rejected():
+    with pytest.raises(ValueError):
+        build_loop_unit(np.zeros((0, 2), np.float32), FPS)
+
+
+@pytest.fixture
+def decoded(monkeypatch):
+    decodes = []
+
+    def fake_decode(path, fps):
+        decodes.append(path)
+        return tone(2.0)
+
+    monkeypatch.setattr(bgm_beds, "decode_audio_file", fake_decode)
+    return decodes
+
+
+@pytest.fixture
+def track(tmp_path):
+    path = tmp_path / "music.mp3"
+    path.write_bytes(b"mp3")
+    return str(path)
+
+
+def test_bed_clip_matches_rendered_bed(tmp_path, decoded, track):
+    from moviepy.audio.AudioClip import AudioArrayClip
+
+    cache = BGMBedCache(str(tmp_path / "beds"), fps=FPS)
+    clip = cache.bed_clip(track, 7.3)
+    bed = cache.bed(track, 7.3)
+    assert clip.duration == len(bed) / FPS == 7.3
+    reference = AudioArrayClip(bed, fps=FPS)
+    t = np.linspace(0.001, 7.2, 5000)
+    assert np.array_equal(clip.get_frame(t), reference.get_frame(t))
+    assert np.array_equal(clip.get_frame(3.0), reference.get_frame(3.0))
+    assert not clip.get_frame(np.array([7.5])).any()
+
+
+def test_loop_unit_is_decoded_once(tmp_path, decoded, track):
+    cache = BGMBedCache(str(tmp_path / "beds"), fps=FPS)
+    cache.bed(track, 10)
+    cache.bed(track, 30)
+    BGMBedCache(str(tmp_path / "beds"), fps=FPS).bed(track, 10)
+    assert len(decoded) == 1
+
+
+def test_disk_cache_is_bounded(tmp_path, decoded):
+    beds = tmp_path / "beds"
+    cache = BGMBedCache(str(beds), fps=FPS)
+    for i in range(3):
+        path = tmp_path / f"music{i}.mp3"
+        path.write_bytes(b"mp3")
+        cache.loop_unit(str(path))
+    units = sorted(beds.iterdir())
+    now = time.time()
+    os.utime(units[0], (now - bgm_beds.MAX_UNIT_AGE - 1,) * 2)
+    os.utime(units[1], (now - 10,) * 2)
+    os.utime(units[2], (now,) * 2)
+
+    cache._evict_disk()
+    assert sorted(beds.iterdir()) == units[1:]
+
+    # Over the size bound, the least recently used unit goes first
+    cache.max_bytes = os.path.getsize(units[2])
+    cache._evict_disk()
+    assert sorted(beds.iterdir()) == units[2:]
@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+import pytest
+from moviepy.editor import ColorClip
+from PIL import Image
+
+import checkpoint
+import subtitle_video_audio_maker
+from checkpoint import RenderCheckpoint, read_manifest, resume_render, timeline_digest
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    """
+    Frame ranges encoded, with encoding and joining replaced by fakes that need no ffmpeg
+    """
+    ranges = []
+
+    def fake_encode(clip, path, fps, start_frame, end_frame, codec='libx264', **kwargs):
+        ranges.append((start_frame, end_frame))
+        with open(path, 'wb') as f:
+            f.write(b"chunk")
+
+    def fake_concat(chunk_paths, output_path, *args):
+        with open(output_path, 'wb') as f:
+            f.write(b"video")
+        return output_path
+
+    monkeypatch.setattr(checkpoint, "encode_frames", fake_encode)
+    monkeypatch.setattr(checkpoint, "concat_chunks", fake_concat)
+    return ranges
+
+
+def write(ckpt, tmp_path):
+    clip = ColorClip((16, 16), color=(0, 0, 0), duration=3)
+    return ckpt.write_video(clip, str(tmp_path / "out.mp4"), 2, chunk_seconds=1)
+
+
+def test_digest_covers_text_frames_audio_and_files(tmp_path):
+    background = tmp_path / "bg.jpg"
+    background.write_bytes(b"one")
+    audio = np.zeros((100, 2), dtype=np.float32)
+    base = timeline_digest([("Hello.", 24, audio)], files={'background': background})
+
+    assert timeline_digest([("Hello.", 24, audio.copy())], files={'background': background}) == base
+    assert timeline_digest([("Hello!", 24, audio)], files={'background': background}) != base
+    assert timeline_digest([("Hello.", 25, audio)], files={'background': background}) != base
+    assert timeline_digest([("Hello.", 24, audio + 0.5)], files={'background': background}) != base
+    assert timeline_digest([("Hello.", 24, None)], files={'background': background}) != base
+    background.write_bytes(b"two")
+    assert timeline_digest([("Hello.", 24, audio)], files={'background': background}) != base
+
+
+def test_chunks_are_reused_for_the_same_timeline(tmp_path, encoded):
+    ckpt = RenderCheckpoint(str(tmp_path / "ckpt"), 'text_video', {"a": 1})
+    ckpt.use_timeline("t1")
+    write(ckpt, tmp_path)
+    assert encoded == [(0, 2), (2, 4), (4, 6)]
+
+    encoded.clear()
+    ckpt = RenderCheckpoint(str(tmp_path / "ckpt"), 'text_video', {"a": 1})
+    ckpt.use_timeline("t1")
+    write(ckpt, tmp_path)
+    assert encoded == []
+
+
+def test_changed_timeline_discards_chunks_and_files(tmp_path, encoded):
+    ckpt = RenderCheckpoint(str(tmp_path / "ckpt"), 'text_video', {"a": 1})
+    ckpt.use_timeline("t1")
+    write(ckpt, tmp_path)
+    narration = tmp_path / "narration.m4a"
+    narration.write_bytes(b"audio")
+    stored = ckpt.store_file("narration", str(narration))
+
+    encoded.clear()
+    ckpt = RenderCheckpoint(str(tmp_path / "ckpt"), 'text_video', {"a": 1})
+    ckpt.use_timeline("t2")
+    assert ckpt.stored_file("narration") is None
+    assert not os.path.exists(stored)
+    write(ckpt, tmp_path)
+    assert encoded == [(0, 2), (2, 4), (4, 6)]
+
+
+def test_chunks_are_not_reused_without_a_timeline(tmp_path, encoded):
+    ckpt = RenderCheckpoint(str(tmp_path / "ckpt"), 'text_video', {"a": 1})
+    write(ckpt, tmp_path)
+    encoded.clear()
+    write(ckpt, tmp_path)
+    assert len(encoded) == 3
+
+
+def test_different_job_starts_over(tmp_path):
+    ckpt = RenderCheckpoint(str(tmp_path / "ckpt"), 'text_video', {"a": 1})
+    ckpt.save_audio("Hello.", np.ones((10, 2), dtype=np.float32))
+    assert RenderCheckpoint(str(tmp_path / "ckpt"), 'text_video', {"a": 1}).load_audio("Hello.") is not None
+
+    ckpt = RenderCheckpoint(str(tmp_path / "ckpt"), 'text_video', {"a": 2})
+    assert ckpt.load_audio("Hello.") is None
+    assert read_manifest(ckpt.path)["params"] == {"a": 2}
+
+
+def test_resume_of_complete_render_returns_outputs(tmp_path):
+    ckpt = RenderCheckpoint(str(tmp_path / "ckpt"), 'text_video', {"a": 1})
+    ckpt.finish("out.mp4")
+    assert resume_render(str(tmp_path / "ckpt")) == "out.mp4"
+
+
+def test_resume_without_checkpoint_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        resume_render(str(tmp_path / "missing"))
+
+
+def test_narration_with_silence_fallback_is_not_stored(tmp_path, encoded, monkeypatch):
+    background = tmp_path / "bg.png"
+    Image.new('RGB', (64, 36), (0, 0, 80)).save(background)
+
+    def fake_tts(texts, *args, **kwargs):
+        # The second segment fails, as if the TTS engine were unavailable
+        return [np.zeros((4410, 2), dtype=np.float32)] + [None] * (len(texts) - 1)
+
+    stored = []
+    monkeypatch.setattr(subtitle_video_audio_maker, "generate_audio_arrays", fake_tts)
+    monkeypatch.setattr(RenderCheckpoint, "store_file",
+                        lambda self, name, path: stored.append(name) or path)
+    monkeypatch.setattr(subtitle_video_audio_maker, "write_audiofile",
+                        lambda clip, workspace, **kwargs: workspace.file("narration.m4a"))
+
+    subtitle_video_audio_maker.create_text_video_with_audio(
+        "This is the first sentence of the script. And this is the second one.",
+        str(background), str(tmp_path / "out.mp4"), render_cache=False,
+        checkpoint_dir=str(tmp_path / "ckpt"))
+
+    assert encoded
+    assert stored == []
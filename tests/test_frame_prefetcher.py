@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pytest
+
+import lazy_clips
+from lazy_clips import MAX_LOOKAHEAD, FrameLRU, FramePrefetcher, LazyTextClip
+
+
+def render(text, background, width, height):
+    frame = background.copy()
+    frame[0, :len(text)] = 255
+    return frame
+
+
+def make_clips(background, texts):
+    cache = FrameLRU()
+    return [LazyTextClip(text, background, 16, 8, render, cache=cache) for text in texts]
+
+
+def shm_names():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+@pytest.fixture
+def background():
+    return np.zeros((8, 16, 3), np.uint8)
+
+
+@pytest.mark.parametrize("backend", ["process", "thread"])
+def test_frames_match_on_demand_rendering(background, backend):
+    texts = ["a", "bb", "ccc", "bb", "dddd"]
+    before = shm_names()
+    clips = make_clips(background, texts)
+    with FramePrefetcher(clips, workers=2, backend=backend):
+        frames = [clip.get_frame(0) for clip in clips]
+    for text, frame in zip(texts, frames):
+        assert np.array_equal(frame, render(text, background, 16, 8))
+    assert all(clip.prefetcher is None for clip in clips)
+    assert shm_names() <= before
+
+
+def test_default_lookahead_is_capped(background):
+    clips = make_clips(background, ["a"])
+    assert FramePrefetcher(clips, workers=64).lookahead == MAX_LOOKAHEAD
+    assert FramePrefetcher(clips, workers=2).lookahead == 4
+    assert FramePrefetcher(clips, workers=64, lookahead=3).lookahead == 3
+
+
+def test_slot_memory_is_capped(background, monkeypatch):
+    monkeypatch.setattr(lazy_clips, "MAX_SLOT_BYTES", 2 * background.nbytes)
+    clips = make_clips(background, ["a", "bb", "ccc", "dddd"])
+    with FramePrefetcher(clips, workers=1, lookahead=4, backend="process") as prefetcher:
+        frames = [clip.get_frame(0) for clip in clips]
+        # One shared background plus two output slots
+        assert len(prefetcher._blocks) == 3
+    assert np.array_equal(frames[3], render("dddd", background, 16, 8))
+
+
+def test_falls_back_to_threads_without_shared_memory(background, monkeypatch):
+    allocated = []
+
+    def failing_allocate(size):
+        if allocated:
+            raise OSError(28, "No space left on device")
+        block = lazy_clips.shared_memory.SharedMemory(create=True, size=size)
+        allocated.append(block.name)
+        return block
+
+    monkeypatch.setattr(lazy_clips, "_allocate_shared", failing_allocate)
+    before = shm_names()
+    clips = make_clips(background, ["a", "bb", "ccc"])
+    with FramePrefetcher(clips, workers=2, backend="process") as prefetcher:
+        frames = [clip.get_frame(0) for clip in clips]
+        assert prefetcher.backend == "thread"
+    assert np.array_equal(frames[2], render("ccc", background, 16, 8))
+    # The block allocated before the failure was released
+    assert allocated and shm_names() <= before
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from lazy_clips import FrameLRU, LazyTextClip, array_token, pin_repeated_frames, unpin_frames
+
+
+def render(text, background, width, height):
+    frame = background.copy()
+    frame[0, 0] = len(text)
+    return frame
+
+
+def counting_render(calls):
+    def render_counted(text, background, width, height):
+        calls.append(text)
+        return render(text, background, width, height)
+    return render_counted
+
+
+@pytest.fixture
+def background():
+    return np.zeros((8, 16, 3), np.uint8)
+
+
+def test_lru_keeps_maxsize_frames():
+    cache = FrameLRU(maxsize=2)
+    calls = []
+    for key in ("a", "b", "a", "c", "a", "b"):
+        cache.get(key, lambda key=key: calls.append(key) or key)
+    # "b" was evicted by "c" and rendered again
+    assert calls == ["a", "b", "c", "b"]
+    assert cache.contains("a") and cache.contains("b") and not cache.contains("c")
+
+
+def test_pinned_frames_are_bounded():
+    cache = FrameLRU(maxsize=1, max_pinned=2)
+    cache.pin(["a", "b", "c"])
+    for key in ("a", "b", "c"):
+        cache.get(key, lambda key=key: key)
+    assert not cache.contains("a")
+    assert cache.contains("b") and cache.contains("c")
+    cache.unpin(["b", "c"])
+    assert not cache.contains("b")
+
+
+def test_array_token_is_not_reused():
+    array = np.zeros(4)
+    token = array_token(array)
+    assert array_token(array) == token
+    del array
+    # A new array may land at the freed address, but gets a new token
+    assert all(array_token(np.zeros(4)) != token for _ in range(10))
+
+
+def test_clip_renders_on_first_frame(background):
+    calls = []
+    clip = LazyTextClip("hello", background, 16, 8, counting_render(calls),
+                        duration=1, cache=FrameLRU())
+    assert calls == []
+    frame = clip.get_frame(0)
+    clip.get_frame(0.5)
+    assert calls == ["hello"]
+    assert frame[0, 0, 0] == 5
+
+
+def test_clips_on_different_backgrounds_do_not_share_frames(background):
+    cache = FrameLRU()
+    other = np.full_like(background, 9)
+    first = LazyTextClip("hi", background, 16, 8, render, cache=cache)
+    second = LazyTextClip("hi", other, 16, 8, render, cache=cache)
+    assert first.get_frame(0)[1, 1, 0] == 0
+    assert second.get_frame(0)[1, 1, 0] == 9
+
+
+def test_dedup_counts_only_frames_served_from_cache(background):
+    cache = FrameLRU(maxsize=1, max_pinned=1)
+    calls = []
+    render_counted = counting_render(calls)
+    clips = [LazyTextClip(text, background, 16, 8, render_counted, cache=cache)
+             for text in ("a", "a", "b", "a", "b", "c")]
+    pin_repeated_frames(clips, cache)
+    for clip in clips[:4]:
+        clip.get_frame(0)
+    # Only one pinned frame fits: "b" evicts "a", which is rendered again
+    assert calls == ["a", "b", "a"]
+    assert [clip.reused for clip in clips] == [False, True, False, False, None, None]
+    unpin_frames(clips, cache)
+    assert not cache.contains(clips[0].cache_key())
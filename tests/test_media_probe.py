@@ -0,0 +1,84 @@
+import json
+import time
+from contextlib import nullcontext
+
+import pytest
+
+import media_probe
+from media_probe import MediaInfo, ProbeCache
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    """
+    Paths probed, with probing replaced by a fake that needs no ffmpeg
+    """
+    probed = []
+
+    def fake_probe(path):
+        probed.append(path)
+        return MediaInfo(path, 2.0, [{"type": "audio", "codec": "mp3", "sample_rate": 44100}])
+
+    monkeypatch.setattr(media_probe, "_ffprobe_binary", lambda: None)
+    monkeypatch.setattr(media_probe, "_probe_with_ffmpeg", fake_probe)
+    return probed
+
+
+@pytest.fixture
+def media(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"clip{i}.mp3"
+        path.write_bytes(b"x" * (i + 1))
+        paths.append(path)
+    return paths
+
+
+def test_probe_is_cached_by_size_and_mtime(tmp_path, probes, media):
+    cache = ProbeCache(str(tmp_path / "probe.json"))
+    assert cache.probe(media[0]).duration == 2.0
+    cache.probe(media[0])
+    assert len(probes) == 1
+
+    # A new process reads the file; a changed file is probed again and replaces its entry
+    cache = ProbeCache(str(tmp_path / "probe.json"))
+    cache.probe(media[0])
+    media[0].write_bytes(b"changed")
+    cache.probe(media[0])
+    assert len(probes) == 2
+    entries = json.loads((tmp_path / "probe.json").read_text())
+    assert len(entries) == 1
+
+
+def test_batch_writes_file_once(tmp_path, probes, media, monkeypatch):
+    cache = ProbeCache(str(tmp_path / "probe.json"))
+    writes = []
+    monkeypatch.setattr(media_probe, "file_lock", lambda path: writes.append(path) or nullcontext())
+    with cache.batch():
+        for path in media:
+            cache.probe(path)
+        assert writes == []
+    assert len(writes) == 1
+    assert len(json.loads((tmp_path / "probe.json").read_text())) == 3
+
+
+def test_processes_merge_their_entries(tmp_path, probes, media):
+    first = ProbeCache(str(tmp_path / "probe.json"))
+    second = ProbeCache(str(tmp_path / "probe.json"))
+    first.probe(media[0])
+    second.probe(media[1])
+    first.probe(media[2])
+    assert len(json.loads((tmp_path / "probe.json").read_text())) == 3
+
+
+def test_evict_by_age_and_count(monkeypatch):
+    now = time.time()
+    entries = {"old": {"probed": now - media_probe.MAX_PROBE_AGE - 1}}
+    entries.update({f"k{i}": {"probed": now - i} for i in range(5)})
+    monkeypatch.setattr(media_probe, "MAX_PROBE_ENTRIES", 3)
+    assert sorted(media_probe._evict(entries, now)) == ["k0", "k1", "k2"]
+
+
+def test_repr_without_duration():
+    info = MediaInfo("/tmp/still.png", None, [{"type": "video", "codec": "png"}])
+    assert "unknown duration" in repr(info)
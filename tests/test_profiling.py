@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from profiling import Profiler, _read_prometheus_samples
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    profiler = Profiler()
+    profiler.configure(enabled=True, prometheus_path=str(tmp_path / "videoscript.prom"),
+                       cprofile_path=str(tmp_path / "render.prof"))
+    return profiler
+
+
+def test_bound_helper_threads_record_into_their_job(profiler):
+    started = threading.Barrier(2)
+    reports = {}
+
+    def run(name):
+        with profiler.job(name):
+            started.wait()
+            with ThreadPoolExecutor(2) as pool:
+                for _ in range(3):
+                    pool.submit(profiler.bind(lambda: profiler.count("frames")))
+            reports[name] = profiler.report()
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert reports["a"]["counters"] == {"frames": 3}
+    assert reports["b"]["counters"] == {"frames": 3}
+
+
+def test_unbound_threads_do_not_leak_into_a_job(profiler):
+    with profiler.job("a"):
+        thread = threading.Thread(target=lambda: profiler.count("frames"))
+        thread.start()
+        thread.join()
+        with profiler.span("encode"):
+            pass
+        report = profiler.report()
+    assert report["counters"] == {}
+    assert list(report["spans"]) == ["encode"]
+
+
+def test_prometheus_counters_accumulate(profiler, tmp_path):
+    for _ in range(2):
+        with profiler.job("text_video"):
+            profiler.count("frames", 24)
+    samples = _read_prometheus_samples(tmp_path / "videoscript.prom")
+    assert samples["videoscript_jobs_total", '{job="text_video",status="ok"}'] == 2
+    assert samples["videoscript_frames_total", '{job="text_video"}'] == 48
+
+
+def test_cprofile_dump_per_job(profiler, tmp_path):
+    for _ in range(2):
+        with profiler.job("text_video"):
+            pass
+    dumps = sorted(p.name for p in tmp_path.glob("render.text_video.*.prof"))
+    assert len(dumps) == 2
+    assert len({p.read_bytes() for p in tmp_path.glob("render.*")}) == 2
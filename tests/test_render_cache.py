@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from PIL import ImageFont
+
+from render_cache import RenderCache
+from segment_planner import font_identity, load_text_font
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RenderCache(str(tmp_path / "cache"), max_bytes=1024 ** 3)
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return path
+
+
+def test_fingerprint_with_default_font(cache):
+    # The default font of recent Pillow versions has a BytesIO path
+    for font in (ImageFont.load_default(), load_text_font()):
+        key = cache.fingerprint('text_video', {'font': font_identity(font)}, {}, ['out.mp4'])
+        assert isinstance(key, str)
+    assert font_identity(ImageFont.load_default()) == font_identity(ImageFont.load_default())
+
+
+def test_store_and_fetch(cache, tmp_path):
+    output = write(tmp_path / "out.mp4", b"video")
+    key = cache.fingerprint('job', {'a': 1}, {}, [output])
+    assert not cache.fetch(key, [output])
+    cache.store(key, [output])
+
+    output.unlink()
+    assert cache.fetch(key, [output])
+    assert output.read_bytes() == b"video"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_output_writes_do_not_alter_entry(cache, tmp_path):
+    output = write(tmp_path / "out.mp4", b"first")
+    key = cache.fingerprint('job', {'a': 1}, {}, [output])
+    cache.store(key, [output])
+
+    # A later render (or an external tool) rewrites the output in place
+    with open(output, 'r+b') as f:
+        f.write(b"other")
+    output.unlink()
+    assert cache.fetch(key, [output])
+    assert output.read_bytes() == b"first"
+
+
+def test_disabled_render_unlinks_linked_output(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"), link=True)
+    output = write(tmp_path / "out.mp4", b"first")
+    key = cache.fingerprint('job', {'a': 1}, {}, [output])
+    cache.store(key, [output])
+    assert cache.fetch(key, [output])
+    assert os.stat(output).st_nlink > 1
+
+    # A render that bypasses the cache (key None) writes over the output
+    assert not cache.fetch(None, [output])
+    write(output, b"second")
+    output.unlink()
+    assert cache.fetch(key, [output])
+    assert output.read_bytes() == b"first"
+
+
+def test_repeated_hits_leave_no_temp_files(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"), link=True)
+    output = write(tmp_path / "out.mp4", b"video")
+    key = cache.fingerprint('job', {'a': 1}, {}, [output])
+    cache.store(key, [output])
+    for _ in range(3):
+        assert cache.fetch(key, [output])
+    assert sorted(os.listdir(tmp_path)) == ["cache", "out.mp4"]
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from subtitle_video_audio_maker import (RENDITIONS, layout_size, layout_text, load_background_array,
+                                        render_text_frame, resolve_renditions)
+
+
+def test_single_output_without_renditions():
+    assert resolve_renditions(None, "out.mp4") == [(None, "out.mp4", 1280, 720)]
+
+
+def test_named_and_custom_renditions():
+    outputs = resolve_renditions(["1080p", "vertical", (640, 360)], "videos/lesson.mp4")
+    assert outputs == [
+        ("1080p", "videos/lesson_1080p.mp4", 1920, 1080),
+        ("vertical", "videos/lesson_vertical.mp4", 1080, 1920),
+        ("640x360", "videos/lesson_640x360.mp4", 640, 360),
+    ]
+
+
+@pytest.mark.parametrize("renditions", [[], ["4k"]])
+def test_invalid_renditions(renditions):
+    with pytest.raises(ValueError):
+        resolve_renditions(renditions, "out.mp4")
+
+
+def test_same_aspect_ratio_shares_layout():
+    text = "A sentence long enough to wrap onto more than one line of the frame, surely."
+    wrapped_720, font_720 = layout_text(text, *RENDITIONS["720p"])
+    wrapped_1080, font_1080 = layout_text(text, *RENDITIONS["1080p"])
+    assert wrapped_720 == wrapped_1080
+    assert font_1080 == round(font_720 * 1.5)
+    assert layout_size(1920, 1080) == (1280, 720)
+    assert layout_size(1080, 1920) == (720, 1280)
+
+
+def test_backgrounds_are_cropped_not_stretched(tmp_path):
+    # Red left quarter: a vertical crop of a 16:9 image keeps only the blue middle
+    image = np.zeros((90, 160, 3), np.uint8)
+    image[:, :40] = (255, 0, 0)
+    image[:, 40:] = (0, 0, 255)
+    path = tmp_path / "bg.png"
+    Image.fromarray(image).save(path)
+
+    cropped = load_background_array(str(path), 90, 160, crop=True)
+    stretched = load_background_array(str(path), 90, 160)
+    assert cropped.shape == stretched.shape == (160, 90, 3)
+    assert (stretched[:, 0, 0] > 200).all()
+    assert (cropped[..., 0] < 50).all() and (cropped[..., 2] > 200).all()
+    assert not cropped.flags.writeable
+
+
+def test_frames_match_rendition_size(tmp_path):
+    for width, height in RENDITIONS.values():
+        background = np.zeros((height, width, 3), np.uint8)
+        assert render_text_frame("Hello", background, width, height).shape == (height, width, 3)
@@ -0,0 +1,75 @@
+import pytest
+
+from segment_planner import SegmentPlanner, iter_clauses
+
+
+def clauses(text):
+    return list(iter_clauses(text))
+
+
+@pytest.mark.parametrize("text", [
+    "Pi is 3.14 today.",
+    "It costs 1,000 dollars.",
+    "Ask Mr. Smith first.",
+    "Bring fruit e.g. apples.",
+    "Made in the U.S. by hand.",
+    "See No. 5 for details.",
+    "Visit example.com now.",
+])
+def test_no_break_inside(text):
+    assert clauses(text) == [text]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("I said no. Then I left.", ["I said no.", "Then I left."]),
+    ("The answer was no. So we stopped.", ["The answer was no.", "So we stopped."]),
+    ("It was the best. Everyone agreed.", ["It was the best.", "Everyone agreed."]),
+    ("First part, second part.", ["First part,", "second part."]),
+    ("你好。Mr. Brown came.", ["你好。", "Mr. Brown came."]),
+    ("你好，世界。再见！", ["你好，", "世界。", "再见！"]),
+])
+def test_breaks(text, expected):
+    assert clauses(text) == expected
+
+
+def test_closing_quotes_stay_with_their_clause():
+    assert clauses('He said "stop." Then he left.') == ['He said "stop."', "Then he left."]
+    assert clauses("(See the note.) Next point.") == ["(See the note.)", "Next point."]
+
+
+def test_chunked_input_matches_whole_text():
+    text = ('Mr. Brown said "no." Then, at 3.14 p.m., he left for the U.S. office. '
+            'Ask for No. 12. The answer was no. 你好，世界。') * 3
+    whole = clauses(text)
+    assert list(iter_clauses(iter(text))) == whole
+    for size in (2, 5, 17):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        assert list(iter_clauses(chunks)) == whole
+
+
+def test_long_clause_streamed_char_by_char():
+    text = "word " * 20000 + "end."
+    assert list(iter_clauses(iter(text))) == [text.strip()]
+
+
+def test_short_fragments_are_merged():
+    planner = SegmentPlanner(min_seconds=1.2, words_per_second=2.5)
+    # "Hello." ends a sentence of its own, so it joins the following text
+    assert list(planner.plan("Yes, we did it. Hello. This sentence is long enough to stand.")) == [
+        "Yes, we did it.", "Hello. This sentence is long enough to stand."]
+
+
+def test_merge_respects_min_seconds():
+    text = "One two three four. Five six seven eight."
+    assert list(SegmentPlanner(min_seconds=1.0).plan(text)) == [
+        "One two three four.", "Five six seven eight."]
+    assert list(SegmentPlanner(min_seconds=2.0).plan(text)) == [text]
+
+
+def test_overlong_clause_is_split_evenly():
+    planner = SegmentPlanner(max_width=20, max_lines=2, min_seconds=0)
+    clause = " ".join(f"word{i}" for i in range(30)) + "."
+    segments = list(planner.plan(clause))
+    assert len(segments) > 1
+    assert all(planner.fits(segment) for segment in segments)
+    assert " ".join(segments) == clause
@@ -0,0 +1,73 @@
+import wave
+
+import numpy as np
+import pytest
+
+from timeline import Timeline
+
+
+def audio(samples, value=0.5):
+    return np.full((samples, 2), value, np.float32)
+
+
+def test_segments_snap_to_frame_boundaries():
+    timeline = Timeline(fps=24, audio_fps=44100)
+    # 1.0 s of audio needs 24 frames; one more sample needs a 25th
+    assert timeline.add("a", audio(44100)).n_frames == 24
+    entry = timeline.add("b", audio(44101))
+    assert entry.n_frames == 25
+    assert entry.start == 1.0
+    assert entry.n_samples >= 44101
+
+
+def test_no_drift_over_many_segments():
+    timeline = Timeline(fps=30, audio_fps=44100)
+    rng = np.random.default_rng(0)
+    for i in range(500):
+        timeline.add(i, audio(int(rng.integers(1000, 90000))))
+    previous = timeline.entries[0]
+    for entry in timeline.entries[1:]:
+        assert entry.start_frame == previous.end_frame
+        assert entry.start_sample == previous.end_sample
+        previous = entry
+    # Audio and video end on the same instant
+    assert timeline.total_samples == round(timeline.duration * 44100)
+
+
+@pytest.mark.parametrize("fps", [24, 25, 30, 23.976])
+def test_audio_fits_its_entry(fps):
+    timeline = Timeline(fps=fps, audio_fps=48000)
+    for samples in (1, 1999, 2000, 2001, 48000):
+        entry = timeline.add(samples, audio(samples))
+        assert entry.n_samples >= samples
+        # The smallest frame boundary that fits: one frame less would cut the audio
+        if entry.n_frames > 1:
+            assert timeline.frame_to_sample(entry.end_frame - 1) - entry.start_sample < samples
+
+
+def test_min_frames_for_silent_segments():
+    timeline = Timeline(fps=24)
+    assert timeline.add("title", audio(0), min_frames=48).n_frames == 48
+
+
+def test_narration_places_audio_at_segment_starts(tmp_path):
+    timeline = Timeline(fps=24, audio_fps=48000, channels=2)
+    timeline.add("a", audio(1000, 0.25))
+    second = timeline.add("b", audio(1000, 0.5))
+    narration = timeline.narration()
+    assert narration.shape == (timeline.total_samples, 2)
+    assert np.all(narration[:1000] == 0.25)
+    assert not narration[1000:second.start_sample].any()
+    assert np.all(narration[second.start_sample:second.start_sample + 1000] == 0.5)
+
+    path = timeline.write_wav(tmp_path / "narration.wav")
+    with wave.open(str(path)) as wav_file:
+        assert wav_file.getnframes() == timeline.total_samples
+
+
+def test_streaming_timeline_keeps_no_audio():
+    timeline = Timeline(keep_audio=False)
+    entry = timeline.add("a", audio(100))
+    assert timeline.pad_audio(entry, audio(100)).shape == (entry.n_samples, 2)
+    with pytest.raises(ValueError):
+        timeline.narration()
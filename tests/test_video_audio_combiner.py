@@ -0,0 +1,108 @@
+from concurrent.futures import Future
+from pathlib import Path
+
+import pytest
+
+import video_audio_combiner
+from video_audio_combiner import WatchFolderDaemon, group_inbox_files
+
+
+class FakePool:
+    """
+    Records submitted jobs; tests finish their futures by hand
+    """
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, func, name, files, output_dir, options):
+        future = Future()
+        self.jobs.append((name, files, future))
+        return future
+
+
+def deliver(inbox, name, content=b"x", bgm=False):
+    (inbox / f"{name}.mp4").write_bytes(content)
+    (inbox / f"{name}.mp3").write_bytes(content)
+    if bgm:
+        (inbox / f"{name}_bgm.mp3").write_bytes(content)
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    return WatchFolderDaemon(tmp_path / "inbox", tmp_path / "out", tmp_path / "failed",
+                             workers=2, settle_seconds=0)
+
+
+def test_group_inbox_files():
+    paths = [Path(name) for name in ("a.mp4", "a.mp3", "a_bgm.mp3", "b.mov", "b-music.wav",
+                                     "c.mp3", "notes.txt")]
+    groups = group_inbox_files(paths)
+    assert groups == {
+        "a": {"video": Path("a.mp4"), "audio": Path("a.mp3"), "bgm": Path("a_bgm.mp3")},
+        "b": {"video": Path("b.mov"), "bgm": Path("b-music.wav")},
+        "c": {"audio": Path("c.mp3")},
+    }
+
+
+def test_incomplete_sets_stay_in_inbox(daemon):
+    (daemon.inbox / "a.mp4").write_bytes(b"x")
+    daemon.scan()
+    assert daemon._queue == []
+    assert (daemon.inbox / "a.mp4").exists()
+
+
+def test_set_with_same_name_waits_for_the_running_one(daemon):
+    pool = FakePool()
+    deliver(daemon.inbox, "lesson", b"first", bgm=True)
+    daemon.scan()
+    daemon.dispatch(pool)
+    assert len(pool.jobs) == 1
+
+    # Delivered again while the first is running: left in the inbox
+    deliver(daemon.inbox, "lesson", b"second")
+    daemon.scan()
+    assert daemon._queue == [] and daemon._settling == 1
+    assert (daemon.inbox / "lesson.mp4").read_bytes() == b"second"
+
+    pool.jobs[0][2].set_result(("lesson", "out.mp4", None))
+    daemon.collect()
+    daemon.scan()
+    daemon.dispatch(pool)
+    pool.jobs[1][2].set_result(("lesson", "out-2.mp4", None))
+    daemon.collect()
+
+    processed = daemon.output_dir / "processed"
+    assert (processed / "lesson" / "lesson.mp4").read_bytes() == b"first"
+    assert (processed / "lesson" / "lesson_bgm.mp3").exists()
+    assert (processed / "lesson-2" / "lesson.mp4").read_bytes() == b"second"
+    assert list(daemon.processing_dir.iterdir()) == []
+    assert daemon.completed == 2
+
+
+def test_failed_set_keeps_traceback(daemon, monkeypatch):
+    def fail(**kwargs):
+        raise ValueError("lesson.mp4 has no video stream")
+
+    monkeypatch.setattr(video_audio_combiner, "combine_audio_video", fail)
+    deliver(daemon.inbox, "lesson")
+    daemon.scan()
+    name, files, _ = daemon._queue[0]
+    result = video_audio_combiner._process_watch_job(name, files, str(daemon.output_dir), {})
+
+    future = Future()
+    future.set_result(result)
+    daemon._running[future] = daemon._queue.pop() + (0.0,)
+    daemon.collect()
+    error = (daemon.failed_dir / "lesson" / "error.txt").read_text()
+    assert "Traceback" in error and "has no video stream" in error
+    assert (daemon.failed_dir / "lesson" / "lesson.mp3").exists()
+
+
+def test_recover_requeues_claimed_sets(daemon):
+    deliver(daemon.inbox, "lesson")
+    daemon.scan()
+    restarted = WatchFolderDaemon(daemon.inbox, daemon.output_dir, daemon.failed_dir,
+                                  settle_seconds=0)
+    restarted.recover()
+    assert [name for name, _, _ in restarted._queue] == ["lesson"]
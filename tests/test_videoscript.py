@@ -0,0 +1,23 @@
+import pytest
+
+import videoscript
+
+
+@pytest.mark.parametrize("options", [
+    ["--stream", "--rendition", "720p"],
+    ["--stream", "--pcm-audio"],
+    ["--stream", "--checkpoint", "ckpt"],
+    ["--stream", "--no-cache"],
+    ["--stream", "--progressive"],
+    ["--progressive", "--rendition", "vertical"],
+])
+def test_ignored_options_are_rejected(options, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        videoscript.main(["text", "script.txt", "bg.jpg", *options])
+    assert exit_info.value.code == 2
+    assert "cannot be combined with" in capsys.readouterr().err
+
+
+def test_parse_rendition():
+    assert videoscript.parse_rendition("640x360") == (640, 360)
+    assert videoscript.parse_rendition("1080p") == "1080p"
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from workspace import JobWorkspace, check_pcm_container, with_workspace
+
+
+def test_workspace_is_removed_on_exit(tmp_path):
+    with JobWorkspace(root=str(tmp_path)) as workspace:
+        path = workspace.temp_file(suffix=".wav")
+        assert os.path.dirname(path) == workspace.path
+        assert os.path.isdir(workspace.subdir("chunks"))
+    assert not os.path.exists(workspace.path)
+
+
+def test_concurrent_workspaces_are_distinct(tmp_path):
+    first, second = JobWorkspace(root=str(tmp_path)), JobWorkspace(root=str(tmp_path))
+    assert first.path != second.path
+    first.cleanup()
+    assert os.path.isdir(second.path)
+    second.cleanup()
+
+
+def test_fixed_path_workspace_is_kept(tmp_path):
+    with JobWorkspace(path=str(tmp_path / "checkpoint")) as workspace:
+        workspace.temp_file()
+    assert os.listdir(workspace.path)
+
+
+def test_with_workspace_creates_and_removes_one(tmp_path):
+    seen = []
+
+    @with_workspace
+    def job(workspace=None):
+        seen.append(workspace.path)
+        return workspace
+
+    job()
+    assert not os.path.exists(seen[0])
+    given = JobWorkspace(root=str(tmp_path))
+    assert job(workspace=given) is given
+    assert os.path.isdir(given.path)
+    given.cleanup()
+
+
+@pytest.mark.parametrize("path", ["out.mov", "OUT.MKV"])
+def test_pcm_containers_accepted(path):
+    check_pcm_container(path)
+
+
+@pytest.mark.parametrize("path", ["out.mp4", "out"])
+def test_pcm_containers_rejected(path):
+    with pytest.raises(ValueError):
+        check_pcm_container(path)
@@ -0,0 +1,133 @@
+"""
+Text Overlay
+Text sprites composited over video backgrounds, blending only inside the text's box.
+
+With a static background, each segment's frame is rendered once and reused. A video
+background changes every frame, and compositing a full-frame RGBA text clip on top
+would blend every pixel of every frame. Instead, each segment's text is rendered once
+as an RGBA sprite cropped to its bounding box. Per frame, the decoded background is
+copied into a preallocated output buffer and the sprite is blended into the box only.
+"""
+
+import os
+import bisect
+import numpy as np
+from moviepy.editor import VideoClip, VideoFileClip
+from lazy_clips import FrameLRU
+from media_probe import probe_media
+from profiling import profiler
+
+# Background files with these extensions are played as looping video
+VIDEO_BACKGROUND_EXTENSIONS = ['.mp4', '.mov', '.mkv', '.webm', '.avi', '.gif']
+
+def is_video_background(path):
+    """
+    Whether a background file is a video rather than a still image
+    """
+    return os.path.splitext(str(path))[1].lower() in VIDEO_BACKGROUND_EXTENSIONS
+
+def require_image_background(path, entry_point):
+    """
+    Raise ValueError for a video background passed to an entry point that only
+    draws on still images
+    """
+    if is_video_background(path):
+        raise ValueError(f"{entry_point} needs a background image; video backgrounds ({path}) "
+                         f"are supported by create_text_video_with_audio")
+
+class TextSprite:
+    """
+    Pre-rendered RGBA text and the position of its bounding box in the frame
+
+    Args:
+    rgba: (height, width, 4) uint8 array covering the text's bounding box
+    x, y: Top-left corner of the box in the frame
+    """
+
+    def __init__(self, rgba, x, y):
+        self.x = x
+        self.y = y
+        self.height, self.width = rgba.shape[:2]
+        # Blend terms computed once: out = (rgb * a + 127 + background * (255 - a)) // 255
+        alpha = rgba[:, :, 3:4].astype(np.uint16)
+        self.premultiplied = rgba[:, :, :3] * alpha + 127
+        self.inverse_alpha = 255 - alpha
+        self._scratch = np.empty(self.premultiplied.shape, dtype=np.uint16)
+
+    def blend_into(self, frame):
+        """
+        Blend the sprite into an RGB uint8 frame in place, touching only its box
+        """
+        region = frame[self.y:self.y + self.height, self.x:self.x + self.width]
+        np.multiply(region, self.inverse_alpha, out=self._scratch)
+        self._scratch += self.premultiplied
+        self._scratch //= 255
+        region[...] = self._scratch
+
+class TextOverlayClip(VideoClip):
+    """
+    Looping video background with each timeline segment's text blended on top
+
+    Frames are written into one reusable buffer, so a returned frame is only
+    valid until the next one is requested (as when encoding).
+
+    Args:
+    timeline: Timeline whose entries hold the segment texts
+    background_path: Background video, looped over the timeline's duration
+    width, height: Frame size (the background is scaled by the decoder)
+    render_sprite: Function render_sprite(text, width, height) -> TextSprite
+    cache: FrameLRU for sprites (a private one is created if omitted)
+    crop: Scale to cover the frame and center-crop instead of stretching, as
+          load_background_array does for images
+    """
+
+    def __init__(self, timeline, background_path, width, height, render_sprite, cache=None, crop=False):
+        VideoClip.__init__(self, duration=timeline.duration)
+        self.entries = list(timeline.entries)
+        self.starts = [entry.start for entry in self.entries]
+        target_resolution = (height, width)
+        source_size = probe_media(background_path).size if crop else None
+        if source_size and all(source_size):
+            # Scale the side that covers the frame; the other one is cropped per frame
+            source_width, source_height = source_size
+            if source_width * height >= source_height * width:
+                target_resolution = (height, None)
+            else:
+                target_resolution = (None, width)
+        self.background = VideoFileClip(str(background_path), audio=False,
+                                        target_resolution=target_resolution)
+        background_width, background_height = self.background.size
+        if background_width < width or background_height < height:
+            # Rounding left the scaled video a pixel short: stretch instead
+            self.background.close()
+            self.background = VideoFileClip(str(background_path), audio=False,
+                                            target_resolution=(height, width))
+            background_width, background_height = width, height
+        top = (background_height - height) // 2
+        left = (background_width - width) // 2
+        self._crop = (slice(top, top + height), slice(left, left + width))
+        self.size = (width, height)
+        self.render_sprite = render_sprite
+        self.cache = cache if cache is not None else FrameLRU()
+        self._frame = np.empty((height, width, 3), dtype=np.uint8)
+        self.make_frame = self._make_frame
+
+    def _sprite_at(self, t):
+        if not self.entries:
+            return None
+        index = max(0, bisect.bisect_right(self.starts, t) - 1)
+        text = self.entries[index].item
+        width, height = self.size
+        return self.cache.get((text, self.size), lambda: self.render_sprite(text, width, height))
+
+    def _make_frame(self, t):
+        sprite = self._sprite_at(t)
+        background = self.background.get_frame(t % self.background.duration)
+        with profiler.span("composite"):
+            np.copyto(self._frame, background[self._crop][:, :, :3])
+            if sprite is not None:
+                sprite.blend_into(self._frame)
+        return self._frame
+
+    def close(self):
+        self.background.close()
@@ -0,0 +1,142 @@
+"""
+Timeline
+Sample-accurate segment timeline that keeps narration audio and video frames in sync.
+"""
+
+import wave
+import numpy as np
+
+class TimelineEntry:
+    """
+    One segment placed on the timeline, with frame and sample boundaries
+    """
+
+    def __init__(self, item, start_frame, end_frame, start_sample, end_sample, fps, audio_fps):
+        self.item = item
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.start_sample = start_sample
+        self.end_sample = end_sample
+        self.fps = fps
+        self.audio_fps = audio_fps
+
+    @property
+    def n_frames(self):
+        return self.end_frame - self.start_frame
+
+    @property
+    def n_samples(self):
+        return self.end_sample - self.start_sample
+
+    @property
+    def start(self):
+        """Start time in seconds (exactly on a frame boundary)"""
+        return self.start_frame / self.fps
+
+    @property
+    def duration(self):
+        """Duration in seconds (an exact whole number of frames)"""
+        return self.n_frames / self.fps
+
+class Timeline:
+    """
+    Snap segments to video frame boundaries and pad their audio with exact
+    sample counts, so audio and video positions are derived from the same
+    integer frame grid and can never drift apart.
+    """
+
+    def __init__(self, fps=24, audio_fps=44100, channels=2, keep_audio=True):
+        """
+        Args:
+        fps: Video frame rate
+        audio_fps: Audio sample rate
+        channels: Number of audio channels
+        keep_audio: Keep segment audio for narration(); streaming writers that
+                    consume audio segment by segment can turn this off
+        """
+        self.fps = fps
+        self.audio_fps = audio_fps
+        self.channels = channels
+        self.keep_audio = keep_audio
+        self.entries = []
+        self._audio = []
+
+    def frame_to_sample(self, frame):
+        """
+        Audio sample position of a frame boundary
+        """
+        return int(round(frame * self.audio_fps / self.fps))
+
+    @property
+    def total_frames(self):
+        return self.entries[-1].end_frame if self.entries else 0
+
+    @property
+    def total_samples(self):
+        return self.frame_to_sample(self.total_frames)
+
+    @property
+    def duration(self):
+        return self.total_frames / self.fps
+
+    def add(self, item, audio_array, min_frames=1):
+        """
+        Append a segment, rounding its length up to the next frame boundary
+
+        Args:
+        item: Payload for this segment (e.g. its display text)
+        audio_array: float32 array of shape (samples, channels)
+        min_frames: Minimum number of frames for this segment
+
+        Returns:
+        The TimelineEntry; its padded audio is kept for narration()
+        """
+        start_frame = self.total_frames
+        start_sample = self.frame_to_sample(start_frame)
+
+        # Smallest frame boundary that fits all of the segment's samples
+        end_frame = int(np.ceil((start_sample + len(audio_array)) * self.fps / self.audio_fps))
+        end_frame = max(end_frame, start_frame + min_frames)
+        while self.frame_to_sample(end_frame) - start_sample < len(audio_array):
+            end_frame += 1
+        end_sample = self.frame_to_sample(end_frame)
+
+        entry = TimelineEntry(item, start_frame, end_frame, start_sample, end_sample,
+                              self.fps, self.audio_fps)
+        self.entries.append(entry)
+        if self.keep_audio:
+            self._audio.append(audio_array)
+        return entry
+
+    def pad_audio(self, entry, audio_array):
+        """
+        Zero-pad a segment's audio to exactly the entry's sample count
+        """
+        padded = np.zeros((entry.n_samples, self.channels), dtype=np.float32)
+        padded[:len(audio_array)] = audio_array
+        return padded
+
+    def narration(self):
+        """
+        Write every segment into one contiguous float32 narration buffer
+        """
+        if not self.keep_audio:
+            raise ValueError("Timeline was created with keep_audio=False")
+        buffer = np.zeros((self.total_samples, self.channels), dtype=np.float32)
+        for entry, audio in zip(self.entries, self._audio):
+            buffer[entry.start_sample:entry.start_sample + len(audio)] = audio
+        return buffer
+
+    def write_wav(self, path, buffer=None):
+        """
+        Write the narration as 16-bit PCM WAV, ready to be muxed without re-encoding
+        """
+        if buffer is None:
+            buffer = self.narration()
+        pcm = (np.clip(buffer, -1.0, 1.0) * 32767).astype('<i2')
+        with wave.open(str(path), 'wb') as wav_file:
+            wav_file.setnchannels(self.channels)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.audio_fps)
+            wav_file.writeframes(pcm.tobytes())
+        return path
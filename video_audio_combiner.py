@@ -5,10 +5,28 @@ Combines video file with audio and background music into a final output video.
 """
 
 import os
+import re
 import sys
+import json
+import time
+import shutil
+import uuid
+import traceback
 from pathlib import Path
 import argparse
-from moviepy.editor import VideoFileClip, AudioFileClip, CompositeAudioClip
+from concurrent.futures import ProcessPoolExecutor
+from profiling import profiler
+from media_probe import default_probe_cache, probe_media
+from bgm_beds import bgm_bed_clip
+from render_cache import default_render_cache
+from workspace import check_pcm_container, with_workspace, write_videofile
+
+# Supported file extensions
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.webm']
+AUDIO_EXTENSIONS = ['.mp3', '.wav', '.aac', '.m4a', '.flac']
+
+# Audio files whose name contains one of these are treated as background music
+BGM_KEYWORDS = ['bgm', 'background', 'music']
 
 def find_files_in_downloads():
     """
@@ -22,10 +40,6 @@ def find_files_in_downloads():
         print(f"Downloads folder not found at: {downloads_path}")
         return None
     
-    # Define supported file extensions
-    video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.webm']
-    audio_extensions = ['.mp3', '.wav', '.aac', '.m4a', '.flac']
-    
     files = {
         'video': [],
         'audio': [],
@@ -38,10 +52,10 @@ def find_files_in_downloads():
             file_ext = file_path.suffix.lower()
             file_name = file_path.name.lower()
             
-            if file_ext in video_extensions:
+            if file_ext in VIDEO_EXTENSIONS:
                 files['video'].append(file_path)
-            elif file_ext in audio_extensions:
-                if 'bgm' in file_name or 'background' in file_name or 'music' in file_name:
+            elif file_ext in AUDIO_EXTENSIONS:
+                if any(keyword in file_name for keyword in BGM_KEYWORDS):
                     files['bgm'].append(file_path)
                 else:
                     files['audio'].append(file_path)
@@ -52,13 +66,24 @@ def list_found_files(files):
     """Display found files to user for selection."""
     print("\n=== Found Files ===")
     
-    for file_type, file_list in files.items():
-        print(f"\n{file_type.upper()} files:")
-        if file_list:
-            for i, file_path in enumerate(file_list, 1):
-                print(f"  {i}. {file_path.name}")
-        else:
-            print("  None found")
+    # New probe results are written to the cache file once, after the listing
+    with default_probe_cache.batch():
+        for file_type, file_list in files.items():
+            print(f"\n{file_type.upper()} files:")
+            if file_list:
+                for i, file_path in enumerate(file_list, 1):
+                    print(f"  {i}. {file_path.name}{describe_media(file_path)}")
+            else:
+                print("  None found")
+
+def describe_media(file_path):
+    """Short duration/codec summary of a file from the probe cache."""
+    try:
+        info = probe_media(file_path)
+    except Exception:
+        return "  (unreadable)"
+    codecs = "/".join(stream['codec'] for stream in info.streams if stream.get('codec'))
+    return f"  ({info.duration or 0:.1f}s, {codecs})"
 
 def select_files(files):
     """Allow user to select which files to use."""
@@ -90,8 +115,49 @@ def select_files(files):
     
     return selected
 
+def plan_combine(video_path, audio_path, bgm_path=None):
+    """
+    Decide how each track has to be adjusted, using probed metadata only.
+    
+    Returns:
+        Dictionary with video_duration, audio_action and bgm_action
+        ('trim', 'loop' or 'keep'; bgm_action is None without BGM)
+    
+    Raises:
+        ValueError: If an input lacks the stream it is used for
+    """
+    video_info = probe_media(video_path)
+    audio_info = probe_media(audio_path)
+    if not video_info.has_video or not video_info.duration:
+        raise ValueError(f"{Path(video_path).name} has no video stream")
+    if not audio_info.has_audio or not audio_info.duration:
+        raise ValueError(f"{Path(audio_path).name} has no audio stream")
+    
+    def action(duration, target):
+        if duration > target:
+            return 'trim'
+        if duration < target:
+            return 'loop'
+        return 'keep'
+    
+    video_duration = video_info.duration
+    plan = {
+        'video_duration': video_duration,
+        'audio_action': action(audio_info.duration, video_duration),
+        'bgm_action': None
+    }
+    if bgm_path:
+        bgm_info = probe_media(bgm_path)
+        if not bgm_info.has_audio or not bgm_info.duration:
+            raise ValueError(f"{Path(bgm_path).name} has no audio stream")
+        plan['bgm_action'] = action(bgm_info.duration, video_duration)
+    return plan
+
+@profiler.profiled("combine_audio_video")
+@with_workspace
 def combine_audio_video(video_path, audio_path, bgm_path=None, output_path=None, 
-                       audio_volume=1.0, bgm_volume=0.3, fade_duration=1.0):
+                       audio_volume=1.0, bgm_volume=0.3, fade_duration=1.0,
+                       workspace=None, pcm_audio=False, render_cache=True, raise_errors=False):
     """
     Combine video with audio and optional background music.
     
@@ -103,38 +169,70 @@ def combine_audio_video(video_path, audio_path, bgm_path=None, output_path=None,
         audio_volume: Volume level for main audio (0.0 to 1.0)
         bgm_volume: Volume level for background music (0.0 to 1.0)
         fade_duration: Fade in/out duration in seconds
+        workspace: JobWorkspace for intermediate files (a temporary one is created if omitted)
+        pcm_audio: Keep the mixed audio as uncompressed PCM instead of encoding AAC
+                   (the generated output name then ends in .mov; a given one must be .mov or .mkv)
+        render_cache: Reuse the output of an identical earlier job from the render cache
+        raise_errors: Raise errors instead of printing them and returning None
     """
     
+    # Imported here so discovery, probing and watch mode start without loading moviepy
+    from moviepy.editor import VideoFileClip, AudioFileClip, CompositeAudioClip
+    
     print(f"\n=== Processing Files ===")
     print(f"Video: {video_path.name}")
     print(f"Audio: {audio_path.name}")
     if bgm_path:
         print(f"BGM: {bgm_path.name}")
     
+    # Generate output filename if not provided (mp4 cannot carry PCM audio)
+    if output_path is None:
+        ext = ".mov" if pcm_audio else ".mp4"
+        output_path = video_path.parent / f"combined_{video_path.stem}{ext}"
+    
     try:
-        # Load video clip
+        if pcm_audio:
+            check_pcm_container(output_path)
+        
+        # An identical earlier job is answered from the render cache
+        cache_key = None
+        if render_cache:
+            cache_key = default_render_cache.fingerprint('combine', dict(
+                audio_volume=audio_volume, bgm_volume=bgm_volume, fade_duration=fade_duration,
+                pcm_audio=pcm_audio), files={'video': video_path, 'audio': audio_path, 'bgm': bgm_path},
+                outputs=[output_path])
+        if default_render_cache.fetch(cache_key, [output_path]):
+            print(f"\n✅ Success! Combined video saved as: {output_path}")
+            return output_path
+        
+        # Plan every operation from probed metadata before opening any decoder
+        with profiler.span("probe"):
+            plan = plan_combine(video_path, audio_path, bgm_path)
+        video_duration = plan['video_duration']
+        
+        # Load video clip (its own audio track is replaced, so no audio reader is needed)
         print("\nLoading video...")
-        video = VideoFileClip(str(video_path))
-        video_duration = video.duration
+        with profiler.span("load"):
+            video = VideoFileClip(str(video_path), audio=False)
         
         # Load main audio
         print("Loading audio...")
-        audio = AudioFileClip(str(audio_path))
+        with profiler.span("load"):
+            audio = AudioFileClip(str(audio_path))
         
         # Adjust audio to match video duration
-        if audio.duration > video_duration:
+        if plan['audio_action'] == 'trim':
             print(f"Trimming audio to match video duration ({video_duration:.2f}s)")
             audio = audio.subclip(0, video_duration)
-        elif audio.duration < video_duration:
+        elif plan['audio_action'] == 'loop':
             print(f"Audio is shorter than video. Extending audio.")
             # Loop audio to match video duration
-            loops_needed = int(video_duration / audio.duration) + 1
-            audio = audio.loop(duration=video_duration)
+            audio = audio.audio_loop(duration=video_duration)
         
         # Apply volume and fade to main audio
         audio = audio.volumex(audio_volume)
         if fade_duration > 0:
-            audio = audio.fadein(fade_duration).fadeout(fade_duration)
+            audio = audio.audio_fadein(fade_duration).audio_fadeout(fade_duration)
         
         # Prepare final audio
         final_audio = audio
@@ -142,19 +240,17 @@ def combine_audio_video(video_path, audio_path, bgm_path=None, output_path=None,
         # Add background music if provided
         if bgm_path:
             print("Loading background music...")
-            bgm = AudioFileClip(str(bgm_path))
+            if plan['bgm_action'] == 'loop':
+                print("Looping background music with a crossfaded loop bed")
             
-            # Loop BGM to match video duration
-            if bgm.duration < video_duration:
-                loops_needed = int(video_duration / bgm.duration) + 1
-                bgm = bgm.loop(duration=video_duration)
-            else:
-                bgm = bgm.subclip(0, video_duration)
+            # Precomputed bed, seamlessly looped or trimmed to the video duration
+            with profiler.span("audio_mix"):
+                bgm = bgm_bed_clip(bgm_path, video_duration)
             
             # Apply volume and fade to BGM
             bgm = bgm.volumex(bgm_volume)
             if fade_duration > 0:
-                bgm = bgm.fadein(fade_duration).fadeout(fade_duration)
+                bgm = bgm.audio_fadein(fade_duration).audio_fadeout(fade_duration)
             
             # Combine audio and BGM
             print("Mixing audio tracks...")
@@ -164,23 +260,24 @@ def combine_audio_video(video_path, audio_path, bgm_path=None, output_path=None,
         print("Combining video with audio...")
         final_video = video.set_audio(final_audio)
         
-        # Generate output filename if not provided
-        if output_path is None:
-            output_path = video_path.parent / f"combined_{video_path.stem}.mp4"
-        
         # Write the final video
         print(f"\nExporting final video to: {output_path}")
         print("This may take a while depending on video length...")
         
-        final_video.write_videofile(
-            str(output_path),
-            codec='libx264',
-            audio_codec='aac',
-            temp_audiofile='temp-audio.m4a',
-            remove_temp=True,
-            verbose=False,
-            logger=None
-        )
+        profiler.count("frames", int(round(video.duration * video.fps)))
+        with profiler.span("encode"):
+            write_videofile(
+                final_video,
+                output_path,
+                workspace,
+                pcm_audio=pcm_audio,
+                codec='libx264',
+                audio_codec='aac',
+                verbose=False,
+                logger=None
+            )
+        profiler.count("bytes_written", os.path.getsize(output_path))
+        default_render_cache.store(cache_key, [output_path])
         
         print(f"\n✅ Success! Combined video saved as: {output_path}")
         
@@ -195,8 +292,285 @@ def combine_audio_video(video_path, audio_path, bgm_path=None, output_path=None,
         
     except Exception as e:
         print(f"\n❌ Error: {str(e)}")
+        if raise_errors:
+            raise
         return None
 
+# Name markers that identify the BGM track of a set, e.g. "lesson1_bgm.mp3"
+BGM_NAME_PATTERN = re.compile(r'[._ -](' + '|'.join(BGM_KEYWORDS) + r')$', re.IGNORECASE)
+
+def group_inbox_files(file_paths):
+    """
+    Group files into job sets by naming convention.
+    
+    A set shares a base name: "<name>.mp4" (video), "<name>.mp3" (audio) and
+    optionally "<name>_bgm.mp3" (background music; "-bgm", ".music", "_background"
+    and similar suffixes also work). Any supported extension may be used.
+    
+    Returns:
+        Dictionary mapping base name to {'video': Path, 'audio': Path, 'bgm': Path}
+    """
+    groups = {}
+    for file_path in file_paths:
+        file_ext = file_path.suffix.lower()
+        stem = file_path.stem
+        
+        if file_ext in VIDEO_EXTENSIONS:
+            groups.setdefault(stem, {})['video'] = file_path
+        elif file_ext in AUDIO_EXTENSIONS:
+            match = BGM_NAME_PATTERN.search(stem)
+            if match:
+                groups.setdefault(stem[:match.start()], {})['bgm'] = file_path
+            else:
+                groups.setdefault(stem, {})['audio'] = file_path
+    return groups
+
+def _process_watch_job(name, files, output_dir, options):
+    """
+    Worker process entry point: combine one claimed set of files.
+    
+    Returns:
+        (name, output path or None, error message or None)
+    """
+    ext = ".mov" if options.get('pcm_audio') else ".mp4"
+    # A set delivered again under the same name does not replace the earlier result
+    output_path = unique_path(Path(output_dir) / f"{name}{ext}")
+    try:
+        result = combine_audio_video(
+            video_path=files['video'],
+            audio_path=files['audio'],
+            bgm_path=files.get('bgm'),
+            output_path=output_path,
+            raise_errors=True,
+            **options
+        )
+    except Exception:
+        return name, None, traceback.format_exc()
+    return name, str(result), None
+
+def unique_path(path):
+    """
+    path, or "<stem>-2<suffix>", "<stem>-3<suffix>", ... if it already exists
+    """
+    candidate = path
+    n = 2
+    while candidate.exists():
+        candidate = path.with_name(f"{path.stem}-{n}{path.suffix}")
+        n += 1
+    return candidate
+
+class WatchFolderDaemon:
+    """
+    Watch an inbox directory, combine complete file sets with a worker pool and
+    move results and failures to output folders.
+    
+    Sets are claimed by moving their files into "<inbox>/.processing/<name>.<id>/"
+    once every file has stopped changing for `settle_seconds`. A set arriving under
+    the name of one still being processed waits in the inbox until that one is done.
+    Successful inputs are archived in "<output_dir>/processed/<name>/"; failed inputs
+    are moved to "<failed_dir>/<name>/" together with an error.txt holding the
+    traceback. A name used again is archived as "<name>-2", "<name>-3", ...
+    """
+    
+    def __init__(self, inbox, output_dir, failed_dir, workers=2, poll_interval=2.0,
+                 settle_seconds=5.0, metrics_path=None, combine_options=None):
+        self.inbox = Path(inbox)
+        self.output_dir = Path(output_dir)
+        self.failed_dir = Path(failed_dir)
+        self.processing_dir = self.inbox / ".processing"
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.metrics_path = metrics_path
+        self.combine_options = combine_options or {}
+        
+        # path -> (size, mtime, time the file was last seen changing)
+        self._file_state = {}
+        # (name, files, claim dir) of claimed sets not yet submitted
+        self._queue = []
+        self._running = {}
+        # Complete sets still waiting for their files to settle, or for a set of the same name
+        self._settling = 0
+        self.started_at = time.time()
+        self.completed = 0
+        self.failed = 0
+        self.total_processing_seconds = 0.0
+        
+        for directory in (self.inbox, self.output_dir, self.failed_dir, self.processing_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+    
+    def scan(self):
+        """
+        Look for complete, settled sets in the inbox and enqueue them
+        """
+        now = time.time()
+        current = {}
+        for file_path in self.inbox.iterdir():
+            if not file_path.is_file() or file_path.name.startswith('.'):
+                continue
+            stat = file_path.stat()
+            previous = self._file_state.get(file_path)
+            if previous and previous[:2] == (stat.st_size, stat.st_mtime):
+                current[file_path] = previous
+            else:
+                current[file_path] = (stat.st_size, stat.st_mtime, now)
+        self._file_state = current
+        
+        self._settling = 0
+        in_flight = self._in_flight()
+        for name, files in group_inbox_files(current.keys()).items():
+            if 'video' not in files or 'audio' not in files:
+                continue
+            if (name in in_flight
+                    or any(now - current[path][2] < self.settle_seconds for path in files.values())):
+                self._settling += 1
+                continue
+            self._queue.append(self._claim(name, files))
+    
+    def _in_flight(self):
+        """
+        Names of the sets queued or running
+        """
+        return ({name for name, _, _ in self._queue}
+                | {name for name, _, _, _ in self._running.values()})
+    
+    def _claim(self, name, files):
+        """
+        Move a set out of the inbox so later scans do not pick it up again
+        
+        Returns:
+            (name, claimed files, claim directory)
+        """
+        claim_dir = self.processing_dir / f"{name}.{uuid.uuid4().hex[:8]}"
+        claim_dir.mkdir(parents=True)
+        claimed = {}
+        for file_type, file_path in files.items():
+            target = claim_dir / file_path.name
+            shutil.move(str(file_path), str(target))
+            self._file_state.pop(file_path, None)
+            claimed[file_type] = target
+        print(f"📥 Queued set: {name} ({', '.join(sorted(claimed))})")
+        return name, claimed, claim_dir
+    
+    def dispatch(self, pool):
+        """
+        Submit queued sets while workers are free, one set per name at a time
+        """
+        for job in list(self._queue):
+            if len(self._running) >= self.workers:
+                break
+            name, files, claim_dir = job
+            if any(name == running[0] for running in self._running.values()):
+                continue
+            self._queue.remove(job)
+            future = pool.submit(_process_watch_job, name, files, str(self.output_dir),
+                                 self.combine_options)
+            self._running[future] = (name, files, claim_dir, time.time())
+    
+    def collect(self):
+        """
+        Handle finished jobs: archive inputs or move them to the failed folder
+        """
+        for future in [f for f in self._running if f.done()]:
+            name, files, claim_dir, started = self._running.pop(future)
+            self.total_processing_seconds += time.time() - started
+            try:
+                _, output_path, error = future.result()
+            except Exception:
+                output_path, error = None, traceback.format_exc()
+            
+            if error is None:
+                self.completed += 1
+                self._move_set(files, self.output_dir / "processed" / name)
+                print(f"✅ {name} -> {output_path}")
+            else:
+                self.failed += 1
+                target_dir = self._move_set(files, self.failed_dir / name)
+                (target_dir / "error.txt").write_text(error)
+                print(f"❌ {name} failed, inputs moved to {target_dir}")
+            shutil.rmtree(claim_dir, ignore_errors=True)
+    
+    def _move_set(self, files, target_dir):
+        """
+        Move a set's files into target_dir, or into a new "<target_dir>-N" if it exists
+        
+        Returns:
+            Directory the files were moved to
+        """
+        target_dir = unique_path(target_dir)
+        target_dir.mkdir(parents=True)
+        for file_path in files.values():
+            if file_path.exists():
+                shutil.move(str(file_path), str(target_dir / file_path.name))
+        return target_dir
+    
+    def metrics(self):
+        """
+        Throughput and queue-depth metrics
+        """
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        finished = self.completed + self.failed
+        return {
+            "queue_depth": len(self._queue),
+            "settling": self._settling,
+            "in_flight": len(self._running),
+            "completed": self.completed,
+            "failed": self.failed,
+            "uptime_seconds": elapsed,
+            "throughput_per_hour": self.completed * 3600.0 / elapsed,
+            "avg_job_seconds": self.total_processing_seconds / finished if finished else 0.0,
+        }
+    
+    def report_metrics(self):
+        metrics = self.metrics()
+        print(f"📊 queue={metrics['queue_depth']} running={metrics['in_flight']} "
+              f"done={metrics['completed']} failed={metrics['failed']} "
+              f"throughput={metrics['throughput_per_hour']:.1f}/h")
+        if self.metrics_path:
+            temp_path = f"{self.metrics_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(metrics, f)
+            os.replace(temp_path, self.metrics_path)
+    
+    def recover(self):
+        """
+        Re-queue sets left in the processing folder by a previous run
+        """
+        for claim_dir in sorted(self.processing_dir.iterdir()):
+            if claim_dir.is_dir():
+                files = group_inbox_files([p for p in claim_dir.iterdir() if p.is_file()])
+                for name, set_files in files.items():
+                    if 'video' in set_files and 'audio' in set_files:
+                        print(f"♻️  Recovering set: {name}")
+                        self._queue.append((name, set_files, claim_dir))
+    
+    def run(self, once=False):
+        """
+        Run the watch loop until interrupted (or until idle when once=True)
+        """
+        print(f"👀 Watching {self.inbox} with {self.workers} workers")
+        self.recover()
+        last_report = time.time()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                while True:
+                    self.scan()
+                    self.dispatch(pool)
+                    self.collect()
+                    
+                    if once and not (self._queue or self._running or self._settling):
+                        self.report_metrics()
+                        break
+                    if time.time() - last_report >= 30:
+                        self.report_metrics()
+                        last_report = time.time()
+                    time.sleep(self.poll_interval)
+            except KeyboardInterrupt:
+                print("\nStopping watcher, waiting for running jobs...")
+                pool.shutdown(wait=True)
+                self.collect()
+                self.report_metrics()
+
 def main():
     """Main function to run the video combiner."""
     parser = argparse.ArgumentParser(description='Combine video with audio and background music')
@@ -207,6 +581,16 @@ def main():
     parser.add_argument('--audio-volume', type=float, default=1.0, help='Main audio volume (0.0-1.0)')
     parser.add_argument('--bgm-volume', type=float, default=0.3, help='Background music volume (0.0-1.0)')
     parser.add_argument('--fade', type=float, default=1.0, help='Fade in/out duration in seconds')
+    parser.add_argument('--watch', type=str, help='Run as a daemon watching this inbox directory')
+    parser.add_argument('--outbox', type=str, help='Watch mode: folder for results (default: <inbox>/output)')
+    parser.add_argument('--failed', type=str, help='Watch mode: folder for failed sets (default: <inbox>/failed)')
+    parser.add_argument('--workers', type=int, default=2, help='Watch mode: number of worker processes')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='Watch mode: seconds between inbox scans')
+    parser.add_argument('--settle', type=float, default=5.0,
+                        help='Watch mode: seconds a set must stay unchanged before it is processed')
+    parser.add_argument('--metrics-file', type=str, help='Watch mode: write queue/throughput metrics JSON here')
+    parser.add_argument('--once', action='store_true', help='Watch mode: exit when the inbox is drained')
+    parser.add_argument('--no-cache', action='store_true', help='Always render, bypassing the render cache')
     
     args = parser.parse_args()
     
@@ -221,6 +605,27 @@ def main():
         print("Please install it using: pip install moviepy")
         sys.exit(1)
     
+    # Daemon mode: process sets arriving in an inbox folder
+    if args.watch:
+        inbox = Path(args.watch)
+        daemon = WatchFolderDaemon(
+            inbox=inbox,
+            output_dir=Path(args.outbox) if args.outbox else inbox / "output",
+            failed_dir=Path(args.failed) if args.failed else inbox / "failed",
+            workers=args.workers,
+            poll_interval=args.poll_interval,
+            settle_seconds=args.settle,
+            metrics_path=args.metrics_file,
+            combine_options={
+                'audio_volume': args.audio_volume,
+                'bgm_volume': args.bgm_volume,
+                'fade_duration': args.fade,
+                'render_cache': not args.no_cache
+            }
+        )
+        daemon.run(once=args.once)
+        return
+    
     selected_files = {}
     
     # Use command line arguments if provided
@@ -264,7 +669,8 @@ def main():
         output_path=output_path,
         audio_volume=args.audio_volume,
         bgm_volume=args.bgm_volume,
-        fade_duration=args.fade
+        fade_duration=args.fade,
+        render_cache=not args.no_cache
     )
     
     if result:
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+VideoScript CLI
+One command line for all entry points, with heavy imports deferred to the subcommand
+that needs them.
+
+MoviePy, NumPy, Whisper (torch) and the TTS engines are only imported when a job
+actually renders, aligns or synthesizes, so `--help`, planning and probing start
+almost immediately:
+
+    python videoscript.py text script.txt background.jpg -o lesson.mp4 --rendition 1080p vertical
+    python videoscript.py subtitles script.txt background.jpg
+    python videoscript.py advanced speech.mp3 script.txt --bgm music.mp3
+    python videoscript.py resume lesson.ckpt
+    python videoscript.py combine --video a.mp4 --audio a.mp3
+    python videoscript.py serve --workers 2
+    python videoscript.py plan script.txt
+    python videoscript.py probe video.mp4
+    python videoscript.py cache --clear
+    python videoscript.py bench-startup
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+import wave
+
+def read_script(path):
+    """
+    Script text from a file, or from stdin for "-"
+    """
+    if path == '-':
+        return sys.stdin.read()
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def parse_rendition(value):
+    """
+    Rendition name ("1080p") or explicit size ("640x360")
+    """
+    width, sep, height = value.partition('x')
+    if sep and width.isdigit() and height.isdigit():
+        return (int(width), int(height))
+    return value
+
+def cmd_text(args):
+    """Text video with narration (subtitle_video_audio_maker)."""
+    import subtitle_video_audio_maker as maker
+    script = read_script(args.script)
+    options = dict(use_gtts=not args.offline, language=args.language, speech_rate=args.rate,
+                   normalize_audio=not args.raw_audio)
+    render = dict(render_workers=args.render_workers, render_backend=args.render_backend)
+
+    if args.stream:
+        result = maker.create_text_video_with_audio_streaming(script, args.background, args.output, **options)
+    elif args.progressive:
+        result = maker.create_progressive_text_video_with_audio(script, args.background, args.output,
+                                                                pcm_audio=args.pcm_audio, **render, **options)
+    else:
+        renditions = [parse_rendition(r) for r in args.rendition] if args.rendition else None
+        result = maker.create_text_video_with_audio(script, args.background, args.output,
+                                                    pcm_audio=args.pcm_audio, renditions=renditions,
+                                                    checkpoint_dir=args.checkpoint,
+                                                    render_cache=not args.no_cache, **render, **options)
+    print(f"\n🎉 Done: {result}")
+
+def check_text_options(parser, args):
+    """Reject options that the chosen text video mode would silently ignore."""
+    if args.stream:
+        mode, unsupported = '--stream', ['rendition', 'pcm_audio', 'checkpoint', 'no_cache',
+                                         'progressive', 'render_workers']
+    elif args.progressive:
+        mode, unsupported = '--progressive', ['rendition', 'checkpoint', 'no_cache']
+    else:
+        return
+    given = ['--' + name.replace('_', '-') for name in unsupported if getattr(args, name)]
+    if given:
+        parser.error(f"{mode} cannot be combined with {', '.join(given)}")
+
+def cmd_subtitles(args):
+    """Text video without audio (subtitle_video_maker)."""
+    import subtitle_video_maker as maker
+    script = read_script(args.script)
+    render = dict(render_workers=args.render_workers, render_backend=args.render_backend)
+    if args.progressive:
+        result = maker.create_progressive_text_video(script, args.background, args.output, **render)
+    else:
+        result = maker.create_text_video(script, args.background, args.output, **render)
+    print(f"\n🎉 Done: {result}")
+
+def cmd_advanced(args):
+    """Subtitled video aligned to recorded speech (generateWithScripts)."""
+    from generateWithScripts import AdvancedVideoGenerator
+    text = read_script(args.text)
+    generator = AdvancedVideoGenerator(model_name=args.model, long_audio=args.long_audio,
+                                       chunk_seconds=args.chunk_seconds, workers=args.workers)
+    result = generator.create_advanced_video(args.speech, args.bgm, args.output, text,
+                                             pcm_audio=args.pcm_audio, checkpoint_dir=args.checkpoint)
+    print(f"\n🎉 Done: {result}")
+
+def cmd_resume(args):
+    """Continue a failed checkpointed render (checkpoint)."""
+    from checkpoint import resume_render
+    try:
+        result = resume_render(args.checkpoint)
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"\n🎉 Done: {result}")
+
+def cmd_combine(argv):
+    """Combine video, narration and background music (video_audio_combiner)."""
+    import video_audio_combiner
+    sys.argv = ['videoscript combine'] + argv
+    video_audio_combiner.main()
+
+def cmd_serve(argv):
+    """Local render service (render_service)."""
+    import render_service
+    sys.argv = ['videoscript serve'] + argv
+    render_service.main()
+
+# Subcommands that parse their own options
+PASS_THROUGH_COMMANDS = {'combine': cmd_combine, 'serve': cmd_serve}
+
+def cmd_plan(args):
+    """Print the segments a script is split into, without rendering."""
+    from segment_planner import script_planner
+    planner = script_planner(args.width)
+    count = 0
+    # The file is planned lazily, line by line
+    with (open(args.script, 'r', encoding='utf-8') if args.script != '-' else sys.stdin) as f:
+        for count, segment in enumerate(planner.plan(f), 1):
+            print(f"{count:4d}  {segment}")
+    print(f"\nTotal segments: {count}")
+
+def cmd_probe(args):
+    """Print duration and streams of media files (cached)."""
+    from media_probe import default_probe_cache, probe_media
+    # The cache file is written once for all files
+    with default_probe_cache.batch():
+        for path in args.files:
+            try:
+                print(probe_media(path))
+            except Exception as e:
+                print(f"❌ {path}: {e}")
+
+def cmd_cache(args):
+    """Show render cache size and location, or clear it (render_cache)."""
+    from render_cache import default_render_cache
+    if args.clear:
+        default_render_cache.clear()
+        print(f"🧹 Cleared render cache {default_render_cache.cache_dir}")
+    stats = default_render_cache.stats()
+    print(f"Render cache: {stats['cache_dir']}{'' if stats['enabled'] else ' (disabled)'}")
+    print(f"Entries: {stats['entries']}, {stats['bytes'] / 1024 ** 2:.1f} MB "
+          f"of {stats['max_bytes'] / 1024 ** 3:.1f} GB")
+
+def _time_command(argv, runs):
+    """
+    Wall-clock seconds of running argv `runs` times in fresh interpreters
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def cmd_bench_startup(args):
+    """Measure how fast the CLI starts for --help and simple jobs."""
+    cli = [sys.executable, os.path.abspath(__file__)]
+    with tempfile.TemporaryDirectory(prefix="videoscript_bench_") as temp_dir:
+        script_path = os.path.join(temp_dir, "script.txt")
+        with open(script_path, 'w', encoding='utf-8') as f:
+            f.write("Welcome to the startup benchmark, each clause becomes a segment. "
+                    "Numbers like 3.14 stay together, e.g. this one. Thanks for watching!\n" * 20)
+        media_path = os.path.join(temp_dir, "silence.wav")
+        with wave.open(media_path, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(16000)
+            f.writeframes(b'\0\0' * 16000)
+
+        cases = [
+            ("--help", cli + ["--help"]),
+            ("text --help", cli + ["text", "--help"]),
+            ("combine --help", cli + ["combine", "--help"]),
+            ("plan (20 lines)", cli + ["plan", script_path]),
+            ("probe", cli + ["probe", media_path]),
+            # Reference: what every entry point used to pay up front
+            ("import moviepy.editor", [sys.executable, "-c", "import moviepy.editor"]),
+        ]
+
+        print(f"Startup benchmark ({args.runs} runs each)")
+        print(f"{'command':<24} {'median':>8} {'max':>8}")
+        slow = []
+        for name, argv in cases:
+            timings = _time_command(argv, args.runs)
+            median = statistics.median(timings)
+            print(f"{name:<24} {median:7.3f}s {max(timings):7.3f}s")
+            if median >= 1.0 and not name.startswith("import"):
+                slow.append(name)
+
+    if slow:
+        print(f"\n⚠️  Slower than one second: {', '.join(slow)}")
+        sys.exit(1)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='videoscript', description='Generate videos from text scripts')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    text = subparsers.add_parser('text', help='Text video with synchronized narration')
+    text.add_argument('script', help='Script text file ("-" for stdin)')
+    text.add_argument('background', help='Background image or video')
+    text.add_argument('-o', '--output', default='output_video.mp4', help='Output video file')
+    text.add_argument('--offline', action='store_true', help='Use offline TTS (pyttsx3) instead of Google TTS')
+    text.add_argument('--language', default='en', help='TTS language code')
+    text.add_argument('--rate', type=int, default=150, help='Offline TTS speech rate (words per minute)')
+    text.add_argument('--stream', action='store_true', help='Synthesize, render and encode concurrently')
+    text.add_argument('--progressive', action='store_true', help='Accumulate text instead of replacing it')
+    text.add_argument('--rendition', nargs='+', metavar='NAME',
+                      help='Output renditions: 1080p, 720p, vertical or WIDTHxHEIGHT')
+    text.add_argument('--raw-audio', action='store_true',
+                      help='Keep TTS segments as synthesized (no silence trimming or loudness normalization)')
+    text.add_argument('--pcm-audio', action='store_true', help='Keep narration as uncompressed PCM (needs a .mov or .mkv output)')
+    text.add_argument('--no-cache', action='store_true', help='Always render, bypassing the render cache')
+    text.add_argument('--checkpoint', metavar='DIR', help='Keep finished work here so a failed render can be resumed')
+    text.add_argument('--render-workers', type=int, metavar='N',
+                      help='Workers rendering segment frames ahead of the encoder (default: CPU count)')
+    text.add_argument('--render-backend', choices=['process', 'thread'], default='process',
+                      help='Render frames in worker processes (default) or threads')
+    text.set_defaults(func=cmd_text)
+
+    subtitles = subparsers.add_parser('subtitles', help='Text video without audio')
+    subtitles.add_argument('script', help='Script text file ("-" for stdin)')
+    subtitles.add_argument('background', help='Background image')
+    subtitles.add_argument('-o', '--output', default='output_video.mp4', help='Output video file')
+    subtitles.add_argument('--progressive', action='store_true', help='Accumulate text instead of replacing it')
+    subtitles.add_argument('--render-workers', type=int, metavar='N',
+                           help='Workers rendering segment frames ahead of the encoder (default: CPU count)')
+    subtitles.add_argument('--render-backend', choices=['process', 'thread'], default='process',
+                           help='Render frames in worker processes (default) or threads')
+    subtitles.set_defaults(func=cmd_subtitles)
+
+    advanced = subparsers.add_parser('advanced', help='Subtitles aligned to recorded speech (Whisper)')
+    advanced.add_argument('speech', help='Recorded narration audio')
+    advanced.add_argument('text', help='Full script text file ("-" for stdin)')
+    advanced.add_argument('-o', '--output', default='advanced_video.mp4', help='Output video file')
+    advanced.add_argument('--bgm', help='Background music file')
+    advanced.add_argument('--model', default='base', help='Whisper model name')
+    advanced.add_argument('--long-audio', action='store_true', help='Transcribe in parallel silence-split chunks')
+    advanced.add_argument('--chunk-seconds', type=float, default=300, help='Long-audio chunk length')
+    advanced.add_argument('--workers', type=int, help='Long-audio worker processes')
+    advanced.add_argument('--pcm-audio', action='store_true', help='Keep audio as uncompressed PCM (needs a .mov or .mkv output)')
+    advanced.add_argument('--checkpoint', metavar='DIR', help='Keep finished work here so a failed render can be resumed')
+    advanced.set_defaults(func=cmd_advanced)
+
+    resume = subparsers.add_parser('resume', help='Resume a failed render from its checkpoint')
+    resume.add_argument('checkpoint', help='Checkpoint directory of the render')
+    resume.set_defaults(func=cmd_resume)
+
+    # Listed for --help; main() hands their arguments to the modules' own parsers
+    subparsers.add_parser('combine', add_help=False,
+                          help='Combine video, narration and BGM (see "combine --help")')
+    subparsers.add_parser('serve', add_help=False,
+                          help='Run the local render service (see "serve --help")')
+
+    plan = subparsers.add_parser('plan', help='Show how a script is split into segments')
+    plan.add_argument('script', help='Script text file ("-" for stdin)')
+    plan.add_argument('--width', type=int, default=1280, help='Video width the segments must fit')
+    plan.set_defaults(func=cmd_plan)
+
+    probe = subparsers.add_parser('probe', help='Show duration and streams of media files')
+    probe.add_argument('files', nargs='+', help='Media files')
+    probe.set_defaults(func=cmd_probe)
+
+    cache = subparsers.add_parser('cache', help='Show or clear the render cache')
+    cache.add_argument('--clear', action='store_true', help='Remove every cached output')
+    cache.set_defaults(func=cmd_cache)
+
+    bench = subparsers.add_parser('bench-startup', help='Benchmark CLI startup time')
+    bench.add_argument('--runs', type=int, default=5, help='Runs per command')
+    bench.set_defaults(func=cmd_bench_startup)
+
+    return parser
+
+def main(argv=None):
+    """Run the videoscript CLI."""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in PASS_THROUGH_COMMANDS:
+        PASS_THROUGH_COMMANDS[argv[0]](argv[1:])
+        return
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'text':
+        check_text_options(parser, args)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
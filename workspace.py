@@ -0,0 +1,195 @@
+"""
+Workspace
+Per-job temporary directories so several renders can run side by side on one machine.
+
+Every intermediate file of a job (TTS output, moviepy's temporary audio track, ...)
+lives in the job's own directory instead of the current working directory or loose
+NamedTemporaryFiles, and the directory is removed when the job ends.
+"""
+
+import os
+import shutil
+import tempfile
+import functools
+import weakref
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Shared-memory filesystem used when a workspace asks for tmpfs
+TMPFS_ROOT = "/dev/shm"
+
+# Containers that can carry uncompressed PCM audio (pcm_audio=True)
+PCM_CONTAINERS = ('.mov', '.mkv')
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive lock, across processes, on a lock file next to path
+    """
+    with open(f"{path}.lock", "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+class JobWorkspace:
+    """
+    Unique temporary directory for one render job
+
+    Args:
+        root: Parent directory (defaults to $VIDEOSCRIPT_WORKSPACE_ROOT or the system temp dir)
+        tmpfs: Place the workspace on tmpfs (/dev/shm) when available
+        prefix: Directory name prefix
+        keep: Leave the directory in place on cleanup (for debugging)
+        path: Use this fixed directory instead of a new temporary one; such a
+              persistent workspace (e.g. a render checkpoint) is always kept
+    """
+
+    def __init__(self, root=None, tmpfs=False, prefix="videoscript_", keep=False, path=None):
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self.path = os.path.abspath(path)
+            self.keep = True
+            return
+
+        if root is None:
+            root = os.environ.get("VIDEOSCRIPT_WORKSPACE_ROOT")
+        if tmpfs and root is None and os.path.isdir(TMPFS_ROOT):
+            root = TMPFS_ROOT
+        if root is not None:
+            os.makedirs(root, exist_ok=True)
+
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=root)
+        self.keep = keep
+        # Remove the directory even if the job never calls cleanup()
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.path, ignore_errors=True)
+        if keep:
+            self._finalizer.detach()
+
+    def file(self, name):
+        """
+        Path of a named file inside the workspace
+        """
+        return os.path.join(self.path, name)
+
+    def temp_file(self, suffix="", prefix="tmp_"):
+        """
+        Path of a new, uniquely named empty file inside the workspace
+        """
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix=prefix, dir=self.path)
+        os.close(fd)
+        return path
+
+    def subdir(self, name):
+        """
+        Create (if needed) and return a subdirectory of the workspace
+        """
+        path = self.file(name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def cleanup(self):
+        """
+        Remove the workspace directory and everything in it
+        """
+        if not self.keep:
+            self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+
+    def __repr__(self):
+        return f"JobWorkspace({self.path!r})"
+
+def with_workspace(func):
+    """
+    Decorator for entry points taking a `workspace` keyword argument.
+
+    When the caller does not pass one, a fresh JobWorkspace is created for the
+    call and removed afterwards; a workspace passed by the caller is left alone.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, workspace=None, **kwargs):
+        if workspace is not None:
+            return func(*args, workspace=workspace, **kwargs)
+        with JobWorkspace() as job_workspace:
+            return func(*args, workspace=job_workspace, **kwargs)
+    return wrapper
+
+def workspace_dir(workspace):
+    """
+    Directory for temporary files: the workspace's, or None for the system default
+    """
+    return workspace.path if workspace is not None else None
+
+def check_pcm_container(output_path):
+    """
+    Raise ValueError unless a video output's container can carry PCM audio
+    (the mp4 muxer rejects pcm_s16le)
+    """
+    ext = os.path.splitext(str(output_path))[1].lower()
+    if ext not in PCM_CONTAINERS:
+        raise ValueError(f"pcm_audio needs a .mov or .mkv output, not {ext or 'no extension'}: {output_path}")
+
+def write_videofile(clip, output_path, workspace, pcm_audio=False, **kwargs):
+    """
+    clip.write_videofile with its temporary audio track inside the job workspace
+
+    Args:
+        clip: moviepy VideoClip to export
+        output_path: Output video file path
+        workspace: JobWorkspace of the current job
+        pcm_audio: Hand the audio to the muxer as raw 16-bit PCM and keep it
+                   uncompressed, skipping the AAC encode (use a container that
+                   carries PCM, e.g. .mov or .mkv; good for intermediates that
+                   are remixed later, such as input to combine_audio_video)
+        **kwargs: Passed through to write_videofile
+    """
+    if pcm_audio:
+        check_pcm_container(output_path)
+        kwargs['audio_codec'] = 'pcm_s16le'
+        temp_audiofile = workspace.temp_file(suffix='.wav', prefix='audio_')
+    else:
+        temp_audiofile = workspace.temp_file(suffix='.m4a', prefix='audio_')
+    kwargs.setdefault('remove_temp', True)
+    return clip.write_videofile(str(output_path), temp_audiofile=temp_audiofile, **kwargs)
+
+def write_audiofile(clip, workspace, pcm_audio=False, **kwargs):
+    """
+    Encode an audio clip once into the job workspace, e.g. to mux the same
+    track into several videos (pass the path as write_videofile's `audio`)
+
+    Args:
+        clip: moviepy AudioClip to encode
+        workspace: JobWorkspace of the current job
+        pcm_audio: Write 16-bit PCM WAV instead of AAC
+        **kwargs: Passed through to write_audiofile
+
+    Returns:
+        Path of the encoded audio file
+    """
+    if pcm_audio:
+        kwargs['codec'] = 'pcm_s16le'
+        path = workspace.temp_file(suffix='.wav', prefix='audio_')
+    else:
+        path = workspace.temp_file(suffix='.m4a', prefix='audio_')
+    clip.write_audiofile(path, **kwargs)
+    return path